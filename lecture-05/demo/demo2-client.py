@@ -1,33 +1,40 @@
 #!/usr/bin/env python3
 
 import optparse
-import socket
 import struct
+import sys
 import time
 
-def send_and_receive(ip, port, msg):
-    sock = socket.socket()
-    sock.connect((ip, port))
+from sums_client import (encode_header, encode_payload, PeerClosedError,
+        RequestTimeoutError)
+import sums_client
 
-    sock.sendall(msg)
+def send_and_receive(ip, port, buffers, timeout=2.0):
+    # One deadline covers connect, send, and receive, and the response is
+    # read with recv_into into a preallocated buffer. Header and payload go
+    # out in one scatter-gather send, so large payloads are never copied
+    # into a single message.
+    return bytes(sums_client.send_and_receive((ip, port), buffers, timeout))
 
-    sock.settimeout(2.0)
+def test_sum(ip, port, ints, timeout=2.0):
+    count, payload = encode_payload(ints)
+    header = encode_header(count)
 
-    resp = b""
-    while (len(resp) < 8):
-        resp += sock.recv(8 - len(resp))
-
-    sock.close()
-    return resp
-
-def test_sum(ip, port, ints):
-    msg = b"SUMS"
-    msg += struct.pack("<I", len(ints))
-    for i in ints:
-        msg += struct.pack("<I", i)
-
-    print(f"SENDING: {msg}")
-    resp = send_and_receive(ip, port, msg)
+    if count <= 64:
+        print(f"SENDING: {header + bytes(payload)}")
+    else:
+        print(f"SENDING: {header} followed by {len(payload)} payload bytes")
+    try:
+        resp = send_and_receive(ip, port, [header, payload], timeout)
+    except ConnectionRefusedError as e:
+        print(f"CONNECTION REFUSED: {e}")
+        sys.exit(1)
+    except PeerClosedError as e:
+        print(f"PEER CLOSED: {e}")
+        sys.exit(1)
+    except RequestTimeoutError as e:
+        print(f"TIMEOUT: {e}")
+        sys.exit(1)
     print(f"RECEIVED: {resp}")
 
     if resp[0:4] != b"SUMS":
@@ -43,6 +50,8 @@ if __name__ == "__main__":
             default="169.254.15.2")
     parser.add_option("-p", "--port", dest="port",
             help="TCP port number of service", default="31331")
+    parser.add_option("-t", "--timeout", dest="timeout",
+            help="Seconds allowed for the whole request", default="2.0")
 
     (options, args) = parser.parse_args()
 
@@ -51,5 +60,5 @@ if __name__ == "__main__":
         nums = [1, 2, 3, 4, 5]
     else:
         nums = [int(i) for i in args]
-    test_sum(options.ip, int(options.port), nums)
+    test_sum(options.ip, int(options.port), nums, float(options.timeout))
 
@@ -0,0 +1,576 @@
+#!/usr/bin/env python3
+
+""" Client library for the SUMS service
+
+The service accepts a request consisting of the magic number "SUMS", a
+little-endian uint32 count, and count little-endian uint32 values. It replies
+with "SUMS" followed by the little-endian uint32 sum of the values.
+
+demo2-client.py opens a new connection for every request. The connection pool
+here keeps connections open between requests when the service permits it, and
+otherwise bounds the number of connections in flight at once.
+
+Example usages of this script are:
+
+Send 1000 copies of the request 1 2 3 4 5 over up to 16 connections:
+    ./sums_client.py -n 1000 -c 16 1 2 3 4 5
+"""
+
+import array
+import asyncio
+import concurrent.futures
+import optparse
+import socket
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b"SUMS"
+HEADER = struct.Struct("<4sI")
+RESPONSE_SIZE = 8
+
+# array typecode for a 4-byte unsigned integer on this platform
+UINT32_TYPECODE = "I" if array.array("I").itemsize == 4 else "L"
+
+class PeerClosedError(ConnectionError):
+    """ The service closed the connection before the full response arrived """
+
+class RequestTimeoutError(TimeoutError):
+    """ A request did not complete before its deadline """
+
+class ConnectError(ConnectionError):
+    """ The connection to the service couldn't be made before the deadline """
+
+def remaining(deadline):
+    """ Return the seconds left before deadline, or raise RequestTimeoutError
+
+    Parameters
+    ----------
+    deadline : float or None
+        time.monotonic() value by which the request must complete. None
+        means no deadline.
+
+    Returns
+    -------
+    float, or None if there is no deadline
+    """
+
+    if deadline is None:
+        return None
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise RequestTimeoutError("Request deadline exceeded")
+    return left
+
+def connect(address, deadline=None):
+    """ Open a TCP connection that must be established before deadline
+
+    Parameters
+    ----------
+    address : (ip, port) tuple
+    deadline : float or None, optional
+        time.monotonic() value, as for remaining()
+
+    Returns
+    -------
+    socket.socket
+    """
+
+    try:
+        sock = socket.create_connection(address, timeout=remaining(deadline))
+    except socket.timeout:
+        raise RequestTimeoutError("Timed out connecting") from None
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+def encode_payload(ints):
+    """ Encode the values of a SUMS request as little-endian uint32s
+
+    Objects supporting the buffer protocol that already hold 4-byte unsigned
+    integers in little-endian order, such as array('I') or a NumPy uint32
+    array on a little-endian host, are returned as a view without copying.
+    A bytes-like object of single bytes is taken to be an already encoded
+    payload. Anything else is converted with a single copy.
+
+    Parameters
+    ----------
+    ints : sequence of int or buffer-protocol object
+        Values to sum. Each must fit in a uint32.
+
+    Returns
+    -------
+    (count, memoryview) tuple, where the memoryview holds the encoded
+    payload as bytes
+    """
+
+    try:
+        view = memoryview(ints)
+    except TypeError:
+        view = None
+
+    if view is not None and view.c_contiguous:
+        fmt = view.format
+        if fmt in ("B", "b", "c"):
+            if view.nbytes % 4 != 0:
+                raise ValueError("Encoded payload is not a multiple of 4 bytes")
+            return view.nbytes // 4, view.cast("B")
+        if view.itemsize == 4 and fmt.lstrip("@=<") in ("I", "i", "L", "l"):
+            little = fmt.startswith("<") or sys.byteorder == "little"
+            if little:
+                return view.nbytes // 4, view.cast("B")
+
+    a = array.array(UINT32_TYPECODE, ints)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return len(a), memoryview(a).cast("B")
+
+def encode_header(count):
+    """ Build the 8-byte header of a SUMS request for count values """
+
+    return HEADER.pack(MAGIC, count)
+
+def encode_request(ints):
+    """ Build a complete SUMS request message
+
+    Parameters
+    ----------
+    ints : sequence of int or buffer-protocol object
+        Values to sum, as accepted by encode_payload()
+
+    Returns
+    -------
+    bytestring containing the request
+    """
+
+    count, payload = encode_payload(ints)
+    return b"".join((encode_header(count), payload))
+
+def sendmsg_all(sock, buffers, deadline=None):
+    """ Send a list of buffers with scatter-gather I/O until all are sent
+
+    Parameters
+    ----------
+    sock : socket.socket
+    buffers : list of bytes-like objects
+    deadline : float or None, optional
+        time.monotonic() value by which everything must be sent. None
+        leaves the socket's own timeout in place.
+
+    Returns
+    -------
+    None
+
+    Raises PeerClosedError if the peer resets the connection or closes it
+    for reading.
+    """
+
+    buffers = [memoryview(b).cast("B") for b in buffers]
+    while buffers:
+        if deadline is not None:
+            sock.settimeout(remaining(deadline))
+        try:
+            sent = sock.sendmsg(buffers)
+        except socket.timeout:
+            raise RequestTimeoutError("Timed out sending request") from None
+        except (ConnectionResetError, BrokenPipeError) as e:
+            raise PeerClosedError(f"Connection closed while sending: "
+                    f"{e.strerror}") from None
+        # Drop whatever was fully sent and trim a partially sent buffer
+        while buffers and sent >= len(buffers[0]):
+            sent -= len(buffers[0])
+            buffers.pop(0)
+        if buffers and sent:
+            buffers[0] = buffers[0][sent:]
+
+def send_request(sock, ints, deadline=None):
+    """ Send a SUMS request without joining header and payload
+
+    Parameters
+    ----------
+    sock : socket.socket
+    ints : sequence of int or buffer-protocol object
+        Values to sum, as accepted by encode_payload()
+    deadline : float or None, optional
+        time.monotonic() value, as for sendmsg_all()
+
+    Returns
+    -------
+    None
+    """
+
+    count, payload = encode_payload(ints)
+    sendmsg_all(sock, [encode_header(count), payload], deadline)
+
+def decode_response(resp):
+    """ Extract the sum from a SUMS response
+
+    Parameters
+    ----------
+    resp : bytestring
+        8-byte response from the service
+
+    Returns
+    -------
+    int
+    """
+
+    if len(resp) != RESPONSE_SIZE:
+        raise ValueError(f"Short response: {resp}")
+    if resp[0:4] != MAGIC:
+        raise ValueError(f"Magic number in response: {resp}")
+    return struct.unpack("<I", resp[4:8])[0]
+
+def recv_exactly(sock, n, deadline=None, buf=None):
+    """ Receive exactly n bytes from sock into a preallocated buffer
+
+    Parameters
+    ----------
+    sock : socket.socket
+    n : int
+        Number of bytes to receive
+    deadline : float or None, optional
+        time.monotonic() value by which all n bytes must arrive. None leaves
+        the socket's own timeout in place.
+    buf : bytearray, optional
+        Buffer of at least n bytes to receive into. A new one is allocated
+        if not given.
+
+    Returns
+    -------
+    buffer holding the n received bytes
+
+    Raises PeerClosedError if the peer closes or resets the connection
+    first and RequestTimeoutError if the deadline passes first.
+    """
+
+    if buf is None:
+        buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        if deadline is not None:
+            sock.settimeout(remaining(deadline))
+        try:
+            r = sock.recv_into(view[got:n])
+        except socket.timeout:
+            raise RequestTimeoutError(
+                    f"Timed out after receiving {got} of {n} bytes") from None
+        except ConnectionResetError:
+            raise PeerClosedError(
+                    f"Connection reset after {got} of {n} bytes") from None
+        if r == 0:
+            raise PeerClosedError(
+                    f"Connection closed after {got} of {n} bytes")
+        got += r
+    return buf
+
+def send_and_receive(address, buffers, timeout=2.0):
+    """ Perform one request on a new connection under a single deadline
+
+    The deadline covers connecting, sending, and receiving the response, so
+    no step can block past it.
+
+    Parameters
+    ----------
+    address : (ip, port) tuple
+    buffers : list of bytes-like objects
+        Request message, as for sendmsg_all()
+    timeout : float, optional
+        Seconds allowed for the whole request (defaults to 2.0)
+
+    Returns
+    -------
+    bytearray containing the response
+
+    Raises PeerClosedError if the service closes the connection early and
+    RequestTimeoutError if the request doesn't complete in time.
+    """
+
+    deadline = time.monotonic() + timeout
+    sock = connect(address, deadline)
+    try:
+        sendmsg_all(sock, buffers, deadline)
+        return recv_exactly(sock, RESPONSE_SIZE, deadline)
+    finally:
+        sock.close()
+
+async def exchange(host, port, buffers, timeout):
+    """ asyncio counterpart of send_and_receive()
+
+    Connects, sends buffers, and reads one response under a single
+    deadline, so that a service that stops reading can't stall the write
+    either.
+
+    Parameters
+    ----------
+    host : string
+    port : int
+    buffers : list of bytes-like objects
+        Request message
+    timeout : float
+        Seconds allowed for the whole request
+
+    Returns
+    -------
+    bytes containing the response
+
+    Raises ConnectError if connecting fails or runs out of time,
+    RequestTimeoutError if the request doesn't complete in time after
+    connecting, and asyncio.IncompleteReadError or OSError if the
+    connection fails after it is made.
+    """
+
+    writer = None
+
+    async def run():
+        nonlocal writer
+        try:
+            reader, writer = await asyncio.open_connection(host, port)
+        except OSError as e:
+            raise ConnectError(f"Couldn't connect: {e}") from e
+        writer.writelines(buffers)
+        await writer.drain()
+        return await reader.readexactly(RESPONSE_SIZE)
+
+    try:
+        return await asyncio.wait_for(run(), timeout)
+    except asyncio.TimeoutError:
+        if writer is None:
+            raise ConnectError("Timed out connecting") from None
+        raise RequestTimeoutError("Request deadline exceeded") from None
+    finally:
+        if writer is not None:
+            writer.close()
+
+def peer_closed(sock):
+    """ Check without blocking whether the peer has closed an idle socket """
+
+    # A socket with a timeout waits for data even with MSG_DONTWAIT, so
+    # switch to non-blocking mode for the check
+    timeout = sock.gettimeout()
+    sock.setblocking(False)
+    try:
+        return sock.recv(1, socket.MSG_PEEK) == b""
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True
+    finally:
+        sock.settimeout(timeout)
+
+class SumsConnectionPool:
+    """ Pool of connections to a SUMS service
+
+    Parameters
+    ----------
+    ip : string
+        IP address of the service
+    port : int
+        TCP port of the service
+    size : int, optional
+        Maximum number of connections open at once (defaults to 8)
+    timeout : float, optional
+        Time allowed for each request in seconds, covering connect, send,
+        and receive (defaults to 2.0)
+    persistent : bool or None, optional
+        Whether the service handles more than one request per connection.
+        None (the default) detects this from the first reused connection.
+    """
+
+    def __init__(self, ip, port, size=8, timeout=2.0, persistent=None):
+        self.address = (ip, port)
+        self.size = size
+        self.timeout = timeout
+        self.persistent = persistent
+        self.connects = 0
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self, deadline):
+        sock = connect(self.address, deadline)
+        with self._lock:
+            self.connects += 1
+        return sock
+
+    def _acquire(self, deadline):
+        """ Return (socket, reused) for the next request """
+
+        with self._lock:
+            while self._idle:
+                sock = self._idle.pop()
+                if not peer_closed(sock):
+                    return sock, True
+                # The service closed it after the previous response
+                sock.close()
+                if self.persistent is None:
+                    self.persistent = False
+        return self._connect(deadline), False
+
+    def _release(self, sock):
+        if self.persistent is False:
+            sock.close()
+            return
+        with self._lock:
+            self._idle.append(sock)
+
+    def request(self, ints):
+        """ Send one SUMS request and return the sum
+
+        Parameters
+        ----------
+        ints : sequence of int or buffer-protocol object
+            Values to sum, as accepted by encode_payload()
+
+        Returns
+        -------
+        int
+
+        Raises PeerClosedError if the service closes the connection early and
+        RequestTimeoutError if the request doesn't complete in time.
+        """
+
+        count, payload = encode_payload(ints)
+        buffers = [encode_header(count), payload]
+        resp = bytearray(RESPONSE_SIZE)
+        with self._slots:
+            # One deadline covers connecting, sending, and receiving,
+            # including a retry on a fresh connection
+            deadline = time.monotonic() + self.timeout
+            sock, reused = self._acquire(deadline)
+            try:
+                sendmsg_all(sock, buffers, deadline)
+                recv_exactly(sock, RESPONSE_SIZE, deadline, resp)
+            except ConnectionError:
+                sock.close()
+                if not reused:
+                    raise
+                # A reused connection that fails was most likely closed by
+                # the service, so it doesn't keep connections alive. Retry
+                # once on a fresh connection.
+                if self.persistent is None:
+                    self.persistent = False
+                sock = self._connect(deadline)
+                try:
+                    sendmsg_all(sock, buffers, deadline)
+                    recv_exactly(sock, RESPONSE_SIZE, deadline, resp)
+                except Exception:
+                    sock.close()
+                    raise
+            except Exception:
+                sock.close()
+                raise
+            else:
+                if reused and self.persistent is None:
+                    self.persistent = True
+            self._release(sock)
+        return decode_response(resp)
+
+    def submit_many(self, requests, return_exceptions=False):
+        """ Send many SUMS requests concurrently
+
+        Results are yielded as they complete, which is not necessarily the
+        order of requests. At most 'size' requests are in flight at once.
+
+        Parameters
+        ----------
+        requests : iterable of sequences of int or buffer-protocol objects
+        return_exceptions : bool, optional
+            If True, a failed request yields its exception in place of the
+            sum instead of raising it (defaults to False)
+
+        Returns
+        -------
+        generator of (index, sum) tuples, where index is the position of the
+        request in requests
+        """
+
+        with concurrent.futures.ThreadPoolExecutor(self.size) as executor:
+            pending = {}
+            it = enumerate(requests)
+            exhausted = False
+            while True:
+                # Keep the executor busy without materializing every
+                # request up front
+                while not exhausted and len(pending) < 2*self.size:
+                    try:
+                        index, ints = next(it)
+                    except StopIteration:
+                        exhausted = True
+                        break
+                    pending[executor.submit(self.request, ints)] = index
+                if not pending:
+                    return
+                done, _ = concurrent.futures.wait(pending,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    try:
+                        yield index, future.result()
+                    except Exception as e:
+                        if not return_exceptions:
+                            for f in pending:
+                                f.cancel()
+                            raise
+                        yield index, e
+
+    def close(self):
+        """ Close all idle connections """
+
+        with self._lock:
+            for sock in self._idle:
+                sock.close()
+            self._idle = []
+
+if __name__ == "__main__":
+    parser = optparse.OptionParser(usage="%prog [options] [ints ...]")
+    parser.add_option("-i", "--ip", dest="ip", help="IP address of target",
+            default="169.254.15.2")
+    parser.add_option("-p", "--port", dest="port",
+            help="TCP port number of service", default="31331")
+    parser.add_option("-n", "--requests", dest="requests",
+            help="Number of requests to send", default="1000")
+    parser.add_option("-c", "--connections", dest="connections",
+            help="Maximum number of connections", default="8")
+
+    (options, args) = parser.parse_args()
+
+    if len(args) == 0:
+        nums = [1, 2, 3, 4, 5]
+    else:
+        nums = [int(i) for i in args]
+    expected = sum(nums) & 0xffffffff
+
+    n = int(options.requests)
+    errors = 0
+    closed = 0
+    timeouts = 0
+    wrong = 0
+    t_start = time.time()
+    with SumsConnectionPool(options.ip, int(options.port),
+            size=int(options.connections)) as pool:
+        for index, result in pool.submit_many(
+                (nums for _ in range(n)), return_exceptions=True):
+            if isinstance(result, PeerClosedError):
+                closed += 1
+            elif isinstance(result, RequestTimeoutError):
+                timeouts += 1
+            elif isinstance(result, Exception):
+                errors += 1
+            elif result != expected:
+                wrong += 1
+    delta_t = time.time() - t_start
+
+    print(f"{n} requests in {delta_t} seconds")
+    print(f"{n/delta_t} requests/s")
+    print(f"{pool.connects} connections opened "
+            f"(persistent connections: {pool.persistent})")
+    print(f"{closed} closed early, {timeouts} timeouts, {errors} other "
+            f"errors, {wrong} wrong answers")
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+""" Concurrent network fuzzer for the SUMS service
+
+Generates SUMS protocol messages, most of them malformed, and sends them to
+the service over many concurrent connections. Each message gets one of the
+following mutations:
+    valid       well-formed request
+    magic       corrupted magic number
+    short       count larger than the payload that follows
+    long        count smaller than the payload that follows
+    huge        count near 2**32 with a small payload
+    truncated   frame cut off part way through, including in the header
+    oversized   well-formed request with a very large payload
+    random      random bytes
+
+Connection resets and timeouts are counted, but many malformed inputs should
+cause them without anything being wrong. A crash is declared when a liveness
+probe (a valid request on a fresh connection) fails twice in a row. All inputs
+sent since the last passing probe are then written to the crash directory,
+because with concurrent connections any of them may be responsible.
+
+Example usages of this script are:
+
+Fuzz the emulated target with 64 connections until it stops answering:
+    ./sums_fuzzer.py -c 64 --stop-on-crash
+
+Fuzz a local server for a minute, waiting up to 30 s for restarts:
+    ./sums_fuzzer.py -i 127.0.0.1 -d 60 --restart-wait 30
+"""
+
+import argparse
+import asyncio
+import collections
+import os
+import random
+import struct
+import time
+
+from sums_client import (MAGIC, ConnectError, RequestTimeoutError,
+        encode_request, decode_response, exchange)
+
+MUTATIONS = ("valid", "magic", "short", "long", "huge", "truncated",
+        "oversized", "random")
+
+def random_ints(rng, n):
+    return [rng.getrandbits(32) for _ in range(n)]
+
+def generate(rng, max_count):
+    """ Generate one fuzz case
+
+    Parameters
+    ----------
+    rng : random.Random
+    max_count : int
+        Largest number of values in a normally sized request
+
+    Returns
+    -------
+    (mutation, bytestring) tuple
+    """
+
+    mutation = rng.choice(MUTATIONS)
+    n = rng.randint(0, max_count)
+    if mutation == "valid":
+        msg = encode_request(random_ints(rng, n))
+    elif mutation == "magic":
+        msg = bytearray(encode_request(random_ints(rng, n)))
+        msg[rng.randrange(4)] ^= 1 << rng.randrange(8)
+        msg = bytes(msg)
+    elif mutation == "short":
+        extra = rng.choice((1, 2, 16, 1024, rng.randint(1, 1 << 16)))
+        msg = MAGIC + struct.pack("<I", n + extra) \
+                + struct.pack(f"<{n}I", *random_ints(rng, n))
+    elif mutation == "long":
+        extra = rng.randint(1, max_count)
+        msg = MAGIC + struct.pack("<I", n) \
+                + struct.pack(f"<{n + extra}I", *random_ints(rng, n + extra))
+    elif mutation == "huge":
+        count = rng.choice((0xffffffff, 0x80000000, 0x40000000, 0x3fffffff,
+            0x7fffffff, 0x10000000 + rng.getrandbits(28)))
+        msg = MAGIC + struct.pack("<I", count) \
+                + struct.pack(f"<{n}I", *random_ints(rng, n))
+    elif mutation == "truncated":
+        full = encode_request(random_ints(rng, n))
+        msg = full[:rng.randrange(len(full))]
+    elif mutation == "oversized":
+        count = rng.choice((1 << 16, 1 << 18, 1 << 20))
+        msg = MAGIC + struct.pack("<I", count) + rng.randbytes(4*count)
+    else:
+        msg = rng.randbytes(rng.randint(1, 8 + 4*max_count))
+    return mutation, msg
+
+class Campaign:
+    """ State shared by the fuzzing and probing tasks """
+
+    def __init__(self, args):
+        self.args = args
+        self.outcomes = collections.Counter()
+        self.mutations = collections.Counter()
+        self.cases = 0
+        self.crashes = 0
+        # Inputs sent since the last passing liveness probe
+        self.suspects = []
+        self.running = None
+        self.stop = False
+        self.t_start = time.monotonic()
+
+async def send_case(args, msg):
+    """ Send one message on a new connection and classify what happens
+
+    Returns
+    -------
+    One of 'reply', 'wrong', 'closed', 'reset', 'timeout', 'refused'
+    """
+
+    try:
+        resp = await exchange(args.ip, args.port, (msg,), args.timeout)
+    except ConnectError:
+        return "refused"
+    except RequestTimeoutError:
+        return "timeout"
+    except asyncio.IncompleteReadError:
+        return "closed"
+    except ConnectionResetError:
+        return "reset"
+    except OSError:
+        return "closed"
+    try:
+        decode_response(resp)
+    except ValueError:
+        return "wrong"
+    return "reply"
+
+async def probe(args):
+    """ Liveness probe: a valid request that must get the right answer """
+
+    ints = [1, 2, 3, 4, 5]
+    try:
+        resp = await exchange(args.ip, args.port, (encode_request(ints),),
+                args.timeout)
+        return decode_response(resp) == sum(ints)
+    except (OSError, ValueError, asyncio.IncompleteReadError):
+        return False
+
+def save_crash(campaign):
+    args = campaign.args
+    campaign.crashes += 1
+    os.makedirs(args.output, exist_ok=True)
+    prefix = os.path.join(args.output, f"crash-{campaign.crashes:04d}")
+    with open(prefix + ".log", "w") as log:
+        log.write(f"Liveness probe failed at {time.ctime()}\n")
+        log.write(f"{len(campaign.suspects)} inputs sent since the last "
+                "passing probe, oldest first:\n")
+        for i, (mutation, outcome, msg) in enumerate(campaign.suspects):
+            name = f"{prefix}-{i:05d}.bin"
+            with open(name, "wb") as f:
+                f.write(msg)
+            log.write(f"{os.path.basename(name)} {mutation} {outcome} "
+                    f"{len(msg)} bytes {msg[:64].hex()}\n")
+    print(f"CRASH: service stopped responding; {len(campaign.suspects)} "
+            f"suspect inputs saved with prefix {prefix}")
+
+async def prober(campaign, deadline):
+    args = campaign.args
+    while not campaign.stop and time.monotonic() < deadline:
+        await asyncio.sleep(args.probe_interval)
+        if await probe(args):
+            campaign.suspects = []
+            continue
+        # Confirm with a second probe before calling it a crash
+        campaign.running.clear()
+        if await probe(args):
+            campaign.running.set()
+            continue
+        save_crash(campaign)
+        campaign.suspects = []
+        if args.stop_on_crash:
+            campaign.stop = True
+            break
+        # Wait for the service to be restarted
+        restart_deadline = time.monotonic() + args.restart_wait
+        while time.monotonic() < restart_deadline:
+            if await probe(args):
+                break
+            await asyncio.sleep(0.5)
+        else:
+            print("Service did not come back; stopping")
+            campaign.stop = True
+            break
+        campaign.running.set()
+    campaign.running.set()
+
+async def worker(campaign, deadline, seed):
+    args = campaign.args
+    rng = random.Random(seed)
+    while not campaign.stop and time.monotonic() < deadline:
+        await campaign.running.wait()
+        if campaign.stop:
+            break
+        mutation, msg = generate(rng, args.max_count)
+        outcome = await send_case(args, msg)
+        campaign.cases += 1
+        campaign.mutations[mutation] += 1
+        campaign.outcomes[outcome] += 1
+        if outcome != "refused":
+            # Inputs that never reached the service can't be responsible
+            campaign.suspects.append((mutation, outcome, msg))
+
+async def run(campaign):
+    args = campaign.args
+    campaign.running = asyncio.Event()
+    campaign.running.set()
+    deadline = time.monotonic() + args.duration if args.duration \
+            else float("inf")
+    if not await probe(args):
+        print("Service is not responding to a valid request")
+        return
+    campaign.t_start = time.monotonic()
+    await asyncio.gather(prober(campaign, deadline),
+            *(worker(campaign, deadline, args.seed + i)
+                for i in range(args.concurrency)))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fuzz a SUMS service')
+    parser.add_argument('-i', '--ip', default='169.254.15.2', type=str,
+            help='IP address of target')
+    parser.add_argument('-p', '--port', default=31331, type=int,
+            help='TCP port number of service')
+    parser.add_argument('-c', '--concurrency', default=32, type=int,
+            help='Number of concurrent connections')
+    parser.add_argument('-d', '--duration', default=0, type=float,
+            help='Length of the run in seconds (0 = until stopped)')
+    parser.add_argument('--timeout', default=1.0, type=float,
+            help='Deadline for connecting, sending, and reading the '
+            'response of each case')
+    parser.add_argument('--max-count', default=64, type=int,
+            help='Largest number of values in a normally sized request')
+    parser.add_argument('--probe-interval', default=1.0, type=float,
+            help='Seconds between liveness probes')
+    parser.add_argument('--restart-wait', default=0, type=float,
+            help='Seconds to wait for the service to come back after a crash')
+    parser.add_argument('--stop-on-crash', action='store_true',
+            help='Stop at the first crash')
+    parser.add_argument('-o', '--output', default='crashes', type=str,
+            help='Directory for crashing inputs')
+    parser.add_argument('--seed', default=None, type=int,
+            help='Seed for case generation (defaults to random)')
+    args = parser.parse_args()
+    if args.seed is None:
+        args.seed = random.getrandbits(32)
+    print(f"Using seed {args.seed}")
+
+    campaign = Campaign(args)
+    try:
+        asyncio.run(run(campaign))
+    except KeyboardInterrupt:
+        pass
+    delta_t = time.monotonic() - campaign.t_start
+
+    print("==============================================")
+    print(f"{campaign.cases} cases in {delta_t:.2f} seconds")
+    if delta_t > 0:
+        print(f"{campaign.cases/delta_t:.1f} cases/s")
+    print("mutations: " + ", ".join(f"{k}={v}" for k, v in
+        sorted(campaign.mutations.items())))
+    print("outcomes: " + ", ".join(f"{k}={v}" for k, v in
+        sorted(campaign.outcomes.items())))
+    print(f"{campaign.crashes} crashes")
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+""" asyncio load generator for the SUMS service
+
+Runs a fixed number of concurrent clients against the service for a set
+duration, optionally limited to a total request rate. Every response is
+checked against the uint32 sum computed locally.
+
+Payload sizes are drawn from one of the following distributions, with the
+number of values per request given by --size:
+    fixed       always --size values
+    uniform     uniformly between 1 and --size values
+    exponential exponentially distributed with mean --size values
+
+Example usages of this script are:
+
+Run 64 concurrent clients for 30 seconds:
+    ./sums_loadgen.py -c 64 -d 30
+
+Hold 500 requests/s of uniformly sized requests of up to 1000 values:
+    ./sums_loadgen.py -c 32 -r 500 --size 1000 --distribution uniform
+"""
+
+import argparse
+import array
+import asyncio
+import random
+import time
+
+from sums_client import (ConnectError, RequestTimeoutError, encode_header,
+        encode_payload, decode_response, exchange, UINT32_TYPECODE)
+
+class Stats:
+    """ Counters shared by all clients of a load run """
+
+    def __init__(self):
+        self.latencies = []
+        self.ok = 0
+        self.wrong = 0
+        self.connect_errors = 0
+        self.errors = 0
+        self.timeouts = 0
+
+def payload_size(args, rng):
+    """ Draw the number of values for one request """
+
+    if args.distribution == "fixed":
+        return args.size
+    if args.distribution == "uniform":
+        return rng.randint(1, args.size)
+    return max(1, int(rng.expovariate(1.0 / args.size)))
+
+def percentile(sorted_values, p):
+    """ Nearest-rank percentile of an already sorted list """
+
+    if not sorted_values:
+        return float("nan")
+    k = max(0, min(len(sorted_values) - 1,
+        int(round(p / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+class RateLimiter:
+    """ Hands out evenly spaced send times for a total request rate """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.next_time = time.monotonic()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        # Claim the next slot before sleeping so concurrent clients
+        # don't all take the same one
+        slot = max(self.next_time, now)
+        self.next_time = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+async def one_request(args, stats, ints):
+    """ Perform a single request on a new connection """
+
+    expected = sum(ints) & 0xffffffff
+    count, payload = encode_payload(ints)
+    header = encode_header(count)
+    t_start = time.perf_counter()
+    try:
+        resp = await exchange(args.ip, args.port, (header, payload),
+                args.timeout)
+    except ConnectError:
+        stats.connect_errors += 1
+        return
+    except RequestTimeoutError:
+        stats.timeouts += 1
+        return
+    except (OSError, asyncio.IncompleteReadError):
+        stats.errors += 1
+        return
+    stats.latencies.append(time.perf_counter() - t_start)
+
+    try:
+        result = decode_response(resp)
+    except ValueError:
+        stats.wrong += 1
+        return
+    if result == expected:
+        stats.ok += 1
+    else:
+        stats.wrong += 1
+
+async def client(args, stats, limiter, deadline, seed):
+    rng = random.Random(seed)
+    while time.monotonic() < deadline:
+        await limiter.wait()
+        if time.monotonic() >= deadline:
+            break
+        n = payload_size(args, rng)
+        ints = array.array(UINT32_TYPECODE,
+                (rng.getrandbits(32) for _ in range(n)))
+        await one_request(args, stats, ints)
+
+async def run(args):
+    stats = Stats()
+    limiter = RateLimiter(args.rate)
+    t_start = time.monotonic()
+    deadline = t_start + args.duration
+    await asyncio.gather(*(client(args, stats, limiter, deadline,
+        args.seed + i) for i in range(args.concurrency)))
+    return stats, time.monotonic() - t_start
+
+def report(stats, delta_t):
+    completed = stats.ok + stats.wrong
+    lat = sorted(stats.latencies)
+    print("==============================================")
+    print(f"{completed} responses in {delta_t:.2f} seconds")
+    print(f"{completed/delta_t:.1f} requests/s")
+    if lat:
+        print("latency (ms): " + ", ".join(f"p{p}={percentile(lat, p)*1000:.2f}"
+            for p in (50, 90, 99, 99.9)) + f", max={lat[-1]*1000:.2f}")
+    print(f"{stats.ok} correct, {stats.wrong} wrong answers")
+    print(f"{stats.connect_errors} connection errors, {stats.errors} "
+            f"other errors, {stats.timeouts} timeouts")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load test a SUMS service')
+    parser.add_argument('-i', '--ip', default='169.254.15.2', type=str,
+            help='IP address of target')
+    parser.add_argument('-p', '--port', default=31331, type=int,
+            help='TCP port number of service')
+    parser.add_argument('-c', '--concurrency', default=16, type=int,
+            help='Number of concurrent clients')
+    parser.add_argument('-r', '--rate', default=0, type=float,
+            help='Total requests/s across all clients (0 = unlimited)')
+    parser.add_argument('-d', '--duration', default=10, type=float,
+            help='Length of the run in seconds')
+    parser.add_argument('--size', default=5, type=int,
+            help='Number of values per request (see --distribution)')
+    parser.add_argument('--distribution', default='fixed',
+            choices=['fixed', 'uniform', 'exponential'],
+            help='Distribution of the number of values per request')
+    parser.add_argument('--timeout', default=2.0, type=float,
+            help='Deadline for connecting, sending, and reading the '
+            'response of each request')
+    parser.add_argument('--seed', default=0, type=int,
+            help='Seed for the generated payloads')
+    args = parser.parse_args()
+
+    stats, delta_t = asyncio.run(run(args))
+    report(stats, delta_t)
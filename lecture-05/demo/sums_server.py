@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+
+""" Local reference implementation of the SUMS service
+
+Speaks the same protocol as the service on the emulated target, so that the
+clients in this directory can be developed and benchmarked without the QEMU
+tap network: a request of "SUMS", a little-endian uint32 count, and count
+little-endian uint32 values is answered with "SUMS" and the little-endian
+uint32 sum of the values. A request with a bad magic number or a count above
+--max-count gets the connection closed without a reply.
+
+Three back ends are available:
+    threaded      one thread per connection
+    asyncio       a single event loop
+    multiprocess  pre-forked worker processes sharing the listening socket,
+                  each serving one connection at a time
+
+Faults can be injected with a given probability per request:
+    --drop     close the connection without replying
+    --reset    abort the connection with a TCP RST
+    --stall    never reply, but keep the connection open
+    --corrupt  reply with a wrong sum
+
+Example usages of this script are:
+
+Serve on the default port with the asyncio back end:
+    ./sums_server.py
+
+Pre-fork 8 workers, add 5 ms of latency and drop 1% of requests:
+    ./sums_server.py -b multiprocess -w 8 --latency 0.005 --drop 0.01
+"""
+
+import argparse
+import array
+import asyncio
+import itertools
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import socketserver
+import struct
+import sys
+import time
+
+from sums_client import HEADER, MAGIC, UINT32_TYPECODE
+
+class FaultInjector:
+    """ Decides what, if anything, goes wrong with each request
+
+    Parameters
+    ----------
+    options : argparse.Namespace
+        Parsed command-line options
+    seed : int or None, optional
+        Seed for the fault and latency random number generator
+    """
+
+    def __init__(self, options, seed=None):
+        self.options = options
+        self.rng = random.Random(seed)
+
+    def fault(self):
+        """ Return 'drop', 'reset', 'stall', 'corrupt', or None """
+
+        r = self.rng.random()
+        for name in ("drop", "reset", "stall", "corrupt"):
+            p = getattr(self.options, name)
+            if r < p:
+                return name
+            r -= p
+        return None
+
+    def delay(self):
+        """ Return the artificial latency for one reply in seconds """
+
+        if not self.options.latency and not self.options.jitter:
+            return 0.0
+        return max(0.0, self.options.latency
+                + self.rng.uniform(-self.options.jitter, self.options.jitter))
+
+def parse_header(header, options):
+    """ Return the value count of a request, or None to close the connection """
+
+    magic, count = HEADER.unpack(header)
+    if magic != MAGIC or count > options.max_count:
+        return None
+    return count
+
+def reply(payload, corrupt=False):
+    """ Build the response to a request with the given payload bytes """
+
+    a = array.array(UINT32_TYPECODE)
+    a.frombytes(payload)
+    if sys.byteorder != "little":
+        a.byteswap()
+    total = sum(a) & 0xffffffff
+    if corrupt:
+        total ^= 1
+    return MAGIC + struct.pack("<I", total)
+
+def recv_exactly(sock, n):
+    """ Receive n bytes, or return None if the peer closes first """
+
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = sock.recv_into(view[got:])
+        if r == 0:
+            return None
+        got += r
+    return buf
+
+def abort(sock):
+    """ Close sock with a RST instead of a FIN """
+
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER,
+            struct.pack("ii", 1, 0))
+    sock.close()
+
+def handle_connection(sock, options, faults):
+    """ Serve requests on a connected socket until it should be closed """
+
+    while True:
+        header = recv_exactly(sock, HEADER.size)
+        if header is None:
+            return
+        count = parse_header(header, options)
+        if count is None:
+            return
+        payload = recv_exactly(sock, 4*count)
+        if payload is None:
+            return
+
+        fault = faults.fault()
+        if fault == "drop":
+            return
+        if fault == "reset":
+            abort(sock)
+            return
+        if fault == "stall":
+            # Hold the connection until the client gives up
+            while sock.recv(4096):
+                pass
+            return
+        delay = faults.delay()
+        if delay:
+            time.sleep(delay)
+        sock.sendall(reply(payload, corrupt=(fault == "corrupt")))
+        if not options.keepalive:
+            return
+
+def serve_threaded(options):
+    connections = itertools.count()
+
+    class Handler(socketserver.BaseRequestHandler):
+        def handle(self):
+            # Each connection gets its own generator, as random.Random isn't
+            # shared safely between threads, seeded with the seed plus the
+            # connection's number so that a seeded run is repeatable
+            n = next(connections)
+            seed = None if options.seed is None else options.seed + n
+            try:
+                handle_connection(self.request, options,
+                        FaultInjector(options, seed))
+            except OSError:
+                pass
+
+    class Server(socketserver.ThreadingTCPServer):
+        allow_reuse_address = True
+        daemon_threads = True
+        request_queue_size = options.backlog
+
+    with Server((options.ip, options.port), Handler) as server:
+        server.serve_forever()
+
+async def handle_stream(reader, writer, options, faults):
+    try:
+        while True:
+            try:
+                header = await reader.readexactly(HEADER.size)
+                count = parse_header(header, options)
+                if count is None:
+                    return
+                payload = await reader.readexactly(4*count)
+            except asyncio.IncompleteReadError:
+                return
+
+            fault = faults.fault()
+            if fault == "drop":
+                return
+            if fault == "reset":
+                writer.transport.abort()
+                return
+            if fault == "stall":
+                while await reader.read(4096):
+                    pass
+                return
+            delay = faults.delay()
+            if delay:
+                await asyncio.sleep(delay)
+            writer.write(reply(payload, corrupt=(fault == "corrupt")))
+            await writer.drain()
+            if not options.keepalive:
+                return
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
+
+async def serve_asyncio_main(options):
+    faults = FaultInjector(options, options.seed)
+    server = await asyncio.start_server(
+            lambda r, w: handle_stream(r, w, options, faults),
+            options.ip, options.port, backlog=options.backlog,
+            reuse_address=True)
+    async with server:
+        await server.serve_forever()
+
+def serve_asyncio(options):
+    asyncio.run(serve_asyncio_main(options))
+
+def prefork_worker(listener, options, worker_id):
+    seed = None if options.seed is None else options.seed + worker_id
+    faults = FaultInjector(options, seed)
+    while True:
+        sock, _ = listener.accept()
+        try:
+            handle_connection(sock, options, faults)
+        except OSError:
+            pass
+        finally:
+            sock.close()
+
+def serve_multiprocess(options):
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((options.ip, options.port))
+    listener.listen(options.backlog)
+
+    # Workers inherit the listening socket through fork and all block in
+    # accept() on it
+    ctx = multiprocessing.get_context("fork")
+    workers = [ctx.Process(target=prefork_worker,
+        args=(listener, options, i), daemon=True)
+        for i in range(options.workers)]
+    for w in workers:
+        w.start()
+
+    # Make SIGTERM unwind through the finally clause below, so that killing
+    # the parent doesn't leave orphaned workers holding the port
+    def terminate(signum, frame):
+        raise SystemExit(0)
+    signal.signal(signal.SIGTERM, terminate)
+
+    try:
+        for w in workers:
+            w.join()
+    finally:
+        for w in workers:
+            w.terminate()
+
+BACKENDS = {
+    "threaded": serve_threaded,
+    "asyncio": serve_asyncio,
+    "multiprocess": serve_multiprocess,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Local SUMS service')
+    parser.add_argument('-i', '--ip', default='127.0.0.1', type=str,
+            help='IP address to listen on')
+    parser.add_argument('-p', '--port', default=31331, type=int,
+            help='TCP port number to listen on')
+    parser.add_argument('-b', '--backend', default='asyncio',
+            choices=sorted(BACKENDS), help='Server implementation')
+    parser.add_argument('-w', '--workers', default=os.cpu_count(), type=int,
+            help='Number of processes for the multiprocess back end')
+    parser.add_argument('--backlog', default=128, type=int,
+            help='Listen backlog')
+    parser.add_argument('--keepalive', action='store_true',
+            help='Serve more than one request per connection')
+    parser.add_argument('--max-count', default=1 << 24, type=int,
+            help='Largest value count accepted in a request')
+    parser.add_argument('--latency', default=0.0, type=float,
+            help='Artificial delay before each reply in seconds')
+    parser.add_argument('--jitter', default=0.0, type=float,
+            help='Uniform random variation added to --latency')
+    parser.add_argument('--drop', default=0.0, type=float,
+            help='Probability of closing without a reply')
+    parser.add_argument('--reset', default=0.0, type=float,
+            help='Probability of resetting the connection')
+    parser.add_argument('--stall', default=0.0, type=float,
+            help='Probability of never replying')
+    parser.add_argument('--corrupt', default=0.0, type=float,
+            help='Probability of replying with a wrong sum')
+    parser.add_argument('--seed', default=None, type=int,
+            help='Seed for latency and fault injection')
+    options = parser.parse_args()
+
+    print(f"Serving SUMS on {options.ip}:{options.port} "
+            f"with the {options.backend} back end")
+    try:
+        BACKENDS[options.backend](options)
+    except KeyboardInterrupt:
+        pass
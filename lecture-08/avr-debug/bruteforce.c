@@ -0,0 +1,298 @@
+/*
+ * Fork-server for brute forcing ATmega328p password prompts under simavr
+ *
+ * The firmware is loaded and run exactly as in emulate.c, but with UART0
+ * captured in memory. Once the firmware has printed its password prompt and
+ * settled into waiting for input, the whole emulator process serves as a
+ * snapshot: for every candidate read from stdin (one per line) we fork(), and
+ * the child feeds the candidate to UART0 and runs until the firmware prints
+ * its response. Copy-on-write means that each child starts from an identical
+ * copy of the CPU registers, SRAM, and peripheral state, without re-running
+ * the boot and prompt for every attempt.
+ *
+ * For each candidate, one line is written to stdout:
+ *   S candidate   response began with the success string
+ *   F candidate   any other response
+ *   T candidate   no response within the cycle budget
+ *   C candidate   the emulated CPU crashed
+ *
+ * Options:
+ *   -p prompt     Text that ends the prompt (defaults to "password:")
+ *   -s success    Prefix of the success response (defaults to "SUCCESS")
+ *   -c cycles     Cycle budget per candidate (defaults to 2000000)
+ *
+ * bruteforce.py runs a pool of these across all cores.
+ *
+ * Compile with gcc -O2 -o bruteforce bruteforce.c -lsimavr
+ * Depending on the compiled library version, may need to
+ * compile with gcc -O2 -o bruteforce bruteforce.c -lsimavr -lelf
+ */
+
+#define _DEFAULT_SOURCE
+
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#include <simavr/sim_avr.h>
+#include <simavr/avr_uart.h>
+
+// Cycles to keep running after the prompt so the firmware reaches its
+// receive loop before we snapshot
+#define SETTLE_CYCLES 20000
+// Cycle budget for reaching the prompt after reset
+#define BOOT_CYCLES 50000000
+
+#define OUTPUT_SIZE 256
+
+struct uart_state {
+	char output[OUTPUT_SIZE];
+	int output_len;
+	int xon;
+	avr_irq_t * input_irq;
+};
+
+static struct uart_state uart;
+
+static void uart_output_hook(struct avr_irq_t * irq, uint32_t value,
+                             void * param)
+{
+	// Only the most recent OUTPUT_SIZE bytes matter for matching
+	if (uart.output_len == OUTPUT_SIZE - 1) {
+		memmove(uart.output, uart.output + 1, OUTPUT_SIZE - 2);
+		uart.output_len--;
+	}
+	uart.output[uart.output_len++] = value;
+	uart.output[uart.output_len] = '\0';
+}
+
+static void uart_xon_hook(struct avr_irq_t * irq, uint32_t value,
+                          void * param)
+{
+	uart.xon = 1;
+}
+
+static void uart_xoff_hook(struct avr_irq_t * irq, uint32_t value,
+                           void * param)
+{
+	uart.xon = 0;
+}
+
+static void no_sleep(avr_t * avr, avr_cycle_count_t how_long)
+{
+}
+
+static int is_done(int state)
+{
+	return state == cpu_Done || state == cpu_Crashed;
+}
+
+// Run until the prompt has been printed and the firmware has had time to
+// start waiting on the UART
+static int run_to_prompt(avr_t * avr, const char * prompt)
+{
+	int state = avr->state;
+	avr_cycle_count_t settle_until = 0;
+
+	while (!is_done(state) && avr->cycle < BOOT_CYCLES) {
+		state = avr_run(avr);
+		if (!settle_until && strstr(uart.output, prompt)) {
+			settle_until = avr->cycle + SETTLE_CYCLES;
+		}
+		if (settle_until && avr->cycle >= settle_until) {
+			return 0;
+		}
+	}
+	return -1;
+}
+
+// Runs in the forked child. Returns the process exit status that encodes
+// the outcome for the parent.
+static int attempt(avr_t * avr, const char * candidate, const char * success,
+                   avr_cycle_count_t budget)
+{
+	size_t candidate_len = strlen(candidate);
+	size_t input_len = candidate_len + 2, sent = 0;
+	int state = avr->state;
+	avr_cycle_count_t deadline = avr->cycle + budget;
+	char * line;
+	char * end;
+
+	uart.output_len = 0;
+	uart.output[0] = '\0';
+
+	while (!is_done(state) && avr->cycle < deadline) {
+		// Feed the candidate and its line ending as fast as the
+		// receive FIFO allows
+		while (sent < input_len && uart.xon) {
+			avr_raise_irq(uart.input_irq, sent < candidate_len ?
+			              (uint8_t)candidate[sent] :
+			              (uint8_t)"\r\n"[sent - candidate_len]);
+			sent++;
+		}
+		state = avr_run(avr);
+
+		// The response is the first non-empty line after our input
+		line = uart.output;
+		while (*line == '\r' || *line == '\n') {
+			line++;
+		}
+		end = strpbrk(line, "\r\n");
+		if (sent == input_len && end) {
+			return strncmp(line, success, strlen(success)) == 0 ?
+			       0 : 1;
+		}
+	}
+	return state == cpu_Crashed ? 3 : 2;
+}
+
+int main(int argc, char **argv)
+{
+	char * filename;
+	FILE * in_fd;
+	char mem_byte;
+	char * candidate = NULL;
+	size_t candidate_size = 0;
+	const char * prompt = "password:";
+	const char * success = "SUCCESS";
+	const char * outcome;
+	avr_cycle_count_t budget = 2000000;
+
+	avr_t * avr;
+	int ctr, opt, status;
+	uint32_t flags;
+	pid_t pid;
+
+	// Parse the input arguments
+	while ((opt = getopt(argc, argv, "p:s:c:")) != -1) {
+		switch (opt) {
+		case 'p':
+			prompt = optarg;
+			break;
+		case 's':
+			success = optarg;
+			break;
+		case 'c':
+			budget = strtoull(optarg, NULL, 0);
+			break;
+		default:
+			fprintf(stderr, "Usage: %s [-p prompt] [-s success] "
+			        "[-c cycles] flash_filename\n", argv[0]);
+			exit(1);
+		}
+	}
+	if (optind != argc - 1) {
+		fprintf(stderr, "Usage: %s [-p prompt] [-s success] "
+		        "[-c cycles] flash_filename\n", argv[0]);
+		exit(1);
+	}
+	filename = argv[optind];
+
+	// Set up the AVR target with the details for our project.
+	avr = avr_make_mcu_by_name("atmega328p");
+	if (!avr) {
+		fprintf(stderr, "Error creating avr object.\n");
+		exit(1);
+	}
+
+	avr_init(avr);
+	avr->frequency = 16000000;
+	avr->vcc = 5000;
+	avr->avcc = 5000;
+	// Emulated time doesn't need to track wall-clock time here
+	avr->sleep = no_sleep;
+
+	// Open the flash memory file for reading
+	in_fd = fopen(filename, "r");
+	if (!in_fd) {
+		fprintf(stderr, "Error opening %s for reading.\n",
+		        filename);
+		exit(1);
+	}
+
+	// Read in the flash contents
+	ctr = 0;
+	while (ctr < 0x8000) {
+		if (fread(&mem_byte, 1, 1, in_fd) != 1) {
+			break;
+		}
+		avr->flash[ctr] = mem_byte;
+		ctr++;
+	}
+	fclose(in_fd);
+	fprintf(stderr, "Read %i bytes from %s.\n", ctr, filename);
+
+	// Capture UART0 in memory rather than printing it
+	avr_ioctl(avr, AVR_IOCTL_UART_GET_FLAGS('0'), &flags);
+	flags &= ~(AVR_UART_FLAG_STDIO | AVR_UART_FLAG_POLL_SLEEP);
+	avr_ioctl(avr, AVR_IOCTL_UART_SET_FLAGS('0'), &flags);
+	uart.xon = 1;
+	uart.input_irq = avr_io_getirq(avr, AVR_IOCTL_UART_GETIRQ('0'),
+	                               UART_IRQ_INPUT);
+	avr_irq_register_notify(avr_io_getirq(avr, AVR_IOCTL_UART_GETIRQ('0'),
+	                                      UART_IRQ_OUTPUT),
+	                        uart_output_hook, NULL);
+	avr_irq_register_notify(avr_io_getirq(avr, AVR_IOCTL_UART_GETIRQ('0'),
+	                                      UART_IRQ_OUT_XON),
+	                        uart_xon_hook, NULL);
+	avr_irq_register_notify(avr_io_getirq(avr, AVR_IOCTL_UART_GETIRQ('0'),
+	                                      UART_IRQ_OUT_XOFF),
+	                        uart_xoff_hook, NULL);
+
+	if (run_to_prompt(avr, prompt) != 0) {
+		fprintf(stderr, "Never saw the prompt \"%s\". Output was: %s\n",
+		        prompt, uart.output);
+		exit(1);
+	}
+	fprintf(stderr, "Snapshot taken at cycle %llu.\n",
+	        (unsigned long long)avr->cycle);
+
+	// Serve candidates. This process is never touched again, so every
+	// child starts from the same snapshot. getline reads a whole line
+	// however long it is, so that every line is exactly one candidate and
+	// gets exactly one line of output.
+	while (getline(&candidate, &candidate_size, stdin) >= 0) {
+		candidate[strcspn(candidate, "\r\n")] = '\0';
+
+		pid = fork();
+		if (pid < 0) {
+			perror("fork");
+			exit(1);
+		}
+		if (pid == 0) {
+			_exit(attempt(avr, candidate, success, budget));
+		}
+		if (waitpid(pid, &status, 0) < 0) {
+			perror("waitpid");
+			exit(1);
+		}
+
+		if (!WIFEXITED(status)) {
+			outcome = "C";
+		} else {
+			switch (WEXITSTATUS(status)) {
+			case 0:
+				outcome = "S";
+				break;
+			case 1:
+				outcome = "F";
+				break;
+			case 2:
+				outcome = "T";
+				break;
+			default:
+				outcome = "C";
+				break;
+			}
+		}
+		printf("%s %s\n", outcome, candidate);
+		fflush(stdout);
+	}
+
+	free(candidate);
+	avr_terminate(avr);
+	return 0;
+}
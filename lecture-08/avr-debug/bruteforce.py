@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+""" Brute force an emulated firmware password across a pool of fork-servers
+
+Each worker is an instance of the 'bruteforce' fork-server (see bruteforce.c)
+that has already booted the firmware to its password prompt. Candidates are
+handed out in batches, so throughput scales with the number of cores rather
+than with the UART baud rate.
+
+Example usages of this script are:
+
+Try every 3-character lowercase password against hash_8_bits.bin:
+    ./bruteforce.py ../patching-demo/bin/hash_8_bits.bin --length 3
+
+Try a wordlist on four cores and stop at the first success:
+    ./bruteforce.py uart_intro.bin -w words.txt -j 4 --prompt passkey: --first
+"""
+
+import argparse
+import collections
+import itertools
+import os
+import queue
+import string
+import subprocess
+import threading
+import time
+
+def candidates_from_charset(charset, length):
+    """ Generate every string of the given length over charset
+
+    Parameters
+    ----------
+    charset : string
+    length : int
+
+    Returns
+    -------
+    generator of strings
+    """
+
+    for t in itertools.product(charset, repeat=length):
+        yield "".join(t)
+
+def candidates_from_wordlist(filename):
+    """ Generate candidates from a file with one password per line
+
+    Parameters
+    ----------
+    filename : string
+
+    Returns
+    -------
+    generator of strings
+    """
+
+    with open(filename, "r", errors="replace") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if line:
+                yield line
+
+def batched(iterable, n):
+    """ Split iterable into lists of at most n items """
+
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, n))
+        if not batch:
+            return
+        yield batch
+
+# Bytes of candidates written to a fork-server ahead of its replies. Each
+# reply echoes its candidate, so this bounds the data waiting in both pipes,
+# and keeps it well under the 64 KiB Linux pipe buffer; otherwise both sides
+# could block writing to a full pipe.
+PIPE_WINDOW = 16384
+
+def worker(args, flash, batches, results, stop):
+    """ Drive a single fork-server process
+
+    Pulls batches of candidates from the batches queue, writes them to the
+    fork-server, and puts one (outcome, candidate) tuple per candidate on the
+    results queue. A None batch tells the worker to shut down. Writes run
+    ahead of the replies by at most PIPE_WINDOW bytes, or one candidate if
+    it is longer than that.
+    """
+
+    cmd = [args.server, "-p", args.prompt, "-s", args.success,
+            "-c", str(args.cycles), flash]
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True, bufsize=1)
+    # Sizes of the candidates written but not yet answered, and their total
+    in_flight = collections.deque()
+    pending = 0
+    try:
+        while not stop.is_set():
+            batch = batches.get()
+            if batch is None:
+                break
+            for c in batch + [None]:
+                size = 0 if c is None else len((c + "\n").encode())
+                # Read replies until the next candidate fits in the window;
+                # after the last one, read the rest. The fork-server reads a
+                # whole candidate before replying, so one alone in flight
+                # can't deadlock however long it is.
+                while in_flight and (c is None or
+                        pending + size > PIPE_WINDOW):
+                    proc.stdin.flush()
+                    line = proc.stdout.readline()
+                    if line == "":
+                        raise RuntimeError("Fork-server exited unexpectedly")
+                    pending -= in_flight.popleft()
+                    outcome, _, candidate = line.rstrip("\n").partition(" ")
+                    results.put((outcome, candidate))
+                if c is not None:
+                    proc.stdin.write(c + "\n")
+                    in_flight.append(size)
+                    pending += size
+    finally:
+        proc.stdin.close()
+        proc.wait()
+        results.put(None)
+
+def bruteforce(args, flash, candidates):
+    """ Run candidates through a pool of fork-servers
+
+    Returns
+    -------
+    list of successful candidates
+    """
+
+    batches = queue.Queue(maxsize=2*args.jobs)
+    results = queue.Queue()
+    stop = threading.Event()
+    threads = [threading.Thread(target=worker,
+        args=(args, flash, batches, results, stop), daemon=True)
+        for _ in range(args.jobs)]
+    for t in threads:
+        t.start()
+
+    def feed():
+        for batch in batched(candidates, args.batch):
+            if stop.is_set():
+                break
+            batches.put(batch)
+        for _ in threads:
+            batches.put(None)
+    threading.Thread(target=feed, daemon=True).start()
+
+    successes = []
+    counts = {"S": 0, "F": 0, "T": 0, "C": 0}
+    attempts = 0
+    running = len(threads)
+    t_start = time.time()
+    try:
+        while running > 0:
+            r = results.get()
+            if r is None:
+                running -= 1
+                continue
+            outcome, candidate = r
+            attempts += 1
+            counts[outcome] = counts.get(outcome, 0) + 1
+            if outcome == "S":
+                successes.append(candidate)
+                print(f"SUCCESS with password {candidate!r}")
+                if args.first:
+                    stop.set()
+                    break
+            elif outcome == "C":
+                print(f"Emulated CPU crashed on {candidate!r}")
+    except KeyboardInterrupt:
+        stop.set()
+
+    delta_t = time.time() - t_start
+    print("==============================================")
+    print(f"{attempts} attempts in {delta_t} seconds")
+    if delta_t > 0:
+        print(f"{attempts/delta_t} attempts/s")
+    print(f"{counts['S']} successes, {counts['F']} failures, "
+            f"{counts['T']} timeouts, {counts['C']} crashes")
+    return successes
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+            description='Brute force an emulated password prompt')
+    parser.add_argument('flash', type=str,
+            help='File containing the flash memory contents')
+    parser.add_argument('-w', '--wordlist', type=str,
+            help='File of candidate passwords, one per line')
+    parser.add_argument('--charset', default=string.ascii_lowercase, type=str,
+            help='Characters for exhaustive search without a wordlist')
+    parser.add_argument('--length', default=1, type=int,
+            help='Password length for exhaustive search')
+    parser.add_argument('-j', '--jobs', default=os.cpu_count(), type=int,
+            help='Number of fork-servers to run')
+    parser.add_argument('--batch', default=256, type=int,
+            help='Candidates handed to a fork-server at a time')
+    parser.add_argument('--prompt', default='password:', type=str,
+            help='Text that ends the firmware prompt')
+    parser.add_argument('--success', default='SUCCESS', type=str,
+            help='Prefix of the success response')
+    parser.add_argument('--cycles', default=2000000, type=int,
+            help='Emulated cycle budget per attempt')
+    parser.add_argument('--first', action='store_true',
+            help='Stop after the first success')
+    parser.add_argument('--server', type=str,
+            default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                "bruteforce"),
+            help='Path to the compiled fork-server')
+    args = parser.parse_args()
+
+    if args.wordlist:
+        candidates = candidates_from_wordlist(args.wordlist)
+    else:
+        candidates = candidates_from_charset(args.charset, args.length)
+    bruteforce(args, args.flash, candidates)
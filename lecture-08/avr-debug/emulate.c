@@ -1,22 +1,174 @@
 /*
  * Emulate the ATmega328p program with simavr
  *
- * Accepts a single command-line argument specifying the file containing the
- * flash memory contents of the target.
+ * Accepts a command-line argument specifying the file containing the flash
+ * memory contents of the target. With no options the emulator waits for a
+ * GDB connection on port 1234, exactly as before.
+ *
+ * Options:
+ *   -n          Don't start the GDB server; run immediately
+ *   -g port     GDB server port (defaults to 1234)
+ *   -u          Bridge UART0 to a pseudo-terminal. The slave device name is
+ *               printed at startup and can be handed to serial_profile.py or
+ *               arduino_uno_bootloader_client.py as the serial device.
+ *   -l path     Also create a symlink to the pty slave at path (implies -u)
+ *   -f          Fast mode: don't throttle the emulator to real time. Works
+ *               with the GDB server too, which simavr polls on every
+ *               avr_run() step whether or not the firmware is asleep.
+ *   -b address  Reset vector byte address, e.g. 0x7e00 to start in the
+ *               bootloader of a full flash.bin (defaults to 0)
+ *   -c cycles   Stop after this many cycles, 0 for no limit (defaults to
+ *               10000000, or no limit when the UART is bridged)
  *
  * Compile with gcc -o emulate emulate.c -lsimavr
  * Depending on the compiled library version, may need to
  * compile with gcc -o emulate emulate.c -lsimavr -lelf
  */
 
+#define _XOPEN_SOURCE 600
+#define _DEFAULT_SOURCE
+
+#include <errno.h>
+#include <fcntl.h>
+#include <stdint.h>
 #include <stdio.h>
 #include <stdlib.h>
+#include <termios.h>
+#include <unistd.h>
 
 #include <simavr/sim_avr.h>
 #include <simavr/avr_uart.h>
 #include <simavr/avr_ioport.h>
 #include <simavr/sim_gdb.h>
 
+// Number of avr_run() steps between polls of the pty for new input
+#define POLL_INTERVAL 256
+
+struct uart_bridge {
+	int master_fd;
+	int slave_fd;
+	int xon;
+	avr_irq_t * input_irq;
+};
+
+// Called by simavr for every byte the firmware transmits on UART0
+static void uart_output_hook(struct avr_irq_t * irq, uint32_t value,
+                             void * param)
+{
+	struct uart_bridge * bridge = (struct uart_bridge *)param;
+	uint8_t c = value;
+
+	// If nobody is reading, the pty buffer fills and we drop output
+	// rather than stall the emulated CPU.
+	if (write(bridge->master_fd, &c, 1) != 1 && errno != EAGAIN) {
+		perror("write to pty");
+	}
+}
+
+// simavr raises XON when the UART receive FIFO can take more input and
+// XOFF when it is full.
+static void uart_xon_hook(struct avr_irq_t * irq, uint32_t value,
+                          void * param)
+{
+	((struct uart_bridge *)param)->xon = 1;
+}
+
+static void uart_xoff_hook(struct avr_irq_t * irq, uint32_t value,
+                           void * param)
+{
+	((struct uart_bridge *)param)->xon = 0;
+}
+
+// Stand-in for simavr's sleep callback that returns immediately, so that
+// firmware sleeping or busy-waiting on the UART costs no host time.
+static void no_sleep(avr_t * avr, avr_cycle_count_t how_long)
+{
+}
+
+static int uart_bridge_init(avr_t * avr, struct uart_bridge * bridge,
+                            const char * link_path, int fast)
+{
+	struct termios tio;
+	uint32_t flags;
+	char * slave_name;
+
+	bridge->master_fd = posix_openpt(O_RDWR | O_NOCTTY);
+	if (bridge->master_fd < 0 || grantpt(bridge->master_fd) != 0
+	    || unlockpt(bridge->master_fd) != 0) {
+		perror("posix_openpt");
+		return -1;
+	}
+	slave_name = ptsname(bridge->master_fd);
+
+	// Raw mode, so binary protocols such as the bootloader's get through
+	// untouched.
+	tcgetattr(bridge->master_fd, &tio);
+	cfmakeraw(&tio);
+	tcsetattr(bridge->master_fd, TCSANOW, &tio);
+	fcntl(bridge->master_fd, F_SETFL,
+	      fcntl(bridge->master_fd, F_GETFL) | O_NONBLOCK);
+
+	// Hold the slave open ourselves, so that reads on the master don't
+	// fail with EIO while no client is attached.
+	bridge->slave_fd = open(slave_name, O_RDWR | O_NOCTTY);
+
+	if (link_path) {
+		unlink(link_path);
+		if (symlink(slave_name, link_path) != 0) {
+			perror("symlink");
+			return -1;
+		}
+		printf("UART0 available on %s -> %s\n", link_path, slave_name);
+	} else {
+		printf("UART0 available on %s\n", slave_name);
+	}
+
+	// Route UART0 through the pty instead of simavr's stdout logging
+	avr_ioctl(avr, AVR_IOCTL_UART_GET_FLAGS('0'), &flags);
+	flags &= ~AVR_UART_FLAG_STDIO;
+	if (fast) {
+		// Polling the status register normally sleeps the host
+		// briefly when no data is waiting.
+		flags &= ~AVR_UART_FLAG_POLL_SLEEP;
+	}
+	avr_ioctl(avr, AVR_IOCTL_UART_SET_FLAGS('0'), &flags);
+
+	bridge->xon = 1;
+	bridge->input_irq = avr_io_getirq(avr, AVR_IOCTL_UART_GETIRQ('0'),
+	                                  UART_IRQ_INPUT);
+	avr_irq_register_notify(avr_io_getirq(avr, AVR_IOCTL_UART_GETIRQ('0'),
+	                                      UART_IRQ_OUTPUT),
+	                        uart_output_hook, bridge);
+	avr_irq_register_notify(avr_io_getirq(avr, AVR_IOCTL_UART_GETIRQ('0'),
+	                                      UART_IRQ_OUT_XON),
+	                        uart_xon_hook, bridge);
+	avr_irq_register_notify(avr_io_getirq(avr, AVR_IOCTL_UART_GETIRQ('0'),
+	                                      UART_IRQ_OUT_XOFF),
+	                        uart_xoff_hook, bridge);
+	return 0;
+}
+
+// Move any bytes waiting on the pty into the UART receive FIFO. Bytes are
+// only read from the pty while the FIFO has room, so the kernel's pty buffer
+// provides the backpressure to the client.
+static void uart_bridge_poll(struct uart_bridge * bridge)
+{
+	uint8_t c;
+
+	while (bridge->xon) {
+		if (read(bridge->master_fd, &c, 1) != 1) {
+			break;
+		}
+		avr_raise_irq(bridge->input_irq, c);
+	}
+}
+
+static void usage(const char * name)
+{
+	printf("Usage: %s [-n] [-g port] [-u] [-l link] [-f] [-b address] "
+	       "[-c cycles] flash_filename\n", name);
+}
+
 int main(int argc, char **argv)
 {
 	char * filename;
@@ -24,14 +176,55 @@ int main(int argc, char **argv)
 	char mem_byte;
 
 	avr_t * avr;
-	int state, ctr;
+	int state, ctr, opt;
+
+	int use_gdb = 1;
+	int gdb_port = 1234;
+	int use_uart = 0;
+	int fast = 0;
+	char * link_path = NULL;
+	unsigned long reset_pc = 0;
+	long long max_cycles = -1;
+	struct uart_bridge bridge;
+	unsigned long steps = 0;
 
 	// Parse the input arguments
-	if (argc != 2) {
-		printf("Usage: %s flash_filename\n", argv[0]);
+	while ((opt = getopt(argc, argv, "ng:ul:fb:c:")) != -1) {
+		switch (opt) {
+		case 'n':
+			use_gdb = 0;
+			break;
+		case 'g':
+			gdb_port = atoi(optarg);
+			break;
+		case 'l':
+			link_path = optarg;
+			/* fall through */
+		case 'u':
+			use_uart = 1;
+			break;
+		case 'f':
+			fast = 1;
+			break;
+		case 'b':
+			reset_pc = strtoul(optarg, NULL, 0);
+			break;
+		case 'c':
+			max_cycles = strtoll(optarg, NULL, 0);
+			break;
+		default:
+			usage(argv[0]);
+			exit(1);
+		}
+	}
+	if (optind != argc - 1) {
+		usage(argv[0]);
 		exit(1);
 	}
-	filename = argv[1];
+	filename = argv[optind];
+	if (max_cycles < 0) {
+		max_cycles = use_uart ? 0 : 10000000;
+	}
 
 	// Set up the AVR target with the details for our project.
 	avr = avr_make_mcu_by_name("atmega328p");
@@ -65,21 +258,45 @@ int main(int argc, char **argv)
 	fclose(in_fd);
 	printf("Read %i bytes from %s.\n", ctr, filename);
 
-	// Set up the target for debug
-	// Note that there appears to be a bug when setting breakpoints in
-	// GDB. You'll have to do something like b *(void (*)())0x268
-	avr->gdb_port = 1234;
-	avr_gdb_init(avr);
+	// Equivalent of programming the BOOTRST fuse
+	if (reset_pc) {
+		avr->reset_pc = reset_pc;
+		avr_reset(avr);
+	}
+
+	if (use_uart && uart_bridge_init(avr, &bridge, link_path, fast) != 0) {
+		exit(1);
+	}
+
+	if (use_gdb) {
+		// Set up the target for debug
+		// Note that there appears to be a bug when setting breakpoints
+		// in GDB. You'll have to do something like
+		// b *(void (*)())0x268
+		avr->gdb_port = gdb_port;
+		avr_gdb_init(avr);
+		avr->state = cpu_Stopped;
+	}
+	// After avr_gdb_init, which installs its own sleep callback; that one
+	// only adds GDB polling while asleep on top of the real-time delay
+	if (fast) {
+		avr->sleep = no_sleep;
+	}
 
 	// Run for a fixed number of cycles, or until the processor halts
-	avr->state = cpu_Stopped;
 	state = avr->state;
 	while ((state != cpu_Done) && (state != cpu_Crashed)
-	       && (avr->cycle < 10000000)) {
+	       && (max_cycles == 0 || avr->cycle < max_cycles)) {
 		state = avr_run(avr);
+		if (use_uart && (++steps % POLL_INTERVAL) == 0) {
+			uart_bridge_poll(&bridge);
+		}
 	}
 	avr_terminate(avr);
 
+	if (link_path) {
+		unlink(link_path);
+	}
+
 	return 0;
 }
-
@@ -3,6 +3,8 @@
 import serial
 import time
 import argparse
+import collections
+import itertools
 
 PASSWORD=b"abcdef"
 
@@ -11,8 +13,24 @@ def serial_init(dev, baud, timeout):
     ser.reset_input_buffer()
     return ser
 
-def profile_serial(dev="/dev/ttyACM0", baud=38400, timeout=0.1):
+def print_statistics(attempts, delta_t):
+    print("==============================================")
+    print(f"{attempts} attempts in {delta_t} seconds")
+    print(f"{attempts/delta_t} attempts/s")
+    if attempts > 0:
+        print(f"{delta_t*1000/attempts} ms/attempt")
+
+def profile_serial(dev="/dev/ttyACM0", baud=38400, timeout=0.1, window=1):
     ser = serial_init(dev, baud, timeout)
+    try:
+        if window > 1:
+            profile_serial_pipelined(ser, itertools.repeat(PASSWORD), window)
+        else:
+            profile_serial_lockstep(ser)
+    finally:
+        ser.close()
+
+def profile_serial_lockstep(ser):
     t_start = time.time()
     attempts = 0
     print("Beginning profiling loop.")
@@ -37,11 +55,78 @@ def profile_serial(dev="/dev/ttyACM0", baud=38400, timeout=0.1):
         pass
 
     delta_t = time.time() - t_start
-    print("==============================================")
-    print(f"{attempts} attempts in {delta_t} seconds")
-    print(f"{attempts/delta_t} attempts/s")
-    print(f"{delta_t*1000/attempts} ms/attempt")
-    ser.close()
+    print_statistics(attempts, delta_t)
+
+def resynchronize(ser):
+    # Discard everything until the target sits idle at a password prompt:
+    # a prompt followed by a read timeout. Stopping at the first prompt
+    # isn't enough, since replies to attempts that were only slow, not lost,
+    # can still be on their way and would be taken for replies to the next
+    # ones. If the target goes quiet without a prompt, it has lost the end
+    # of a line and is waiting for one; the blank line that completes it
+    # gets a reply and a prompt of its own, which are discarded here too.
+    at_prompt = False
+    while True:
+        line = ser.readline()
+        if line == b'':
+            if at_prompt:
+                return
+            ser.write(b'\r\n')
+            continue
+        at_prompt = line[0] == ord('P')
+
+def profile_serial_pipelined(ser, candidates, window):
+    # Instead of waiting for each prompt before sending, keep up to 'window'
+    # attempts queued in the target's receive path. The firmware handles its
+    # input strictly in order, so each "SUCCESS"/"Incorrect password" line
+    # belongs to the oldest attempt still in flight. Prompt lines carry no
+    # information once we are in phase and are simply skipped.
+    in_flight = collections.deque()
+    attempts = 0
+    dropped = 0
+    print("Beginning pipelined profiling loop "
+            f"({window} attempts in flight).")
+    print("Press Ctrl-C to terminate and print statistics.")
+
+    t_start = time.time()
+    try:
+        # Wait for the first prompt so that the first attempt lands in phase
+        resynchronize(ser)
+        t_start = time.time()
+        while True:
+            # Top up the window before waiting on the next response
+            while len(in_flight) < window:
+                candidate = next(candidates)
+                ser.write(bytes(candidate) + b'\r\n')
+                in_flight.append(candidate)
+
+            line = ser.readline()
+            if line == b'':
+                # Nothing came back in time: the target has overrun its
+                # receive buffer and lost input. Forget everything that was
+                # in flight and resynchronize on the next idle prompt.
+                dropped += len(in_flight)
+                in_flight.clear()
+                resynchronize(ser)
+                continue
+            if line[0] == ord('P'):
+                continue
+            if (line[0] != ord('S')) and (line[0] != ord('I')):
+                raise ValueError(f"Unexpected response: {line}")
+
+            candidate = in_flight.popleft()
+            attempts += 1
+            if line[0] == ord('S'):
+                print(f"SUCCESS with password {bytes(candidate)}")
+
+    except (KeyboardInterrupt, StopIteration):
+        pass
+
+    delta_t = time.time() - t_start
+    print_statistics(attempts, delta_t)
+    print(f"{dropped} attempts lost to receive overruns")
+    if dropped > 0:
+        print("Consider a smaller --window for this target")
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Brute force password over serial')
@@ -51,6 +136,8 @@ if __name__ == "__main__":
             help='Serial read/write timeout')
     parser.add_argument('--baud', default=38400, type=int,
             help='Serial baud rate')
+    parser.add_argument('--window', default=1, type=int,
+            help='Number of attempts kept in flight (1 = lock-step)')
     args = parser.parse_args()
-    profile_serial(dev=args.device, baud=args.baud, timeout=args.timeout)
-
+    profile_serial(dev=args.device, baud=args.baud, timeout=args.timeout,
+            window=args.window)
@@ -3,6 +3,8 @@
 import sys
 import subprocess
 import random
+import time
+import collections
 import struct
 
 if len(sys.argv) > 1:
@@ -10,10 +12,27 @@ if len(sys.argv) > 1:
 else:
     prog_name = "../program/program"
 
+# Every iteration reseeds the generator from the seed and the iteration number,
+# so a crash can be reproduced from those two numbers with
+# ../../parallel-fuzzer/fuzzer/replay.py
+if len(sys.argv) > 2:
+    seed = int(sys.argv[2])
+else:
+    seed = random.getrandbits(32)
+print(f"Seed {seed}")
+
+
+# Printing every input throttles the fuzzer, so keep only the last few for
+# post-mortem and refresh a status line a few times a second
+recent = collections.deque(maxlen=16)
+t_start = time.monotonic()
+last_status = 0.0
+hangs = 0
 
 iters = 0
 while True:
     iters += 1
+    random.seed((seed << 32) + iters)
 
     # First field is magic number
     randominput = b"MAGC"
@@ -25,15 +44,25 @@ while True:
     # Now add the random bytes
     randominput += random.randbytes(numbytes)
 
-    # Provide the input to the program
-    complete = subprocess.run(prog_name, input=randominput, shell=False,
-            capture_output=True)
+    # Provide the input to the program, giving up if it hangs
+    recent.append(randominput)
+    try:
+        complete = subprocess.run(prog_name, input=randominput, shell=False,
+                capture_output=True, timeout=1)
+    except subprocess.TimeoutExpired:
+        hangs += 1
+        continue
 
     # Check to see if the program crashed
     if complete.returncode < 0:
-        print(f"Crashed after iteration {iters} from signal {-complete.returncode} with input {randominput.hex()}")
+        print()
+        print(f"Crashed after iteration {iters} with seed {seed} from signal {-complete.returncode} with input {randominput.hex()}")
+        print(f"Last {len(recent)} inputs, oldest first:")
+        for r in recent:
+            print(r.hex())
         break
-    else:
-        print(f"No crash after iteration {iters} with input {randominput.hex()}")
-
 
+    now = time.monotonic()
+    if now - last_status >= 0.25:
+        print(f"\r{iters} iterations, {iters/(now - t_start):.0f} exec/s, {hangs} hangs", end="", flush=True)
+        last_status = now
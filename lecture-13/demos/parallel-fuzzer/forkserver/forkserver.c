@@ -0,0 +1,109 @@
+/*
+ * LD_PRELOAD fork-server shim for dynamically linked fuzz targets
+ *
+ * Interposes on __libc_start_main so that the target stops just before main,
+ * after the dynamic loader and libc have finished starting up. From there it
+ * serves fork requests from the fuzzer, in the manner of AFL's fork-server:
+ * every test case runs in a fresh fork() of this fully initialized process,
+ * so the cost of exec, dynamic linking, and libc startup is paid only once.
+ *
+ * The fuzzer passes a control pipe and a status pipe through the
+ * FORKSRV_FDS environment variable as "control_fd,status_fd". The protocol
+ * uses 4-byte native-endian words:
+ *
+ *   shim -> fuzzer   hello word FORKSRV_HELLO once at startup
+ *   fuzzer -> shim   any word to request a run
+ *   shim -> fuzzer   pid of the child running the test case
+ *   shim -> fuzzer   child's wait status once it has exited
+ *
+ * The test case itself is read by the child from its standard input, which
+ * the fuzzer rewinds between runs. Without FORKSRV_FDS the target runs
+ * normally.
+ *
+ * Build with the Makefile in this directory, then run a target as
+ *   FORKSRV_FDS=... LD_PRELOAD=./forkserver.so ../../random-fuzzer/program/program
+ */
+
+#define _GNU_SOURCE
+
+#include <dlfcn.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+#define FORKSRV_HELLO 0x46535256
+
+typedef int (*main_fn)(int, char **, char **);
+typedef int (*libc_start_main_fn)(main_fn, int, char **, void (*)(void),
+                                  void (*)(void), void (*)(void), void *);
+
+static main_fn real_main;
+
+static int write_word(int fd, uint32_t word)
+{
+	return write(fd, &word, 4) == 4 ? 0 : -1;
+}
+
+// Serve fork requests. Returns only in a child that should go on to run
+// main; the server itself exits when the fuzzer closes the control pipe.
+static void serve(int ctl_fd, int st_fd)
+{
+	uint32_t cmd;
+	int status;
+	pid_t pid;
+
+	if (write_word(st_fd, FORKSRV_HELLO) != 0) {
+		// Nobody is listening, so run the target normally
+		return;
+	}
+
+	while (read(ctl_fd, &cmd, 4) == 4) {
+		pid = fork();
+		if (pid < 0) {
+			_exit(1);
+		}
+		if (pid == 0) {
+			close(ctl_fd);
+			close(st_fd);
+			return;
+		}
+		if (write_word(st_fd, pid) != 0) {
+			_exit(1);
+		}
+		if (waitpid(pid, &status, 0) < 0) {
+			_exit(1);
+		}
+		if (write_word(st_fd, status) != 0) {
+			_exit(1);
+		}
+	}
+	_exit(0);
+}
+
+static int forkserver_main(int argc, char **argv, char **envp)
+{
+	char * fds = getenv("FORKSRV_FDS");
+	int ctl_fd, st_fd;
+
+	if (fds && sscanf(fds, "%d,%d", &ctl_fd, &st_fd) == 2) {
+		// Keep the variable from leaking into anything the target runs
+		unsetenv("FORKSRV_FDS");
+		serve(ctl_fd, st_fd);
+	}
+	return real_main(argc, argv, envp);
+}
+
+int __libc_start_main(main_fn main, int argc, char **argv,
+                      void (*init)(void), void (*fini)(void),
+                      void (*rtld_fini)(void), void *stack_end)
+{
+	libc_start_main_fn real_start;
+
+	real_start = (libc_start_main_fn)dlsym(RTLD_NEXT, "__libc_start_main");
+	real_main = main;
+	return real_start(forkserver_main, argc, argv, init, fini, rtld_fini,
+	                  stack_end);
+}
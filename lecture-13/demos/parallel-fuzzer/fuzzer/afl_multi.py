@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+
+""" Run afl-fuzz on many cores and aggregate the results
+
+Starts one main afl-fuzz instance (-M main) and secondaries (-S secNN) that
+share an output directory, each pinned to its own core. afl-fuzz's own core
+binding is turned off with AFL_NO_AFFINITY, because instances started close
+together can all pick the same free core.
+
+While they run, every instance's fuzzer_stats is read to show combined
+exec/s, corpus size, crashes, and hangs on a status line. An instance that
+exits is restarted, resuming from its own queue, up to --max-restarts times.
+Crashes from all instances are periodically run under ptrace and grouped into
+buckets (see triage.py), so that the same bug found by several instances is
+reported once; the smallest input per bucket and a report are written to
+<output>/buckets.
+
+AFL refuses to start when core dumps are piped to a helper program, which is
+the default on many distributions. Rather than changing core_pattern with
+sudo, this script sets AFL_I_DONT_CARE_ABOUT_MISSING_CRASHES in that case, so
+crashes are still found, just a little more slowly.
+
+Example usages of this script are:
+
+Fuzz an AFL-instrumented afl-demo program on every core for an hour:
+    afl-gcc -o program_instrumented ../../afl-demo/program/program.c
+    ./afl_multi.py -i inputs -o outputs -d 3600 ./program_instrumented
+
+Use four instances on cores 4-7, with a dictionary for all of them:
+    ./afl_multi.py -j 4 --cores 4,5,6,7 -a -x -a dict.txt -i inputs \
+        -o outputs ./program_instrumented
+"""
+
+import argparse
+import glob
+import os
+import signal
+import subprocess
+import time
+
+from stats import StatusLine, read_stats_file
+from triage import CrashBuckets, triage
+
+POLL_INTERVAL = 1.0
+# Don't restart an instance more often than this, in seconds
+RESTART_DELAY = 5.0
+# How long instances get to exit after SIGINT before they are killed
+STOP_TIMEOUT = 10.0
+
+# fuzzer_stats keys, AFL++ names first and then the original AFL ones
+STATS_KEYS = {
+    "execs": ("execs_done",),
+    "exec/s": ("execs_per_sec",),
+    "corpus": ("corpus_count", "paths_total"),
+    "crashes": ("saved_crashes", "unique_crashes"),
+    "hangs": ("saved_hangs", "unique_hangs"),
+}
+
+def core_pattern_env():
+    """ Environment needed for afl-fuzz to start with this core_pattern """
+
+    try:
+        with open("/proc/sys/kernel/core_pattern") as f:
+            pattern = f.read().strip()
+    except OSError:
+        return {}
+    if pattern.startswith("|"):
+        print(f"core_pattern pipes core dumps to {pattern[1:].split()[0]}; "
+                f"setting AFL_I_DONT_CARE_ABOUT_MISSING_CRASHES instead of "
+                f"changing it")
+        return {"AFL_I_DONT_CARE_ABOUT_MISSING_CRASHES": "1"}
+    return {}
+
+class Instance:
+    """ One afl-fuzz process
+
+    Parameters
+    ----------
+    name : string
+        Sync name, main for the main instance
+    core : int
+        CPU to pin the instance to
+    options : argparse.Namespace
+    env : dict
+        Environment for afl-fuzz
+    """
+
+    def __init__(self, name, core, options, env):
+        self.name = name
+        self.core = core
+        self.options = options
+        self.env = env
+        self.directory = os.path.join(options.output, name)
+        self.proc = None
+        self.log = None
+        self.restarts = 0
+        self.t_started = 0.0
+
+    def command(self):
+        options = self.options
+        # Resume from the instance's own queue if it has one
+        resume = os.path.isdir(os.path.join(self.directory, "queue"))
+        role = "-M" if self.name == "main" else "-S"
+        return [options.afl_fuzz, "-i", "-" if resume else options.input,
+                "-o", options.output, role, self.name] + options.afl_arg + \
+                ["--"] + options.target
+
+    def start(self):
+        os.makedirs(self.options.output, exist_ok=True)
+        if self.log is None:
+            self.log = open(os.path.join(self.options.output,
+                f"{self.name}.log"), "ab")
+        core = self.core
+        self.proc = subprocess.Popen(self.command(), env=self.env,
+                stdin=subprocess.DEVNULL, stdout=self.log,
+                stderr=subprocess.STDOUT, start_new_session=True,
+                preexec_fn=lambda: os.sched_setaffinity(0, {core}))
+        self.t_started = time.monotonic()
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None
+
+    def stats(self):
+        """ Return the instance's fuzzer_stats as numbers named as STATS_KEYS """
+
+        entries = read_stats_file(os.path.join(self.directory,
+            "fuzzer_stats"))
+        values = {}
+        for name, keys in STATS_KEYS.items():
+            values[name] = 0.0
+            for key in keys:
+                if key in entries:
+                    values[name] = float(entries[key])
+                    break
+        return values
+
+    def stop(self):
+        if self.alive():
+            self.proc.send_signal(signal.SIGINT)
+
+    def wait(self, timeout):
+        if self.proc is None:
+            return
+        try:
+            self.proc.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+class Crashes:
+    """ Buckets for the crashes found by all instances
+
+    Parameters
+    ----------
+    options : argparse.Namespace
+    """
+
+    def __init__(self, options):
+        self.options = options
+        self.buckets = CrashBuckets(os.path.join(options.output, "buckets"))
+        self.seen = set()
+        self.not_reproduced = []
+
+    def update(self):
+        """ Triage crashes that haven't been seen yet
+
+        Returns
+        -------
+        Number of new crashes
+        """
+
+        paths = sorted(glob.glob(os.path.join(self.options.output, "*",
+            "crashes", "id:*")))
+        count = 0
+        for path in paths:
+            if path in self.seen:
+                continue
+            self.seen.add(path)
+            count += 1
+            with open(path, "rb") as f:
+                data = f.read()
+            # Targets that read a file named on the command line get the
+            # crash file itself
+            argv = [path if a == "@@" else a for a in self.options.target]
+            info = triage(argv, data, timeout=self.options.triage_timeout)
+            if info is None:
+                self.not_reproduced.append(path)
+            else:
+                self.buckets.add(info, data, path)
+        return count
+
+    def write_report(self, instances, totals):
+        """ Write <output>/buckets/report.txt
+
+        Returns
+        -------
+        Lines of the report
+        """
+
+        lines = [f"{len(self.seen)} crashes from {len(instances)} instances, "
+                f"{len(self.buckets.counts)} buckets, "
+                f"{len(self.not_reproduced)} did not reproduce",
+                f"{totals['execs']:.0f} execs, corpus {totals['corpus']:.0f}, "
+                f"{totals['hangs']:.0f} hangs"]
+        lines += self.buckets.summary()
+        lines += [f"did not crash: {path}" for path in self.not_reproduced]
+        os.makedirs(self.buckets.directory, exist_ok=True)
+        with open(os.path.join(self.buckets.directory, "report.txt"),
+                "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return lines
+
+def aggregate(instances):
+    """ Sum the STATS_KEYS values over instances """
+
+    totals = dict.fromkeys(STATS_KEYS, 0.0)
+    for instance in instances:
+        for name, value in instance.stats().items():
+            totals[name] += value
+    return totals
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+            description='Run parallel afl-fuzz instances')
+    parser.add_argument('target', nargs='+',
+            help='AFL-instrumented target program and its arguments')
+    parser.add_argument('-i', '--input', required=True, type=str,
+            help='Directory of seed inputs')
+    parser.add_argument('-o', '--output', default='outputs', type=str,
+            help='Shared afl-fuzz output directory')
+    parser.add_argument('-j', '--jobs', default=None, type=int,
+            help='Number of instances, including the main one (defaults to '
+            'one per core)')
+    parser.add_argument('--cores', default=None, type=str,
+            help='Comma-separated CPUs to pin instances to, in order '
+            '(defaults to all available)')
+    parser.add_argument('-a', '--afl-arg', action='append', default=[],
+            help='Extra argument for every afl-fuzz (repeatable)')
+    parser.add_argument('--afl-fuzz', default='afl-fuzz', type=str,
+            help='afl-fuzz executable')
+    parser.add_argument('-d', '--duration', default=0, type=float,
+            help='Length of the campaign in seconds (0 = until Ctrl-C)')
+    parser.add_argument('--max-restarts', default=5, type=int,
+            help='Give up on an instance after restarting it this many times')
+    parser.add_argument('--triage-interval', default=60.0, type=float,
+            help='Seconds between bucketing new crashes')
+    parser.add_argument('--triage-timeout', default=5.0, type=float,
+            help='Seconds to allow each crash to reproduce')
+    options = parser.parse_args()
+
+    if options.cores:
+        options.cores = [int(c) for c in options.cores.split(",")]
+    else:
+        options.cores = sorted(os.sched_getaffinity(0))
+    if options.jobs is None:
+        options.jobs = len(options.cores)
+    if options.jobs > len(options.cores):
+        print(f"Warning: {options.jobs} instances on {len(options.cores)} "
+                f"cores; some will share a core")
+    return options
+
+if __name__ == "__main__":
+    options = parse_args()
+    env = dict(os.environ, AFL_NO_AFFINITY="1", AFL_NO_UI="1",
+            AFL_SKIP_CPUFREQ="1")
+    env.update(core_pattern_env())
+
+    instances = [Instance("main" if i == 0 else f"sec{i:02d}",
+        options.cores[i % len(options.cores)], options, env)
+        for i in range(options.jobs)]
+    crashes = Crashes(options)
+    display = StatusLine(log_interval=30.0)
+    print(f"Starting {len(instances)} afl-fuzz instances on cores "
+            f"{', '.join(str(i.core) for i in instances)}, logs in "
+            f"{options.output}/<name>.log")
+
+    t_start = time.monotonic()
+    last_triage = t_start
+    failed = set()
+    try:
+        for instance in instances:
+            instance.start()
+            # Secondaries sync from the main instance's directory
+            if instance.name == "main":
+                time.sleep(1.0)
+
+        while len(failed) < len(instances):
+            if options.duration and \
+                    time.monotonic() - t_start >= options.duration:
+                break
+            time.sleep(POLL_INTERVAL)
+
+            for instance in instances:
+                if instance.name in failed or instance.alive():
+                    continue
+                code = instance.proc.returncode
+                if instance.restarts >= options.max_restarts:
+                    display.message(f"{instance.name} exited with code "
+                            f"{code} and has been restarted "
+                            f"{instance.restarts} times; giving up on it")
+                    failed.add(instance.name)
+                elif time.monotonic() - instance.t_started >= RESTART_DELAY:
+                    instance.restarts += 1
+                    display.message(f"{instance.name} exited with code "
+                            f"{code}; restarting it (restart "
+                            f"{instance.restarts})")
+                    instance.start()
+
+            if time.monotonic() - last_triage >= options.triage_interval:
+                count = crashes.update()
+                if count:
+                    display.message(f"Triaged {count} new crashes, "
+                            f"{len(crashes.buckets.counts)} buckets")
+                last_triage = time.monotonic()
+
+            totals = aggregate(instances)
+            alive = sum(i.alive() for i in instances)
+            display.update(f"{alive}/{len(instances)} instances, "
+                    f"{totals['execs']:.0f} execs, {totals['exec/s']:.0f} "
+                    f"exec/s, corpus {totals['corpus']:.0f}, "
+                    f"{totals['crashes']:.0f} crashes in "
+                    f"{len(crashes.buckets.counts)} buckets, "
+                    f"{totals['hangs']:.0f} hangs, "
+                    f"{time.monotonic() - t_start:.0f} s")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for instance in instances:
+            instance.stop()
+        for instance in instances:
+            instance.wait(STOP_TIMEOUT)
+        display.finish()
+
+    crashes.update()
+    print("==============================================")
+    for instance in instances:
+        s = instance.stats()
+        print(f"{instance.name} (core {instance.core}): {s['execs']:.0f} "
+                f"execs, {s['exec/s']:.0f} exec/s, corpus {s['corpus']:.0f}, "
+                f"{s['crashes']:.0f} crashes, {instance.restarts} restarts")
+    for line in crashes.write_report(instances, aggregate(instances)):
+        print(line)
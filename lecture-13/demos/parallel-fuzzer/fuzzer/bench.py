@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+""" Time-to-crash benchmark of fuzzing strategies against the demo targets
+
+Runs every configuration (a strategy and its options) against every target
+for a number of trials of fixed length. Trial i of every configuration uses
+base seed seed + i, so two benchmark runs with the same arguments fuzz with
+the same random numbers, and a change to a strategy can be compared against
+the same trials before and after it.
+
+Each trial is a complete campaign (see parallel.py) with its own output
+directory, and records:
+
+    ttfc        seconds from the start to the first crash, or infinity if
+                the trial ended without one
+    exec/s      executions per second over the whole trial
+    buckets     number of distinct crash buckets found (see triage.py)
+
+A trial isn't stopped at its first crash, so that exec/s and the number of
+buckets cover the same duration for every trial. For each target and
+configuration the median of each measure is reported with a distribution-free
+confidence interval taken from the order statistics of the trials. Trials
+without a crash count as infinitely slow rather than being dropped, so a
+configuration that finds the crash in half its trials has a median at the
+end of the range rather than a flattering one; with fewer than about six
+trials the interval is simply the range of the trials, and its confidence is
+printed with it.
+
+Example usages of this script are:
+
+Compare every configuration on every target, 10 trials of 30 seconds each:
+    ./bench.py -n 10 -d 30
+
+Check whether the dictionary helps on the generational-fuzzer program, with
+the raw results saved for later:
+    ./bench.py -T generational -C random -C random+dict -n 20 --csv dict.csv
+
+Include coverage-guided fuzzing of an AFL-instrumented afl-demo program:
+    ./bench.py -T afl-demo --instrumented afl-demo=./program_instrumented
+
+Measure the cost of checking inputs with AddressSanitizer builds of the
+targets (make sanitizers in each program directory):
+    ./bench.py -C random -C generational --sanitized
+"""
+
+import argparse
+import csv
+import math
+import os
+import shutil
+import time
+
+import fuzzer
+from parallel import Campaign
+
+DEMOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..")
+
+TARGETS = {
+    "random": os.path.join(DEMOS, "random-fuzzer", "program", "program"),
+    "generational": os.path.join(DEMOS, "generational-fuzzer", "program",
+        "program"),
+    "afl-demo": os.path.join(DEMOS, "afl-demo", "program", "program"),
+}
+
+# Extra fuzzer.py arguments for each configuration; {target} is replaced by
+# the target's name, which is also the name of its grammar
+CONFIGS = {
+    "random": ["-s", "random"],
+    "random+dict": ["-s", "random", "--auto-dict"],
+    "generational": ["-s", "generational"],
+    "grammar": ["-s", "grammar", "-g", "{target}"],
+    "coverage": ["-s", "coverage"],
+}
+
+MEASURES = ("ttfc", "exec/s", "buckets")
+
+def median_interval(values, confidence=0.95):
+    """ Median and a distribution-free confidence interval for it
+
+    The interval is [x(j), x(n-j+1)] from the sorted values, with j the
+    largest rank for which the binomial(n, 1/2) probability of the median
+    lying outside it is at most 1 - confidence. When even the full range
+    falls short of the requested confidence the full range is returned.
+
+    Returns
+    -------
+    (median, low, high, achieved confidence)
+    """
+
+    x = sorted(values)
+    n = len(x)
+
+    def coverage(j):
+        return 1 - 2*sum(math.comb(n, i) for i in range(j))/2**n
+
+    j = 1
+    while j + 1 <= (n + 1)//2 and coverage(j + 1) >= confidence:
+        j += 1
+    achieved = coverage(j)
+    if n % 2:
+        median = x[n//2]
+    elif math.isinf(x[n//2]):
+        median = math.inf
+    else:
+        median = (x[n//2 - 1] + x[n//2])/2
+    return median, x[j - 1], x[n - j], achieved
+
+def run_trial(target, config, seed, options, directory):
+    """ Run one fuzzing campaign and measure it
+
+    Returns
+    -------
+    dict with the seed and MEASURES
+    """
+
+    shutil.rmtree(directory, ignore_errors=True)
+    args = [a.format(target=target) for a in CONFIGS[config]]
+    args += ["-j", str(options.jobs), "--seed", str(seed),
+            "-d", str(options.duration), "-e", options.executor,
+            "-t", str(options.timeout), "-o", directory]
+    if options.sanitized:
+        args += ["--sanitized", TARGETS[target] + "_asan"]
+    args.append("--")
+    if config == "coverage":
+        args.append(options.instrumented[target])
+    else:
+        args.append(TARGETS[target])
+
+    campaign = Campaign(fuzzer.parse_args(args), quiet=True)
+    t_start = time.monotonic()
+    campaign.run()
+    elapsed = time.monotonic() - t_start
+    ttfc = campaign.first_crash
+    return {
+        "seed": seed,
+        "ttfc": math.inf if ttfc is None else ttfc,
+        "exec/s": campaign.stats.get("execs")/elapsed,
+        "buckets": len(campaign.buckets.counts),
+    }
+
+def format_value(measure, value, duration):
+    if math.isinf(value):
+        return f">{duration:g}"
+    if measure == "buckets":
+        return f"{value:g}"
+    return f"{value:.2f}" if measure == "ttfc" else f"{value:.0f}"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Fuzzer benchmark')
+    parser.add_argument('-T', '--target', action='append',
+            choices=sorted(TARGETS), help='Target to run (repeatable, '
+            'defaults to all)')
+    parser.add_argument('-C', '--config', action='append',
+            choices=sorted(CONFIGS), help='Configuration to run (repeatable, '
+            'defaults to all that apply)')
+    parser.add_argument('--instrumented', action='append', default=[],
+            metavar='TARGET=PATH',
+            help='AFL-instrumented build of a target, for the coverage '
+            'configuration (repeatable)')
+    parser.add_argument('-n', '--trials', default=10, type=int,
+            help='Number of trials per target and configuration')
+    parser.add_argument('-d', '--duration', default=30.0, type=float,
+            help='Length of each trial in seconds')
+    parser.add_argument('--seed', default=0, type=int,
+            help='Trial i uses base seed seed + i')
+    parser.add_argument('-j', '--jobs', default=1, type=int,
+            help='Worker processes per trial')
+    parser.add_argument('-e', '--executor', default='memfd',
+            help='How to run the target (see fuzzer.py)')
+    parser.add_argument('-t', '--timeout', default=1.0, type=float,
+            help='Hang threshold in seconds')
+    parser.add_argument('--sanitized', action='store_true',
+            help='Check inputs with each target\'s ASan build, '
+            '<program>_asan')
+    parser.add_argument('--confidence', default=0.95, type=float,
+            help='Confidence level of the intervals')
+    parser.add_argument('--csv', default=None, type=str,
+            help='Write every trial to this CSV file')
+    parser.add_argument('-o', '--output', default='bench', type=str,
+            help='Directory for the trials\' output directories')
+    options = parser.parse_args()
+
+    instrumented = {}
+    for spec in options.instrumented:
+        name, _, path = spec.partition("=")
+        if name not in TARGETS or not path:
+            parser.error(f"--instrumented expects TARGET=PATH with TARGET one "
+                    f"of {', '.join(sorted(TARGETS))}")
+        instrumented[name] = path
+    options.instrumented = instrumented
+    options.target = options.target or list(TARGETS)
+    options.config = options.config or list(CONFIGS)
+    return options
+
+if __name__ == "__main__":
+    options = parse_args()
+    runs = [(target, config) for target in options.target
+            for config in options.config
+            if config != "coverage" or target in options.instrumented]
+    print(f"{len(runs)} target/configuration pairs, {options.trials} trials "
+            f"of {options.duration:g} s each with {options.jobs} workers")
+
+    writer = None
+    if options.csv:
+        csv_file = open(options.csv, "w", newline="")
+        writer = csv.writer(csv_file)
+        writer.writerow(["target", "config", "trial", "seed"] + list(MEASURES))
+
+    results = {}
+    try:
+        for target, config in runs:
+            trials = results[target, config] = []
+            for i in range(options.trials):
+                directory = os.path.join(options.output, target, config,
+                        f"trial-{i:02d}")
+                trial = run_trial(target, config, options.seed + i, options,
+                        directory)
+                trials.append(trial)
+                print(f"{target} {config} trial {i}: " + ", ".join(
+                    f"{m} {format_value(m, trial[m], options.duration)}"
+                    for m in MEASURES), flush=True)
+                if writer:
+                    writer.writerow([target, config, i, trial["seed"]] +
+                            [trial[m] for m in MEASURES])
+                    csv_file.flush()
+    except KeyboardInterrupt:
+        print("Interrupted, reporting the trials finished so far")
+    finally:
+        if writer:
+            csv_file.close()
+
+    print("==============================================")
+    print(f"{'target':<14}{'config':<14}{'crashed':>8}  " +
+            "".join(f"{m + ' median [CI]':<28}" for m in MEASURES) + "level")
+    for (target, config), trials in results.items():
+        if not trials:
+            continue
+        crashed = sum(not math.isinf(t["ttfc"]) for t in trials)
+        line = f"{target:<14}{config:<14}{crashed:>4}/{len(trials):<3}  "
+        for m in MEASURES:
+            median, low, high, achieved = median_interval(
+                    [t[m] for t in trials], options.confidence)
+            cell = (f"{format_value(m, median, options.duration)} "
+                    f"[{format_value(m, low, options.duration)}, "
+                    f"{format_value(m, high, options.duration)}]")
+            line += f"{cell:<28}"
+        print(line + f"{achieved:.0%}")
+    if results and min(len(t) for t in results.values()) < 6:
+        print("With fewer than 6 trials the intervals are the full range of "
+                "the trials")
@@ -0,0 +1,72 @@
+""" Record of the saved test cases of a campaign, for replay
+
+Alongside crashes/ and hangs/, a campaign's output directory holds:
+
+    campaign.json   the campaign's options, so that its strategy, grammar,
+                    dictionaries, and target can be set up again
+    cases.log       one line per crashing or hanging test case:
+                    kind worker seed iteration sha1
+                    where kind is crash, hang, or for crashes found by a
+                    sanitizer build (see sanitizer.py) the sanitizer, such
+                    as asan
+
+With a replayable strategy (see strategies.Replayable) a test case is fully
+determined by its worker's seed and the iteration number, so a line of about
+60 bytes is enough to regenerate it with a single call to the strategy, and
+to run it with a single execution of the target. The SHA-1 lets replay.py
+check that it regenerated the same input.
+"""
+
+import argparse
+import collections
+import hashlib
+import json
+import os
+
+Case = collections.namedtuple("Case",
+        ["kind", "worker", "seed", "iteration", "sha1"])
+
+def save_options(options, directory):
+    """ Write options to <directory>/campaign.json """
+
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, "campaign.json"), "w") as f:
+        json.dump(vars(options), f, indent=2)
+        f.write("\n")
+
+def load_options(directory):
+    """ Read the options saved by save_options as an argparse.Namespace """
+
+    with open(os.path.join(directory, "campaign.json")) as f:
+        return argparse.Namespace(**json.load(f))
+
+class CaseLog:
+    """ Append-only cases.log in a campaign's output directory
+
+    Parameters
+    ----------
+    directory : string
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, "cases.log")
+
+    def add(self, kind, worker, seed, iteration, data):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(f"{kind} {worker} {seed} {iteration} "
+                    f"{hashlib.sha1(data).hexdigest()}\n")
+
+    def read(self):
+        """ Return the logged cases in the order they were found """
+
+        cases = []
+        try:
+            with open(self.path) as f:
+                for line in f:
+                    kind, worker, seed, iteration, sha1 = line.split()
+                    cases.append(Case(kind, int(worker), int(seed),
+                        int(iteration), sha1))
+        except FileNotFoundError:
+            pass
+        return cases
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+""" Corpus management for the coverage-guided fuzzer
+
+Imports test cases into a corpus directory (see corpus.py), runs the target on
+any whose coverage isn't known yet, and minimises the corpus to the smallest
+inputs that together reach every edge and hit-count bucket, as afl-cmin does.
+Inputs that hang are reported and, like in afl-cmin, left out of the result.
+The result can be exported as an AFL queue to seed afl-fuzz.
+
+Example usages of this script are:
+
+Minimise the corpus left by ./fuzzer.py -s coverage -c corpus:
+    ./cmin.py -c corpus ./program_instrumented
+
+Import the queues of a finished afl-fuzz run, minimise, and export the result
+as the input directory for the next run:
+    ./cmin.py -c corpus --import-afl ../../afl-demo/afl-fuzz/outputs \
+        --export-afl ../../afl-demo/afl-fuzz/inputs ./program_instrumented
+"""
+
+import argparse
+
+from corpus import Corpus, export_afl_queue, import_afl_queue
+from coverage import CoverageMap
+from execute import PROGRAM_EXECUTORS, make_executor
+from strategies import load_seeds
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Minimise a fuzzing corpus')
+    parser.add_argument('target', nargs='+',
+            help='AFL-instrumented target program and its arguments')
+    parser.add_argument('-c', '--corpus', required=True, type=str,
+            help='Corpus directory')
+    parser.add_argument('-i', '--input', action='append', default=[],
+            help='Directory of inputs to add to the corpus (repeatable)')
+    parser.add_argument('--import-afl', action='append', default=[],
+            help='afl-fuzz output or queue directory to add (repeatable)')
+    parser.add_argument('--export-afl', default=None, type=str,
+            help='Write the minimised corpus here as an AFL queue')
+    parser.add_argument('-e', '--executor', default='memfd',
+            choices=PROGRAM_EXECUTORS,
+            help='How to run the target; harness libraries have no coverage '
+            'map, so the inprocess executors can\'t be used')
+    parser.add_argument('-t', '--timeout', default=1.0, type=float,
+            help='Hang threshold in seconds')
+    parser.add_argument('-n', '--dry-run', action='store_true',
+            help='Report what would be removed without deleting anything')
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    options = parse_args()
+    corpus = Corpus(options.corpus)
+    print(f"{len(corpus)} inputs in {options.corpus}")
+
+    for directory in options.input:
+        count = sum(corpus.add(data) is not None
+                for data in load_seeds(directory))
+        print(f"Imported {count} new inputs from {directory}")
+    for directory in options.import_afl:
+        count = import_afl_queue(corpus, directory)
+        print(f"Imported {count} new inputs from {directory}")
+
+    coverage = CoverageMap()
+    executor = make_executor(options, coverage.env())
+    try:
+        count, hangs = corpus.measure(executor, coverage, options.timeout)
+    finally:
+        executor.close()
+        coverage.close()
+    print(f"Measured coverage of {count} inputs")
+    for digest in hangs:
+        print(f"Input {digest} hung after {options.timeout:g} s; leaving "
+                f"it out")
+
+    elements = set()
+    for entry in corpus.entries.values():
+        elements.update(entry.signature or ())
+    hangs = set(hangs)
+    keep = [d for d in corpus.minimise() if d not in hangs]
+    size_before = sum(e.size for e in corpus.entries.values())
+    size_after = sum(corpus.entries[d].size for d in keep)
+    print(f"{len(elements)} edge/hit-count tuples covered by {len(keep)} of "
+            f"{len(corpus)} inputs ({size_after} of {size_before} bytes)")
+
+    if not options.dry_run:
+        removed = corpus.prune(keep)
+        print(f"Removed {removed} inputs")
+    if options.export_afl:
+        count = export_afl_queue(corpus, options.export_afl, keep)
+        print(f"Exported {count} inputs to {options.export_afl}")
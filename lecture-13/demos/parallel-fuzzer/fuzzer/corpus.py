@@ -0,0 +1,303 @@
+""" Disk-backed, content-addressed corpus of test cases
+
+Each input is stored once, in a file named after the SHA-1 of its contents,
+so several workers can add to the same directory without coordination and
+duplicates cost nothing. An in-memory index records the size and coverage
+signature (see coverage.CoverageMap.signature) of every input, and is
+appended to an index file in the same directory so that signatures survive
+restarts without re-running the target.
+
+The index supports afl-cmin style minimisation: a greedy set cover that keeps,
+for every edge and hit-count bucket seen, the smallest input that reaches it.
+Corpora can also be imported from and exported to AFL queue directories.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+
+INDEX_NAME = ".index"
+
+Entry = collections.namedtuple("Entry", ["digest", "size", "signature"])
+
+def digest_of(data):
+    return hashlib.sha1(data).hexdigest()
+
+class Corpus:
+    """ Set of test cases with their coverage signatures
+
+    Supports len() and indexing by position, returning the input's bytes, so
+    a Corpus can be passed to random.Random.choice and mutate.havoc.
+
+    Parameters
+    ----------
+    directory : string, optional
+        Where to store the inputs; created if needed. Without a directory
+        the corpus is kept in memory only.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.entries = {}
+        self.order = []
+        self._data = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._load()
+
+    def _path(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def _load(self):
+        for name in sorted(os.listdir(self.directory)):
+            path = self._path(name)
+            if name.startswith(".") or not os.path.isfile(path):
+                continue
+            self._insert(Entry(name, os.path.getsize(path), None))
+
+        # Signatures recorded by earlier runs, possibly by other processes
+        try:
+            with open(self._path(INDEX_NAME)) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Partial line from a process that was killed
+                        continue
+                    digest = record["id"]
+                    if digest in self.entries:
+                        self.entries[digest] = Entry(digest, record["size"],
+                                frozenset(record["signature"]))
+        except FileNotFoundError:
+            pass
+
+    def _insert(self, entry):
+        if entry.digest not in self.entries:
+            self.order.append(entry.digest)
+        self.entries[entry.digest] = entry
+
+    def _append_index(self, entry):
+        record = json.dumps({"id": entry.digest, "size": entry.size,
+            "signature": sorted(entry.signature)})
+        # One write per record with O_APPEND, so that records from
+        # concurrent workers don't interleave
+        fd = os.open(self._path(INDEX_NAME),
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, (record + "\n").encode())
+        finally:
+            os.close(fd)
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        return self.get(self.order[i])
+
+    def __contains__(self, data):
+        return digest_of(data) in self.entries
+
+    def get(self, digest):
+        """ Return the contents of the input with the given digest """
+
+        data = self._data.get(digest)
+        if data is None:
+            with open(self._path(digest), "rb") as f:
+                data = f.read()
+            self._data[digest] = data
+        return data
+
+    def add(self, data, signature=None):
+        """ Add an input to the corpus
+
+        Parameters
+        ----------
+        data : bytes
+        signature : set, optional
+            Coverage signature of the input, if it is known
+
+        Returns
+        -------
+        The input's digest, or None if it was already in the corpus with a
+        known signature
+        """
+
+        digest = digest_of(data)
+        old = self.entries.get(digest)
+        if old is not None and (old.signature is not None or
+                signature is None):
+            return None
+        if signature is not None:
+            signature = frozenset(signature)
+        entry = Entry(digest, len(data), signature)
+        if self.directory is not None:
+            if old is None and not os.path.exists(self._path(digest)):
+                # Write then rename, so readers never see a partial file
+                fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, self._path(digest))
+            if signature is not None:
+                self._append_index(entry)
+        self._insert(entry)
+        self._data[digest] = data
+        return digest
+
+    def remove(self, digest):
+        self.entries.pop(digest)
+        self.order.remove(digest)
+        self._data.pop(digest, None)
+        if self.directory is not None:
+            try:
+                os.unlink(self._path(digest))
+            except FileNotFoundError:
+                pass
+
+    def measure(self, executor, coverage, timeout=None):
+        """ Run every input without a signature and record its coverage
+
+        Inputs that time out are left without a signature, since the trace
+        of a killed run is incomplete.
+
+        Parameters
+        ----------
+        executor : execute.SubprocessExecutor or compatible
+            Must have been created with coverage.env() in its environment
+        coverage : coverage.CoverageMap
+        timeout : float, optional
+            Seconds to allow each run
+
+        Returns
+        -------
+        (number of inputs measured, list of digests of inputs that hung)
+        """
+
+        count = 0
+        hangs = []
+        for digest in list(self.order):
+            if self.entries[digest].signature is not None:
+                continue
+            coverage.clear()
+            if executor.run(self.get(digest), timeout).hang:
+                hangs.append(digest)
+                continue
+            self.add(self.get(digest), coverage.signature())
+            count += 1
+        return count, hangs
+
+    def minimise(self):
+        """ Choose a small subset of the corpus with the same coverage
+
+        Greedy set cover, as in afl-cmin: every signature element is
+        assigned the smallest input that has it, then elements are visited
+        from rarest to most common, and the assigned input is kept whenever
+        an element is not yet covered by the inputs kept so far. Inputs
+        without a signature are always kept.
+
+        Returns
+        -------
+        list of digests to keep
+        """
+
+        best = {}
+        frequency = collections.Counter()
+        keep = []
+        for entry in sorted(self.entries.values(), key=lambda e: e.size):
+            if entry.signature is None:
+                keep.append(entry.digest)
+                continue
+            frequency.update(entry.signature)
+            for element in entry.signature:
+                best.setdefault(element, entry)
+
+        covered = set()
+        for element in sorted(frequency, key=frequency.__getitem__):
+            if element in covered:
+                continue
+            entry = best[element]
+            keep.append(entry.digest)
+            covered.update(entry.signature)
+        return keep
+
+    def prune(self, keep):
+        """ Remove every input not in keep and rewrite the index
+
+        Returns
+        -------
+        Number of inputs removed
+        """
+
+        keep = set(keep)
+        removed = [d for d in self.order if d not in keep]
+        for digest in removed:
+            self.remove(digest)
+        if self.directory is not None:
+            fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+            with os.fdopen(fd, "w") as f:
+                for digest in self.order:
+                    entry = self.entries[digest]
+                    if entry.signature is not None:
+                        f.write(json.dumps({"id": digest, "size": entry.size,
+                            "signature": sorted(entry.signature)}) + "\n")
+            os.replace(tmp, self._path(INDEX_NAME))
+        return len(removed)
+
+def afl_queue_dirs(path):
+    """ Find the queue directories in an afl-fuzz output directory
+
+    Accepts a queue directory itself, the output directory of a single
+    afl-fuzz instance, or the shared output directory of parallel instances
+    (-M/-S), in which case the queues of all instances are returned.
+    """
+
+    if os.path.isdir(os.path.join(path, "queue")):
+        return [os.path.join(path, "queue")]
+    queues = []
+    for name in sorted(os.listdir(path)):
+        queue = os.path.join(path, name, "queue")
+        if os.path.isdir(queue):
+            queues.append(queue)
+    return queues or [path]
+
+def import_afl_queue(corpus, path):
+    """ Add every test case in an AFL queue or output directory to corpus
+
+    Returns
+    -------
+    Number of new inputs
+    """
+
+    count = 0
+    for queue in afl_queue_dirs(path):
+        for name in sorted(os.listdir(queue)):
+            filename = os.path.join(queue, name)
+            # Skip .state and other bookkeeping
+            if name.startswith(".") or not os.path.isfile(filename):
+                continue
+            with open(filename, "rb") as f:
+                if corpus.add(f.read()) is not None:
+                    count += 1
+    return count
+
+def export_afl_queue(corpus, path, digests=None):
+    """ Write inputs as an AFL queue, usable as afl-fuzz -i input
+
+    Parameters
+    ----------
+    corpus : Corpus
+    path : string
+        Directory to create
+    digests : list of strings, optional
+        Inputs to export (defaults to the whole corpus)
+    """
+
+    os.makedirs(path, exist_ok=True)
+    if digests is None:
+        digests = corpus.order
+    for i, digest in enumerate(digests):
+        name = os.path.join(path, f"id:{i:06d},orig:{digest}")
+        with open(name, "wb") as f:
+            f.write(corpus.get(digest))
+    return len(digests)
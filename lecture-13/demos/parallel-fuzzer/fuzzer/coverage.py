@@ -0,0 +1,181 @@
+""" Edge coverage from AFL-instrumented targets
+
+Targets built with afl-gcc (see afl-demo/afl-fuzz/fuzz.sh) record edge hit
+counts in a System V shared memory segment whose id they read from the
+__AFL_SHM_ID environment variable. CoverageMap creates that segment, exposes
+it without copying, and tracks which edges and hit-count buckets have been
+seen so far, as afl-fuzz does with its "virgin" map.
+
+NumPy is used for the bitmap operations when it is installed; otherwise the
+same operations are done with bytes.translate and big-integer arithmetic.
+"""
+
+import ctypes
+import ctypes.util
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+MAP_SIZE = 1 << 16
+SHM_ENV_VAR = "__AFL_SHM_ID"
+
+IPC_PRIVATE = 0
+IPC_CREAT = 0o1000
+IPC_EXCL = 0o2000
+IPC_RMID = 0
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+_libc.shmget.restype = ctypes.c_int
+_libc.shmget.argtypes = (ctypes.c_int, ctypes.c_size_t, ctypes.c_int)
+_libc.shmat.restype = ctypes.c_void_p
+_libc.shmat.argtypes = (ctypes.c_int, ctypes.c_void_p, ctypes.c_int)
+_libc.shmdt.restype = ctypes.c_int
+_libc.shmdt.argtypes = (ctypes.c_void_p,)
+_libc.shmctl.restype = ctypes.c_int
+_libc.shmctl.argtypes = (ctypes.c_int, ctypes.c_int, ctypes.c_void_p)
+
+def _bucket(count):
+    """ AFL's hit-count classes: 1, 2, 3, 4-7, 8-15, 16-31, 32-127, 128+ """
+
+    if count == 0:
+        return 0
+    if count <= 3:
+        return 1 << (count - 1)
+    if count <= 7:
+        return 8
+    if count <= 15:
+        return 16
+    if count <= 31:
+        return 32
+    if count <= 127:
+        return 64
+    return 128
+
+COUNT_CLASS = bytes(_bucket(i) for i in range(256))
+
+class CoverageMap:
+    """ Shared-memory edge bitmap for an AFL-instrumented target
+
+    Parameters
+    ----------
+    size : int, optional
+        Bitmap size in bytes; must match the instrumentation (defaults to
+        65536, as in AFL)
+    """
+
+    def __init__(self, size=MAP_SIZE):
+        self.size = size
+        self.shm_id = _libc.shmget(IPC_PRIVATE, size,
+                IPC_CREAT | IPC_EXCL | 0o600)
+        if self.shm_id < 0:
+            raise OSError(ctypes.get_errno(), "shmget failed")
+        addr = _libc.shmat(self.shm_id, None, 0)
+        if addr in (None, ctypes.c_void_p(-1).value):
+            _libc.shmctl(self.shm_id, IPC_RMID, None)
+            raise OSError(ctypes.get_errno(), "shmat failed")
+        self.addr = addr
+        # Mark the segment for removal now; it persists until the last
+        # process detaches, so it can't leak if we are killed
+        _libc.shmctl(self.shm_id, IPC_RMID, None)
+
+        self._raw = (ctypes.c_uint8 * size).from_address(addr)
+        if np is not None:
+            # Zero-copy view of the target's trace bits
+            self.trace = np.ctypeslib.as_array(self._raw)
+            self.virgin = np.full(size, 0xff, dtype=np.uint8)
+            self._classes = np.frombuffer(COUNT_CLASS, dtype=np.uint8)
+        else:
+            self.trace = memoryview(self._raw).cast("B")
+            self.virgin = (1 << (8*size)) - 1
+        self.edges_seen = 0
+
+    def env(self):
+        """ Environment variables that point instrumented targets here """
+
+        return {SHM_ENV_VAR: str(self.shm_id)}
+
+    def clear(self):
+        """ Zero the trace bits before a run """
+
+        ctypes.memset(self.addr, 0, self.size)
+
+    def classify(self):
+        """ Return the current trace with hit counts bucketed
+
+        The result is a NumPy array when NumPy is available, and bytes
+        otherwise.
+        """
+
+        if np is not None:
+            return self._classes[self.trace]
+        return bytes(self.trace).translate(COUNT_CLASS)
+
+    def signature(self, classified=None):
+        """ Return a hashable summary of the trace
+
+        The signature is the set of (edge, hit-count bucket) pairs that the
+        run reached, encoded as edge*256 + bucket, which is what afl-showmap
+        reports and afl-cmin minimises over.
+        """
+
+        if classified is None:
+            classified = self.classify()
+        if np is not None:
+            hit = np.flatnonzero(classified)
+            return frozenset((hit*256 + classified[hit]).tolist())
+        return frozenset(i*256 + c for i, c in enumerate(classified) if c)
+
+    def has_new_bits(self, classified=None):
+        """ Check the last run for unseen edges or hit-count buckets
+
+        Updates the virgin map, so each new behaviour is reported once.
+
+        Returns
+        -------
+        0 if nothing new, 1 if only new hit counts, 2 if new edges
+        """
+
+        if classified is None:
+            classified = self.classify()
+        if np is not None:
+            hit = np.flatnonzero(classified)
+            if hit.size == 0:
+                return 0
+            cls = classified[hit]
+            virgin = self.virgin[hit]
+            new = cls & virgin
+            if not new.any():
+                return 0
+            result = 2 if (virgin[new != 0] == 0xff).any() else 1
+            self.virgin[hit] = virgin & ~cls
+        else:
+            cls = int.from_bytes(classified, "little")
+            new = cls & self.virgin
+            if not new:
+                return 0
+            # An edge is new if its byte of the virgin map is still all ones
+            fresh = bytes(v for n, v in zip(
+                new.to_bytes(self.size, "little"),
+                self.virgin.to_bytes(self.size, "little")) if n)
+            result = 2 if 0xff in fresh else 1
+            self.virgin &= ~cls
+        if result == 2:
+            self.edges_seen = self.count_edges()
+        return result
+
+    def count_edges(self):
+        """ Number of edges seen so far """
+
+        if np is not None:
+            return int(np.count_nonzero(self.virgin != 0xff))
+        v = self.virgin.to_bytes(self.size, "little")
+        return self.size - v.count(0xff)
+
+    def close(self):
+        if self.addr is not None:
+            self.trace = None
+            self._raw = None
+            _libc.shmdt(self.addr)
+            self.addr = None
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+""" Bucket existing crashing inputs by crash location
+
+Runs the target under ptrace on every file in the given directories, for
+example an old crash directory or the crashes directory of an afl-fuzz run,
+and keeps the smallest input in each bucket (see triage.py).
+
+Example usage of this script is:
+    ./dedup.py -i ../../afl-demo/afl-fuzz/outputs/crashes -o buckets \
+        ../../afl-demo/program/program
+"""
+
+import argparse
+import os
+
+from triage import CrashBuckets, triage
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Deduplicate crashes')
+    parser.add_argument('target', nargs='+',
+            help='Target program and its arguments')
+    parser.add_argument('-i', '--input', action='append', required=True,
+            help='Directory of crashing inputs (repeatable)')
+    parser.add_argument('-o', '--output', default='buckets', type=str,
+            help='Directory for the smallest input per bucket')
+    parser.add_argument('-t', '--timeout', default=5.0, type=float,
+            help='Seconds to wait for each run')
+    args = parser.parse_args()
+
+    buckets = CrashBuckets(args.output)
+    total = 0
+    not_reproduced = []
+    for directory in args.input:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            # Skip AFL's README.txt and our own bucket descriptions
+            if name.startswith(".") or name.endswith(".txt") or \
+                    not os.path.isfile(path):
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            total += 1
+            info = triage(args.target, data, timeout=args.timeout)
+            if info is None:
+                not_reproduced.append(path)
+                continue
+            buckets.add(info, data, path)
+
+    print(f"{total} inputs, {len(buckets.counts)} buckets, "
+            f"{len(not_reproduced)} did not crash")
+    for line in buckets.summary():
+        print(line)
+    for path in not_reproduced:
+        print(f"did not crash: {path}")
@@ -0,0 +1,306 @@
+""" Extract magic values from a target binary into a token dictionary
+
+Random bytes essentially never contain a 4-byte magic number, but the target
+has to keep it somewhere in order to check it. Three places are searched:
+
+    strings     short printable strings in .rodata
+    compares    immediate operands of x86-64 cmp instructions in .text, which
+                is how compilers inline a comparison against a constant; runs
+                of byte compares close together, such as the afl-demo
+                program's check of "MAGC" one character at a time, are
+                joined into one token
+    memcmp      constant arguments of calls to memcmp, strcmp, strncmp, and
+                friends through the PLT, cut to the length argument when it
+                is a constant
+
+The ELF file is parsed directly with struct, and instructions are found by
+scanning for the handful of opcodes involved rather than by disassembling, so
+some tokens are false positives. That costs the mutators a little time, and
+nothing else.
+
+Dictionaries are read and written in afl-fuzz's -x format, so the same file
+can be given to both fuzzers.
+"""
+
+import re
+import struct
+
+# Functions whose second argument is compared with the first
+COMPARE_FUNCTIONS = {"memcmp", "bcmp", "strcmp", "strncmp", "strcasecmp",
+        "strncasecmp", "strstr"}
+
+MIN_STRING = 3
+MAX_TOKEN = 32
+
+# How far before a call to look for the instructions that load its
+# arguments, and the largest gap between byte compares joined into a token
+ARGUMENT_WINDOW = 48
+BYTE_COMPARE_GAP = 16
+
+_PRINTABLE = re.compile(rb"[\x20-\x7e]{%d,}" % MIN_STRING)
+
+class ElfFile:
+    """ Sections and PLT symbols of a 64-bit little-endian ELF file
+
+    Parameters
+    ----------
+    path : string
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        if self.data[:4] != b"\x7fELF" or self.data[4] != 2 or \
+                self.data[5] != 1:
+            raise ValueError(f"{path} is not a 64-bit little-endian ELF file")
+
+        shoff, = struct.unpack_from("<Q", self.data, 0x28)
+        shentsize, shnum, shstrndx = struct.unpack_from("<HHH", self.data,
+                0x3a)
+        headers = [struct.unpack_from("<IIQQQQIIQQ", self.data,
+            shoff + i*shentsize) for i in range(shnum)]
+        names = headers[shstrndx]
+        self.sections = {}
+        for h in headers:
+            name_off = names[4] + h[0]
+            name = self.data[name_off:self.data.index(b"\0", name_off)]
+            # (address, file offset, size, link, entry size)
+            self.sections[name.decode()] = (h[3], h[4], h[5], h[6], h[9])
+
+    def section(self, name):
+        """ Return (address, bytes) for a section, or (0, b"") if missing """
+
+        if name not in self.sections:
+            return 0, b""
+        addr, offset, size, _, _ = self.sections[name]
+        return addr, self.data[offset:offset + size]
+
+    def read(self, addr, size):
+        """ Read size bytes at a virtual address in any loaded section """
+
+        for s_addr, offset, s_size, _, _ in self.sections.values():
+            if s_addr and s_addr <= addr < s_addr + s_size:
+                start = offset + addr - s_addr
+                return self.data[start:start + min(size,
+                    s_addr + s_size - addr)]
+        return b""
+
+    def plt_symbols(self):
+        """ Map PLT stub addresses to the names of the functions they call """
+
+        if ".rela.plt" not in self.sections:
+            return {}
+        _, rela = self.section(".rela.plt")
+        _, dynsym = self.section(".dynsym")
+        _, dynstr = self.section(".dynstr")
+        got = {}
+        for i in range(0, len(rela) - 23, 24):
+            r_offset, r_info, _ = struct.unpack_from("<QQq", rela, i)
+            sym = r_info >> 32
+            st_name, = struct.unpack_from("<I", dynsym, sym*24)
+            got[r_offset] = dynstr[st_name:dynstr.index(b"\0",
+                st_name)].decode()
+
+        # Each stub is an indirect jump through the GOT slot, optionally
+        # after endbr64 and with a bnd prefix
+        stubs = {}
+        for name in (".plt.sec", ".plt"):
+            addr, code = self.section(name)
+            for m in re.finditer(rb"\xff\x25", code):
+                disp, = struct.unpack_from("<i", code, m.end()) \
+                        if m.end() + 4 <= len(code) else (None,)
+                if disp is None:
+                    continue
+                target = addr + m.end() + 4 + disp
+                if target in got:
+                    start = m.start()
+                    if code[max(start - 1, 0):start] == b"\xf2":
+                        start -= 1
+                    if code[max(start - 4, 0):start] == b"\xf3\x0f\x1e\xfa":
+                        start -= 4
+                    stubs[addr + start] = got[target]
+        return stubs
+
+def rodata_strings(elf):
+    """ Short printable strings from .rodata, without format strings """
+
+    _, rodata = elf.section(".rodata")
+    tokens = []
+    for m in _PRINTABLE.finditer(rodata):
+        s = m.group().strip()
+        if MIN_STRING <= len(s) <= MAX_TOKEN and b"%" not in s:
+            tokens.append(s)
+    return tokens
+
+def compare_immediates(elf):
+    """ Immediates of cmp instructions with multi-byte constants
+
+    Matches cmp eax/rax, imm32 (3d), cmp r/m32, imm32 (81 /7), and the 16-bit
+    forms with a 66 prefix. Operands are returned in memory byte order,
+    which is the order they have in the input.
+    """
+
+    _, text = elf.section(".text")
+    tokens = []
+    for m in re.finditer(rb"(\x66)?[\x40-\x4f]?(\x3d|\x81)", text, re.S):
+        width = 2 if m.group(1) else 4
+        pos = m.end()
+        if m.group(2) == b"\x81":
+            if pos >= len(text):
+                continue
+            modrm = text[pos]
+            if (modrm >> 3) & 7 != 7:
+                continue
+            pos += 1 + _modrm_extra(text, pos)
+        imm = text[pos:pos + width]
+        if len(imm) < width:
+            continue
+        # Small constants and masks are loop bounds and flags, not magic
+        nonzero = sum(1 for b in imm if b not in (0x00, 0xff))
+        if nonzero >= width - 1 and nonzero >= 2:
+            tokens.append(imm)
+    return tokens
+
+def byte_compares(elf):
+    """ Immediates of 8-bit cmp instructions, joined into runs
+
+    Matches cmp al, imm8 (3c) and cmp r/m8, imm8 (80 /7). Each distinct byte
+    is a token of its own, except 0x00, 0x01, and 0xff, and so is every run
+    of two or more compares no more than BYTE_COMPARE_GAP bytes apart.
+    """
+
+    _, text = elf.section(".text")
+    compares = []
+    for m in re.finditer(rb"\x3c|\x80", text):
+        pos = m.end()
+        if m.group() == b"\x80":
+            if pos >= len(text) or (text[pos] >> 3) & 7 != 7:
+                continue
+            pos += 1 + _modrm_extra(text, pos)
+        if pos < len(text):
+            compares.append((pos, text[pos]))
+
+    tokens = []
+    run = []
+    for pos, value in compares + [(None, None)]:
+        if run and (pos is None or pos - run[-1][0] > BYTE_COMPARE_GAP):
+            if len(run) >= 2:
+                tokens.append(bytes(v for _, v in run))
+            run = []
+        if pos is not None:
+            run.append((pos, value))
+    singles = {v for _, v in compares if v not in (0x00, 0x01, 0xff)}
+    return tokens + [bytes([v]) for v in sorted(singles)]
+
+def _modrm_extra(code, pos):
+    """ Number of SIB and displacement bytes after the ModRM byte at pos """
+
+    modrm = code[pos]
+    mod, rm = modrm >> 6, modrm & 7
+    if mod == 3:
+        return 0
+    extra = 0
+    if rm == 4:
+        extra += 1
+        if mod == 0 and pos + 1 < len(code) and code[pos + 1] & 7 == 5:
+            extra += 4
+    if mod == 0 and rm == 5:
+        extra += 4
+    elif mod == 1:
+        extra += 1
+    elif mod == 2:
+        extra += 4
+    return extra
+
+def compare_arguments(elf):
+    """ Constant arguments to memcmp and similar functions
+
+    For each call to one of COMPARE_FUNCTIONS through the PLT, a
+    RIP-relative lea shortly before it gives the constant's address, and a
+    mov of an immediate into edx gives memcmp's length.
+    """
+
+    stubs = {addr: name for addr, name in elf.plt_symbols().items()
+            if name in COMPARE_FUNCTIONS}
+    if not stubs:
+        return []
+    text_addr, text = elf.section(".text")
+    tokens = []
+    for m in re.finditer(rb"\xe8", text):
+        if m.end() + 4 > len(text):
+            continue
+        disp, = struct.unpack_from("<i", text, m.end())
+        call_end = text_addr + m.end() + 4
+        if call_end + disp not in stubs:
+            continue
+        window = text[max(m.start() - ARGUMENT_WINDOW, 0):m.start()]
+        window_addr = text_addr + max(m.start() - ARGUMENT_WINDOW, 0)
+
+        length = None
+        for n in re.finditer(rb"\xba(.{4})", window, re.S):
+            length, = struct.unpack("<I", n.group(1))
+        for n in re.finditer(rb"[\x48\x4c]\x8d([\x05\x0d\x15\x1d\x25\x2d"
+                rb"\x35\x3d])(.{4})", window, re.S):
+            disp, = struct.unpack("<i", n.group(2))
+            addr = window_addr + n.end() + disp
+            if length is not None and 0 < length <= MAX_TOKEN:
+                value = elf.read(addr, length)
+            else:
+                value = elf.read(addr, MAX_TOKEN + 1).split(b"\0")[0]
+            if 0 < len(value) <= MAX_TOKEN:
+                tokens.append(value)
+    return tokens
+
+def extract(path):
+    """ Extract a token dictionary from the binary at path
+
+    Returns
+    -------
+    list of bytes, without duplicates, most specific sources first
+    """
+
+    elf = ElfFile(path)
+    tokens = compare_arguments(elf) + compare_immediates(elf) + \
+            byte_compares(elf) + rodata_strings(elf)
+    return list(dict.fromkeys(tokens))
+
+def _escape(token):
+    return "".join(chr(b) if 0x20 <= b < 0x7f and b not in b'"\\'
+            else f"\\x{b:02x}" for b in token)
+
+def save(tokens, path):
+    """ Write tokens in afl-fuzz -x dictionary format """
+
+    with open(path, "w") as f:
+        for i, token in enumerate(tokens):
+            f.write(f'token_{i}="{_escape(token)}"\n')
+
+def load(path):
+    """ Read an afl-fuzz -x dictionary
+
+    Returns
+    -------
+    list of bytes
+    """
+
+    tokens = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            value = line[line.index('"') + 1:line.rindex('"')]
+            token = bytearray()
+            i = 0
+            while i < len(value):
+                if value[i] == "\\" and value[i + 1] == "x":
+                    token.append(int(value[i + 2:i + 4], 16))
+                    i += 4
+                elif value[i] == "\\":
+                    token.append(ord(value[i + 1]))
+                    i += 2
+                else:
+                    token.append(ord(value[i]))
+                    i += 1
+            tokens.append(bytes(token))
+    return tokens
@@ -0,0 +1,271 @@
+""" Execution back ends for running a target on a single test case
+
+Every executor has a run(data, timeout=None) method that runs the target with
+data on its standard input and returns an ExecResult, and a close() method
+that releases any resources the executor holds. A run that exceeds the
+timeout is killed and reported with hang set.
+
+Executors also take a Limits, applied with setrlimit in the target before it
+starts, so that a runaway target hits a memory or CPU cap rather than taking
+the machine down with it.
+"""
+
+import collections
+import math
+import os
+import resource
+import select
+import signal
+import subprocess
+
+# returncode follows the subprocess convention: negative values are the
+# number of the signal that terminated the target
+# output is the target's stdout and stderr, if capture was requested
+ExecResult = collections.namedtuple("ExecResult",
+        ["returncode", "hang", "output"], defaults=(False, None))
+
+def crashed(result):
+    """ True if the target was terminated by a signal, other than by us or
+    by running out of CPU time """
+
+    return result.returncode < 0 and not result.hang and \
+            result.returncode != -signal.SIGXCPU
+
+Limits = collections.namedtuple("Limits", ["memory", "cpu"],
+        defaults=(0, 0))
+Limits.__doc__ = """ Resource limits for the target
+
+memory : int
+    Address space limit in megabytes (0 for none)
+cpu : int
+    CPU time limit in seconds (0 for none); a backstop for the timeout
+"""
+
+def apply_limits(limits):
+    """ Set limits on the current process, for use as a preexec_fn """
+
+    # Crashes are triaged with ptrace, so core dumps are only a cost
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+    if limits.memory:
+        size = limits.memory << 20
+        resource.setrlimit(resource.RLIMIT_AS, (size, size))
+    if limits.cpu:
+        # SIGXCPU at the soft limit, and SIGKILL at the hard limit for a
+        # target that handles or ignores it
+        resource.setrlimit(resource.RLIMIT_CPU, (limits.cpu, limits.cpu + 1))
+
+def finished(returncode, limits, output=None):
+    """ ExecResult of a run that ended without being killed by us
+
+    A target that runs out of CPU time is stuck rather than crashed, so the
+    signals of the CPU limit are reported as a hang: SIGXCPU, and SIGKILL
+    when there is a CPU limit, since nothing else here sends it.
+    """
+
+    hang = returncode == -signal.SIGXCPU or \
+            bool(limits.cpu) and returncode == -signal.SIGKILL
+    return ExecResult(returncode, hang, output)
+
+class AdaptiveTimeout:
+    """ Per-execution timeout calibrated from observed run times
+
+    The timeout is a multiple of a high percentile of recent run times, so
+    that it follows the target as the inputs change, clamped between a
+    floor (process creation alone has some jitter) and the hang threshold.
+    Until enough runs have been seen the hang threshold is used.
+
+    Parameters
+    ----------
+    maximum : float
+        Hang threshold in seconds; runs that take longer are hangs
+    minimum : float, optional
+        Smallest timeout in seconds
+    multiplier : float, optional
+    window : int, optional
+        Number of recent run times considered
+    """
+
+    PERCENTILE = 0.95
+
+    def __init__(self, maximum, minimum=0.05, multiplier=5.0, window=256):
+        self.maximum = maximum
+        self.minimum = min(minimum, maximum)
+        self.multiplier = multiplier
+        self.times = collections.deque(maxlen=window)
+        self.value = maximum
+        self.count = 0
+
+    def observe(self, duration):
+        """ Record the duration of a run that finished in time """
+
+        self.times.append(duration)
+        self.count += 1
+        # Sorting the window is cheap next to a run, but not free
+        if self.count % 64 == 0 or self.count == 16:
+            ordered = sorted(self.times)
+            p = ordered[min(len(ordered) - 1,
+                math.ceil(self.PERCENTILE*len(ordered)) - 1)]
+            self.value = min(max(self.multiplier*p, self.minimum),
+                    self.maximum)
+
+class SubprocessExecutor:
+    """ Run the target with subprocess.run, as the lecture fuzzers do
+
+    Parameters
+    ----------
+    argv : list of strings
+        Target program and its arguments
+    env : dict, optional
+        Extra environment variables for the target
+    limits : Limits, optional
+    capture : bool, optional
+        Return stdout and stderr in ExecResult.output
+    """
+
+    def __init__(self, argv, env=None, limits=Limits(), capture=False):
+        self.argv = argv
+        self.env = dict(os.environ, **env) if env else None
+        self.limits = limits
+        self.capture = capture
+
+    def run(self, data, timeout=None):
+        try:
+            complete = subprocess.run(self.argv, input=data, shell=False,
+                    capture_output=True, env=self.env, timeout=timeout,
+                    preexec_fn=lambda: apply_limits(self.limits))
+        except subprocess.TimeoutExpired:
+            # subprocess.run has already killed and reaped the target
+            return ExecResult(-signal.SIGKILL, hang=True)
+        if self.capture:
+            return finished(complete.returncode, self.limits,
+                    complete.stdout + complete.stderr)
+        return finished(complete.returncode, self.limits)
+
+    def close(self):
+        pass
+
+class MemfdExecutor:
+    """ Run the target with its input in a memfd and its output discarded
+
+    subprocess.run sets up three pipes, a thread to feed and drain them, and
+    copies all of the target's output back into Python, when only the exit
+    status is needed. Here the input is written to one memfd that is reused
+    for every run and passed as the target's stdin, stdout and stderr go to
+    /dev/null, and the target is started with posix_spawn (vfork and exec in
+    glibc) and waited for on a pidfd.
+
+    posix_spawn can't run setrlimit in the child, so when memory or CPU
+    limits are set the target is started with fork and exec instead.
+
+    Parameters
+    ----------
+    argv : list of strings
+        Target program and its arguments
+    env : dict, optional
+        Extra environment variables for the target
+    limits : Limits, optional
+    capture : bool or "stderr", optional
+        Collect stdout and stderr into ExecResult.output, or only stderr
+    """
+
+    def __init__(self, argv, env=None, limits=Limits(), capture=False):
+        self.argv = argv
+        self.env = dict(os.environ, **(env or {}))
+        self.limits = limits
+        self.capture = capture
+        self.input = os.memfd_create("fuzz-input")
+        self.devnull = os.open(os.devnull, os.O_WRONLY)
+        self.output = os.memfd_create("fuzz-output") if capture else None
+        # Children inherit this, which is all apply_limits would do without
+        # memory or CPU limits
+        resource.setrlimit(resource.RLIMIT_CORE,
+                (0, resource.getrlimit(resource.RLIMIT_CORE)[1]))
+
+    def _spawn(self):
+        err = self.output if self.capture else self.devnull
+        out = self.devnull if self.capture == "stderr" else err
+        if not (self.limits.memory or self.limits.cpu):
+            return os.posix_spawnp(self.argv[0], self.argv, self.env,
+                    file_actions=[(os.POSIX_SPAWN_DUP2, self.input, 0),
+                        (os.POSIX_SPAWN_DUP2, out, 1),
+                        (os.POSIX_SPAWN_DUP2, err, 2)])
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.dup2(self.input, 0)
+                os.dup2(out, 1)
+                os.dup2(err, 2)
+                apply_limits(self.limits)
+                os.execvpe(self.argv[0], self.argv, self.env)
+            finally:
+                os._exit(127)
+        return pid
+
+    def run(self, data, timeout=None):
+        os.ftruncate(self.input, 0)
+        os.pwrite(self.input, data, 0)
+        # The child shares this file offset
+        os.lseek(self.input, 0, os.SEEK_SET)
+        if self.capture:
+            os.ftruncate(self.output, 0)
+            os.lseek(self.output, 0, os.SEEK_SET)
+
+        pid = self._spawn()
+        hang = False
+        if timeout is not None:
+            pidfd = os.pidfd_open(pid)
+            try:
+                ready, _, _ = select.select([pidfd], [], [], timeout)
+            finally:
+                os.close(pidfd)
+            if not ready:
+                os.kill(pid, signal.SIGKILL)
+                hang = True
+        _, status = os.waitpid(pid, 0)
+
+        output = None
+        if self.capture:
+            output = os.pread(self.output, os.fstat(self.output).st_size, 0)
+        if hang:
+            return ExecResult(-signal.SIGKILL, True, output)
+        return finished(os.waitstatus_to_exitcode(status), self.limits, output)
+
+    def close(self):
+        os.close(self.input)
+        os.close(self.devnull)
+        if self.output is not None:
+            os.close(self.output)
+
+# Executors that run the target program itself, rather than a harness library
+# built from its source (see inprocess.py)
+PROGRAM_EXECUTORS = ("memfd", "subprocess", "forkserver")
+EXECUTORS = PROGRAM_EXECUTORS + ("inprocess", "inprocess-fork")
+
+def make_executor(options, env=None, capture=False):
+    """ Create the executor selected by options.executor for options.target
+
+    Parameters
+    ----------
+    options : argparse.Namespace
+        Limits are taken from options.memory and options.cpu if present, and
+        the library for the inprocess executors from options.harness
+    env : dict, optional
+        Extra environment variables for the target
+    capture : bool, optional
+        Collect the target's output, where the executor can; the fork-server
+        can't, and leaves ExecResult.output as None
+    """
+
+    limits = Limits(getattr(options, "memory", 0), getattr(options, "cpu", 0))
+    if options.executor.startswith("inprocess"):
+        from inprocess import InProcessExecutor
+        return InProcessExecutor(options.harness,
+                fork=options.executor == "inprocess-fork", limits=limits)
+    if options.executor == "forkserver":
+        from forkserver import ForkServerExecutor
+        return ForkServerExecutor(options.target, env=env, limits=limits)
+    if options.executor == "memfd":
+        return MemfdExecutor(options.target, env=env, limits=limits,
+                capture=capture)
+    return SubprocessExecutor(options.target, env=env, limits=limits,
+            capture=capture)
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+
+""" Write a token dictionary extracted from a target binary
+
+The dictionary is in afl-fuzz -x format, so it can be used by fuzzer.py -x
+and by afl-fuzz alike (see dictionary.py for what is extracted).
+
+Example usage of this script is:
+    ./extract_dict.py -o program.dict ../../generational-fuzzer/program/program
+    ./fuzzer.py -x program.dict ../../generational-fuzzer/program/program
+"""
+
+import argparse
+
+import dictionary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Extract a dictionary')
+    parser.add_argument('target', help='Target binary')
+    parser.add_argument('-o', '--output', default=None, type=str,
+            help='Dictionary file (defaults to printing the tokens)')
+    args = parser.parse_args()
+
+    tokens = dictionary.extract(args.target)
+    if args.output:
+        dictionary.save(tokens, args.output)
+        print(f"{len(tokens)} tokens written to {args.output}")
+    else:
+        for token in tokens:
+            print(token)
@@ -0,0 +1,139 @@
+""" Fork-server executor
+
+Starts the target once under the LD_PRELOAD shim in ../forkserver, which
+stops it just before main. Each test case is then run in a fresh fork() of
+that process, avoiding the fork, exec, dynamic loading, and libc startup that
+subprocess.run pays for every input. See forkserver.c for the protocol.
+
+Only dynamically linked targets can be used, since the shim is injected with
+LD_PRELOAD.
+"""
+
+import os
+import select
+import signal
+import struct
+import subprocess
+import tempfile
+
+from execute import ExecResult, Limits, apply_limits, finished
+
+FORKSRV_HELLO = 0x46535256
+WORD = struct.Struct("=I")
+
+DEFAULT_SHIM = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "..", "forkserver", "forkserver.so")
+
+def returncode_from_status(status):
+    """ Convert a wait status to a subprocess-style returncode """
+
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+class ForkServerError(RuntimeError):
+    pass
+
+class ForkServerExecutor:
+    """ Run test cases through a fork-server
+
+    Parameters
+    ----------
+    argv : list of strings
+        Target program and its arguments
+    shim : string, optional
+        Path to forkserver.so (defaults to the copy built in ../forkserver)
+    env : dict, optional
+        Extra environment variables for the target
+    limits : execute.Limits, optional
+        Applied to the fork-server, and inherited by every test case
+    """
+
+    def __init__(self, argv, shim=DEFAULT_SHIM, env=None, limits=Limits()):
+        if not os.path.exists(shim):
+            raise ForkServerError(f"{shim} not found; run make in "
+                    f"{os.path.dirname(shim)}")
+        self.argv = argv
+        self.limits = limits
+
+        # The test case lives in an unlinked temporary file that is the
+        # fork-server's stdin. Every child inherits the same open file
+        # description, so rewinding it here rewinds it for the next child.
+        self.input = tempfile.TemporaryFile()
+        self.input_fd = self.input.fileno()
+
+        ctl_r, self.ctl_w = os.pipe()
+        self.st_r, st_w = os.pipe()
+        env = dict(os.environ, **(env or {}))
+        env["FORKSRV_FDS"] = f"{ctl_r},{st_w}"
+        env["LD_PRELOAD"] = os.path.abspath(shim)
+        self.proc = subprocess.Popen(argv, stdin=self.input,
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                pass_fds=(ctl_r, st_w), env=env,
+                preexec_fn=lambda: apply_limits(limits))
+        os.close(ctl_r)
+        os.close(st_w)
+
+        hello = self._read_word()
+        if hello != FORKSRV_HELLO:
+            raise ForkServerError("Fork-server handshake failed; is the "
+                    "target dynamically linked?")
+
+    def _read_word(self):
+        buf = b""
+        while len(buf) < WORD.size:
+            chunk = os.read(self.st_r, WORD.size - len(buf))
+            if not chunk:
+                raise ForkServerError("Fork-server exited")
+            buf += chunk
+        return WORD.unpack(buf)[0]
+
+    def write_input(self, data):
+        """ Replace the contents of the shared stdin file with data """
+
+        os.ftruncate(self.input_fd, 0)
+        os.pwrite(self.input_fd, data, 0)
+        os.lseek(self.input_fd, 0, os.SEEK_SET)
+
+    def start(self, data):
+        """ Start one test case and return the child's pid """
+
+        self.write_input(data)
+        os.write(self.ctl_w, WORD.pack(0))
+        return self._read_word()
+
+    def wait(self, pid=None, timeout=None):
+        """ Wait for the running test case and return its wait status
+
+        If timeout (in seconds) expires first, the test case with the given
+        pid is killed, and None is returned once the fork-server has reaped
+        it.
+        """
+
+        if timeout is not None:
+            ready, _, _ = select.select([self.st_r], [], [], timeout)
+            if not ready:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+                self._read_word()
+                return None
+        return self._read_word()
+
+    def run(self, data, timeout=None):
+        pid = self.start(data)
+        status = self.wait(pid, timeout)
+        if status is None:
+            return ExecResult(-signal.SIGKILL, hang=True)
+        return finished(returncode_from_status(status), self.limits)
+
+    def close(self):
+        # Closing the control pipe makes the fork-server exit
+        try:
+            os.close(self.ctl_w)
+        except OSError:
+            pass
+        self.proc.wait()
+        os.close(self.st_r)
+        self.input.close()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+
+""" Parallel driver for the lecture-13 fuzzers
+
+Runs the random or generational strategy from the single-process fuzzers,
+generation from a declarative input grammar (see grammar.py), or
+coverage-guided mutation of AFL-instrumented targets, in N worker processes,
+each with an independent seed, and merges their crash reports and
+statistics. Crashes are grouped into buckets by signal and crash location,
+and the smallest input in each bucket is saved to crashes/ in the output
+directory. Inputs that make the target hang are saved to hangs/. Statistics
+are shown on a status line and written to fuzzer_stats there, and each
+worker's last few inputs are written to recent/ at the end. The seed and
+iteration of every crash and hang are logged to cases.log, from which
+replay.py can regenerate them.
+
+Example usages of this script are:
+
+Fuzz the random-fuzzer program on every core until Ctrl-C:
+    ./fuzzer.py ../../random-fuzzer/program/program
+
+Fuzz the generational-fuzzer program on 8 cores for a minute:
+    ./fuzzer.py -s generational -j 8 -d 60 ../../generational-fuzzer/program/program
+
+Generate inputs for the afl-demo program, including its special byte, from
+its grammar:
+    ./fuzzer.py -s grammar -g afl-demo ../../afl-demo/program/program
+
+Find the generational-fuzzer program's magic number without being told it,
+by extracting a dictionary from the binary:
+    ./fuzzer.py --auto-dict ../../generational-fuzzer/program/program
+
+Coverage-guided fuzzing of an AFL-instrumented build of the afl-demo program:
+    afl-gcc -o program_instrumented ../../afl-demo/program/program.c
+    ./fuzzer.py -s coverage ./program_instrumented
+
+Keep the corpus between runs, then minimise it and export it for afl-fuzz:
+    ./fuzzer.py -s coverage -c corpus -d 600 ./program_instrumented
+    ./cmin.py -c corpus --export-afl afl-inputs ./program_instrumented
+
+Fuzz with a fixed base seed, then regenerate and re-run the logged crashes:
+    ./fuzzer.py --seed 7 -d 60 ../../random-fuzzer/program/program
+    ./replay.py -c findings -n 0-9
+
+Catch the generational-fuzzer program's buffer overflows that don't crash it,
+with AddressSanitizer:
+    (cd ../../generational-fuzzer/program && make program_asan)
+    ./fuzzer.py -s generational \
+        --sanitized ../../generational-fuzzer/program/program_asan \
+        ../../generational-fuzzer/program/program
+
+Use the fork-server to skip exec and libc startup on every test case:
+    (cd ../forkserver && make)
+    ./fuzzer.py -e forkserver ../../random-fuzzer/program/program
+
+Call the program's main in-process, without creating a process per test case
+(crashes are still triaged by running the program itself):
+    (cd ../harness && make)
+    ./fuzzer.py -e inprocess --harness ../harness/random.so \
+        ../../random-fuzzer/program/program
+"""
+
+import argparse
+import os
+import random
+
+from execute import EXECUTORS
+from grammar import SPECS
+from parallel import Campaign
+from strategies import STRATEGIES
+
+def parse_args(args=None):
+    parser = argparse.ArgumentParser(description='Parallel fuzzer')
+    parser.add_argument('target', nargs='+',
+            help='Target program and its arguments')
+    parser.add_argument('-s', '--strategy', default='random',
+            choices=sorted(STRATEGIES), help='Input generation strategy')
+    parser.add_argument('-g', '--grammar', default='generational',
+            choices=sorted(SPECS), help='Input grammar for the grammar strategy')
+    parser.add_argument('-x', '--dictionary', action='append', default=[],
+            help='Token dictionary in afl-fuzz -x format (repeatable)')
+    parser.add_argument('--auto-dict', action='store_true',
+            help='Extract a token dictionary from the target binary')
+    parser.add_argument('-e', '--executor', default='memfd',
+            choices=EXECUTORS,
+            help='How to run the target (forkserver needs ../forkserver '
+            'built, and inprocess --harness)')
+    parser.add_argument('--harness', default=None, type=str,
+            help='Target built as a harness library by ../harness/Makefile, '
+            'for the inprocess executors')
+    parser.add_argument('-j', '--jobs', default=os.cpu_count(), type=int,
+            help='Number of worker processes')
+    parser.add_argument('--seed', default=None, type=int,
+            help='Base seed; worker i uses seed + i (defaults to random)')
+    parser.add_argument('-d', '--duration', default=0, type=float,
+            help='Length of the campaign in seconds (0 = until Ctrl-C)')
+    parser.add_argument('--max-crashes', default=0, type=int,
+            help='Stop after this many crashes (0 = no limit)')
+    parser.add_argument('-i', '--input', default=None, type=str,
+            help='Directory of seed inputs for the coverage strategy')
+    parser.add_argument('-t', '--timeout', default=1.0, type=float,
+            help='Hang threshold in seconds; shorter per-run timeouts are '
+            'calibrated from observed run times')
+    parser.add_argument('-m', '--memory', default=0, type=int,
+            help='Address space limit for the target in MB (0 = none)')
+    parser.add_argument('--cpu', default=0, type=int,
+            help='CPU time limit for the target in seconds (0 = none)')
+    parser.add_argument('--sanitized', default=None, type=str,
+            help='Sanitizer build of the target (make program_asan) to run '
+            'inputs that do something new through')
+    parser.add_argument('--sanitize-all', action='store_true',
+            help='Run every input through the sanitizer build')
+    parser.add_argument('-c', '--corpus', default=None, type=str,
+            help='Directory to keep the coverage corpus in (see cmin.py)')
+    parser.add_argument('-o', '--output', default='findings', type=str,
+            help='Directory for crashes/, hangs/, fuzzer_stats, and recent/')
+    options = parser.parse_args(args)
+    if options.executor.startswith("inprocess") and not options.harness:
+        parser.error(f"the {options.executor} executor needs --harness")
+    if options.seed is None:
+        options.seed = random.getrandbits(32)
+    return options
+
+if __name__ == "__main__":
+    options = parse_args()
+    print(f"Fuzzing {' '.join(options.target)} with {options.jobs} workers "
+            f"using the {options.strategy} strategy, base seed {options.seed}")
+
+    campaign = Campaign(options)
+    campaign.run()
+
+    print("==============================================")
+    print(campaign.status())
+    for worker in range(options.jobs):
+        print(f"worker {worker}: {campaign.stats.get('execs', worker)} execs")
+    for line in campaign.buckets.summary():
+        print(line)
@@ -0,0 +1,195 @@
+""" Declarative input grammars for generational fuzzing
+
+An input format is a list of named fields, each one of:
+    Fixed(value)                constant bytes, such as a magic number
+    Uint(fmt, lo, hi)           random integer packed with struct format fmt
+    Enum(values, fmt, other)    one of a few interesting values, or with
+                                probability other a random one
+    Blob(min_size, max_size)    random bytes
+    Length(field, fmt, ...)     the length of another field's bytes
+
+Grammar compiles the fields into a list of small closures and generates
+inputs in batches. All of a batch's randomness comes from a single
+rng.randbytes call, which the fields consume in turn, so generation costs a
+few slices and int.from_bytes calls per field rather than several calls into
+random.Random.
+
+Formats for the lecture programs are in SPECS; a new target needs only a new
+entry there.
+"""
+
+import struct
+
+class Fixed:
+    def __init__(self, value):
+        self.value = bytes(value)
+
+    def budget(self):
+        return 0
+
+    def compile(self):
+        value = self.value
+        def gen(pool, off):
+            return value, off
+        return gen
+
+class Uint:
+    def __init__(self, fmt="B", lo=0, hi=None):
+        self.packer = struct.Struct("<" + fmt if fmt[0] not in "<>=!@"
+                else fmt)
+        self.lo = lo
+        self.hi = (1 << (8*self.packer.size)) - 1 if hi is None else hi
+
+    def budget(self):
+        return 4
+
+    def compile(self):
+        pack = self.packer.pack
+        lo, span = self.lo, self.hi - self.lo + 1
+        def gen(pool, off):
+            n = int.from_bytes(pool[off:off + 4], "little")
+            return pack(lo + n % span), off + 4
+        return gen
+
+class Enum:
+    def __init__(self, values, fmt="B", other=0.0):
+        self.packer = struct.Struct("<" + fmt if fmt[0] not in "<>=!@"
+                else fmt)
+        self.values = [self.packer.pack(v) for v in values]
+        # Threshold on a random byte for choosing a random value instead
+        self.other = round(256*other)
+
+    def budget(self):
+        return 2 + self.packer.size
+
+    def compile(self):
+        values = self.values
+        other = self.other
+        size = self.packer.size
+        def gen(pool, off):
+            if pool[off] < other:
+                return bytes(pool[off + 2:off + 2 + size]), off + 2 + size
+            return values[pool[off + 1] % len(values)], off + 2 + size
+        return gen
+
+class Blob:
+    def __init__(self, min_size=0, max_size=256):
+        self.min_size = min_size
+        self.max_size = max_size
+
+    def budget(self):
+        return 2 + self.max_size
+
+    def compile(self):
+        lo, span = self.min_size, self.max_size - self.min_size + 1
+        def gen(pool, off):
+            n = lo + int.from_bytes(pool[off:off + 2], "little") % span
+            return bytes(pool[off + 2:off + 2 + n]), off + 2 + n
+        return gen
+
+class Length:
+    """ Length of another field, filled in once that field is generated
+
+    Parameters
+    ----------
+    field : string
+        Name of the field being measured
+    fmt : string, optional
+        struct format of the length
+    adjust : int, optional
+        Added to the length, for formats that count a header too
+    wrong : float, optional
+        Probability of a random length instead, to exercise mismatches
+    """
+
+    def __init__(self, field, fmt="B", adjust=0, wrong=0.0):
+        self.field = field
+        self.packer = struct.Struct("<" + fmt if fmt[0] not in "<>=!@"
+                else fmt)
+        self.adjust = adjust
+        self.wrong = round(256*wrong)
+
+    def budget(self):
+        return 1 + self.packer.size
+
+class Grammar:
+    """ Compiled input format
+
+    Parameters
+    ----------
+    fields : list of (name, field) tuples
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        names = [name for name, _ in fields]
+        self.budget = sum(field.budget() for _, field in fields)
+        self.steps = []
+        self.lengths = []
+        for i, (name, field) in enumerate(fields):
+            if isinstance(field, Length):
+                if field.field not in names:
+                    raise ValueError(f"Length field {name} refers to "
+                            f"unknown field {field.field}")
+                mask = (1 << (8*field.packer.size)) - 1
+                self.lengths.append((i, names.index(field.field),
+                    field.packer.pack, field.adjust, mask, field.wrong,
+                    field.packer.size))
+                self.steps.append(None)
+            else:
+                self.steps.append(field.compile())
+
+    def generate_batch(self, rng, n):
+        """ Generate n inputs from one call to rng
+
+        Returns
+        -------
+        list of bytes
+        """
+
+        pool = memoryview(rng.randbytes(n*self.budget))
+        off = 0
+        steps = self.steps
+        lengths = self.lengths
+        batch = []
+        for _ in range(n):
+            parts = []
+            start = off
+            for step in steps:
+                if step is None:
+                    parts.append(b"")
+                else:
+                    part, off = step(pool, off)
+                    parts.append(part)
+            for i, target, pack, adjust, mask, wrong, size in lengths:
+                if pool[off] < wrong:
+                    parts[i] = bytes(pool[off + 1:off + 1 + size])
+                else:
+                    parts[i] = pack((len(parts[target]) + adjust) & mask)
+                off += 1 + size
+            # Unused budget from short blobs is skipped, so that every
+            # input starts at a fixed offset and inputs don't share bytes
+            off = start + self.budget
+            batch.append(b"".join(parts))
+        return batch
+
+SPECS = {
+    # random-fuzzer/fuzzer.py: random bytes of random length
+    "random": Grammar([
+        ("data", Blob(1, 256)),
+    ]),
+    # generational-fuzzer/fuzzer.py: magic, length, payload
+    "generational": Grammar([
+        ("magic", Fixed(b"MAGC")),
+        ("length", Length("data")),
+        ("data", Blob(1, 255)),
+    ]),
+    # afl-demo/program: as above, plus the special byte that doubles the
+    # payload when it is 0xc8
+    "afl-demo": Grammar([
+        ("magic", Fixed(b"MAGC")),
+        ("length", Length("data", wrong=0.1)),
+        ("special", Enum([0xc8, 0x00, 0xff], other=0.25)),
+        ("data", Blob(0, 255)),
+    ]),
+}
@@ -0,0 +1,215 @@
+""" In-process executor for targets built as harness libraries
+
+The demo programs only read stdin and write a few lines, so nearly all of the
+time subprocess.run spends on a test case goes to creating a process. Built
+as shared libraries with ../harness/Makefile, a program's main becomes a
+function that harness_run calls with the input behind stdin, and a call to
+exit becomes a return.
+
+The library is loaded with ctypes in a server process forked from the
+fuzzer, which runs test cases sent over a pipe and answers with their exit
+status:
+
+    fuzzer -> server   4-byte length, then the input
+    server -> fuzzer   4-byte exit status (persistent mode)
+    server -> fuzzer   pid of the test case's child, then its wait status
+                       (fork mode)
+
+In persistent mode harness_run is called in the server itself, which is
+fastest, but a crash takes the server with it. State the target leaves
+behind, such as static variables, leaked memory, or memory an earlier test
+case corrupted, carries over between test cases, so a crash may be the
+fault of an earlier one and not reproduce on its own. Every crash of the
+persistent server is therefore run again in a fork of a fresh server, and
+reported only if it crashes there too; otherwise the result of that run is
+returned. A fresh persistent server is started for the next test case after
+any crash, hang, or failure of the harness. In fork mode every test case
+runs in a fresh fork of the server instead, made by harness_fork_run in C,
+like the fork-server (see forkserver.py), isolating test cases for the cost
+of fork.
+
+The library's stack layout differs from the program's, so an overflow can
+crash one and not the other. Crashes are still bucketed by running the
+program itself (see triage.py); those that only crash the library end up in
+sigN- buckets with an unknown pc.
+
+Only the memory limit is applied in persistent mode, since a CPU limit would
+count the server's whole lifetime.
+"""
+
+import ctypes
+import os
+import select
+import signal
+import struct
+
+from execute import ExecResult, Limits, apply_limits, finished
+from forkserver import returncode_from_status
+
+WORD = struct.Struct("=i")
+
+DEFAULT_LIBRARIES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+        "..", "harness")
+
+class HarnessError(RuntimeError):
+    pass
+
+def _read_exactly(fd, n):
+    buf = b""
+    while len(buf) < n:
+        chunk = os.read(fd, n - len(buf))
+        if not chunk:
+            return None
+        buf += chunk
+    return buf
+
+def _serve(lib, ctl_fd, st_fd, fork):
+    """ Server loop, run in the forked child """
+
+    devnull = os.open(os.devnull, os.O_RDWR)
+    for fd in (0, 1, 2):
+        os.dup2(devnull, fd)
+    while True:
+        header = _read_exactly(ctl_fd, WORD.size)
+        if header is None:
+            os._exit(0)
+        data = _read_exactly(ctl_fd, WORD.unpack(header)[0])
+        if not fork:
+            os.write(st_fd, WORD.pack(lib.harness_run(data, len(data))))
+            continue
+        pid = lib.harness_fork_run(data, len(data))
+        if pid < 0:
+            os._exit(1)
+        os.write(st_fd, WORD.pack(pid))
+        _, status = os.waitpid(pid, 0)
+        os.write(st_fd, WORD.pack(status))
+
+class InProcessExecutor:
+    """ Run test cases by calling a harness library in a server process
+
+    Parameters
+    ----------
+    library : string
+        Shared library built by ../harness/Makefile
+    fork : bool, optional
+        Run each test case in a fork of the server rather than in the server
+        itself
+    limits : execute.Limits, optional
+    """
+
+    def __init__(self, library, fork=False, limits=Limits()):
+        if not os.path.exists(library):
+            raise HarnessError(f"{library} not found; run make in "
+                    f"{DEFAULT_LIBRARIES}")
+        # Loaded here rather than in the server, so that restarting the
+        # server after a crash doesn't load it again
+        self.lib = ctypes.CDLL(os.path.abspath(library))
+        self.lib.harness_run.argtypes = [ctypes.c_char_p, ctypes.c_size_t]
+        self.lib.harness_run.restype = ctypes.c_int
+        self.lib.harness_fork_run.argtypes = [ctypes.c_char_p,
+                ctypes.c_size_t]
+        self.lib.harness_fork_run.restype = ctypes.c_int
+        self.fork = fork
+        self.limits = limits
+        self.pid = None
+
+    def _start(self, fork):
+        ctl_r, self.ctl_w = os.pipe()
+        self.st_r, st_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(self.ctl_w)
+                os.close(self.st_r)
+                # Test cases in fork mode inherit the CPU limit with a fresh
+                # count of CPU time
+                apply_limits(self.limits if fork
+                        else Limits(self.limits.memory))
+                _serve(self.lib, ctl_r, st_w, fork)
+            finally:
+                os._exit(127)
+        os.close(ctl_r)
+        os.close(st_w)
+        self.pid = pid
+
+    def _stop(self):
+        """ Kill the server and return its wait status """
+
+        try:
+            os.kill(self.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        return self._reap()
+
+    def _reap(self):
+        _, status = os.waitpid(self.pid, 0)
+        os.close(self.ctl_w)
+        os.close(self.st_r)
+        self.pid = None
+        return status
+
+    def _wait(self, timeout):
+        """ Wait for the server to answer; False on timeout """
+
+        if timeout is None:
+            return True
+        ready, _, _ = select.select([self.st_r], [], [], timeout)
+        return bool(ready)
+
+    def _send(self, data):
+        os.write(self.ctl_w, WORD.pack(len(data)) + data)
+
+    def _run_fork(self, data, timeout):
+        self._send(data)
+        child = _read_exactly(self.st_r, WORD.size)
+        if child is None:
+            raise HarnessError("Harness server exited")
+        if not self._wait(timeout):
+            try:
+                os.kill(WORD.unpack(child)[0], signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            _read_exactly(self.st_r, WORD.size)
+            return ExecResult(-signal.SIGKILL, hang=True)
+        status = WORD.unpack(_read_exactly(self.st_r, WORD.size))[0]
+        return finished(returncode_from_status(status), self.limits)
+
+    def _confirm(self, data, timeout):
+        """ Run a crash of the persistent server again in isolation """
+
+        self._start(fork=True)
+        try:
+            return self._run_fork(data, timeout)
+        finally:
+            self.close()
+
+    def run(self, data, timeout=None):
+        if self.pid is None:
+            self._start(self.fork)
+        if self.fork:
+            return self._run_fork(data, timeout)
+
+        self._send(data)
+        if not self._wait(timeout):
+            self._stop()
+            return ExecResult(-signal.SIGKILL, hang=True)
+        answer = _read_exactly(self.st_r, WORD.size)
+        if answer is None:
+            # The test case, or one before it, crashed the server
+            self._reap()
+            return self._confirm(data, timeout)
+        status = WORD.unpack(answer)[0]
+        if status < 0:
+            # harness_run couldn't set up the input, which leaves the server
+            # in a state not worth trusting
+            self._stop()
+            return self._confirm(data, timeout)
+        return ExecResult(status)
+
+    def close(self):
+        if self.pid is not None:
+            # Closing the control pipe makes the server exit
+            os.close(self.ctl_w)
+            os.waitpid(self.pid, 0)
+            os.close(self.st_r)
+            self.pid = None
@@ -0,0 +1,216 @@
+""" Shrink crashing inputs while keeping the same crash bucket
+
+Combines delta debugging (Zeller's ddmin) with passes that know about the
+lecture programs' input format: a fixed magic number, a length byte, and any
+further header bytes, followed by the payload. The header is never split by
+ddmin, and the length byte is rewritten to match the payload whenever bytes
+are removed, so that reductions aren't rejected just because the length no
+longer agrees with the data.
+
+A candidate is accepted only if it still crashes in the original bucket (see
+triage.py), so the minimiser can't wander off to a different bug. Each round
+of candidates is run in parallel on a process pool, and results are cached
+by input.
+"""
+
+import collections
+import multiprocessing
+import os
+
+from triage import triage
+
+Format = collections.namedtuple("Format",
+        ["magic", "length_offset", "header_size"])
+
+FORMATS = {
+    # No structure; ddmin over the whole input
+    "raw": Format(b"", None, 0),
+    # random-fuzzer/program: length byte then data
+    "random": Format(b"", 0, 1),
+    # generational-fuzzer/program: "MAGC", length byte, data
+    "generational": Format(b"MAGC", 4, 5),
+    # afl-demo/program: "MAGC", length byte, special byte, data
+    "afl-demo": Format(b"MAGC", 4, 6),
+}
+
+# Byte that payload bytes are simplified to, as in afl-tmin
+CANONICAL_BYTE = ord("0")
+
+_oracle = None
+
+def _init_worker(argv, bucket, env, timeout):
+    global _oracle
+    _oracle = (argv, bucket, env, timeout)
+
+def _in_bucket(data):
+    argv, bucket, env, timeout = _oracle
+    info = triage(argv, data, env, timeout)
+    return info is not None and info.bucket == bucket
+
+class Minimiser:
+    """ Parallel test-case minimiser for one crash bucket
+
+    Parameters
+    ----------
+    argv : list of strings
+        Target program and its arguments
+    bucket : string
+        Crash bucket that candidates must stay in
+    fmt : Format, optional
+        Input format (defaults to FORMATS["raw"])
+    jobs : int, optional
+        Number of worker processes (defaults to the number of CPUs)
+    env : dict, optional
+        Extra environment variables for the target
+    timeout : float, optional
+        Seconds to allow each run
+    """
+
+    def __init__(self, argv, bucket, fmt=FORMATS["raw"], jobs=None, env=None,
+            timeout=5.0):
+        self.fmt = fmt
+        self.jobs = jobs or os.cpu_count()
+        self.cache = {}
+        self.execs = 0
+        ctx = multiprocessing.get_context("fork")
+        self.pool = ctx.Pool(self.jobs, _init_worker,
+                (argv, bucket, env, timeout))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def test(self, candidates):
+        """ Run candidates in parallel
+
+        Returns
+        -------
+        list of bools, True where the candidate is still in the bucket
+        """
+
+        todo = [c for c in dict.fromkeys(candidates) if c not in self.cache]
+        if todo:
+            self.execs += len(todo)
+            for c, ok in zip(todo, self.pool.map(_in_bucket, todo)):
+                self.cache[c] = ok
+        return [self.cache[c] for c in candidates]
+
+    def split(self, data):
+        return data[:self.fmt.header_size], data[self.fmt.header_size:]
+
+    def build(self, header, payload, sync=True):
+        """ Join a header and payload, updating the length byte if sync """
+
+        if sync and self.fmt.length_offset is not None and \
+                len(header) > self.fmt.length_offset:
+            header = bytearray(header)
+            header[self.fmt.length_offset] = min(len(payload), 0xff)
+            header = bytes(header)
+        return header + payload
+
+    def shrink_length(self, data):
+        """ Find the shortest payload prefix, with a matching length byte
+
+        A parallel k-ary search: each round tests evenly spaced lengths
+        between the longest known failure and the shortest known success.
+        """
+
+        header, payload = self.split(data)
+        lo, hi = -1, len(payload)
+        while hi - lo > 1:
+            step = max(1, (hi - lo)//(self.jobs + 1))
+            lengths = list(range(lo + step, hi, step))[:self.jobs]
+            results = self.test([self.build(header, payload[:n])
+                for n in lengths])
+            passing = [n for n, ok in zip(lengths, results) if ok]
+            failing = [n for n, ok in zip(lengths, results) if not ok]
+            if passing:
+                hi = passing[0]
+                lo = max([lo] + [n for n in failing if n < hi])
+            else:
+                lo = lengths[-1]
+        if hi < len(payload):
+            return self.build(header, payload[:hi])
+        return data
+
+    def ddmin(self, data, sync=True):
+        """ Delta debugging over the payload
+
+        At granularity n the payload is cut into n chunks. Every chunk on its
+        own and every complement (the payload without one chunk) is tested in
+        one parallel batch, and the shortest passing candidate is kept.
+        """
+
+        header, payload = self.split(data)
+        n = 2
+        while len(payload) >= 2:
+            n = min(n, len(payload))
+            size = len(payload)/n
+            bounds = [(round(i*size), round((i + 1)*size)) for i in range(n)]
+            subsets = [payload[a:b] for a, b in bounds]
+            complements = [payload[:a] + payload[b:] for a, b in bounds]
+            candidates = subsets + complements if n > 2 else complements
+            results = self.test([self.build(header, p, sync)
+                for p in candidates])
+            passing = [p for p, ok in zip(candidates, results) if ok]
+            if passing:
+                best = min(passing, key=len)
+                n = 2 if best in subsets else max(n - 1, 2)
+                payload = best
+            elif n < len(payload):
+                n = min(2*n, len(payload))
+            else:
+                break
+        return self.build(header, payload, sync)
+
+    def canonicalise(self, data):
+        """ Replace payload bytes with CANONICAL_BYTE where possible
+
+        Halves of the payload are tried first, then smaller and smaller
+        blocks, so that the common case of a payload whose contents don't
+        matter takes only a few runs.
+        """
+
+        header, payload = self.split(data)
+        payload = bytearray(payload)
+        block = max(len(payload)//2, 1)
+        while payload:
+            starts = [i for i in range(0, len(payload), block)
+                    if any(c != CANONICAL_BYTE for c in payload[i:i + block])]
+            for j in range(0, len(starts), self.jobs):
+                batch = starts[j:j + self.jobs]
+                candidates = []
+                for i in batch:
+                    p = bytearray(payload)
+                    p[i:i + block] = bytes([CANONICAL_BYTE])*len(p[i:i + block])
+                    candidates.append(bytes(header) + bytes(p))
+                for i, ok in zip(batch, self.test(candidates)):
+                    if ok:
+                        end = min(i + block, len(payload))
+                        payload[i:end] = bytes([CANONICAL_BYTE])*(end - i)
+            if block == 1:
+                break
+            block //= 2
+        return bytes(header) + bytes(payload)
+
+    def minimise(self, data):
+        """ Run all passes until none of them makes progress
+
+        Returns
+        -------
+        The smallest input found in the bucket; data if no reduction works
+        """
+
+        if not data.startswith(self.fmt.magic):
+            # Not the format we were told about, so don't protect a header
+            self.fmt = FORMATS["raw"]
+        while True:
+            before = data
+            data = self.shrink_length(data)
+            data = self.ddmin(data, sync=True)
+            if self.fmt.length_offset is not None:
+                # The length byte may need to disagree with the payload
+                data = self.ddmin(data, sync=False)
+            if data == before:
+                break
+        return self.canonicalise(data)
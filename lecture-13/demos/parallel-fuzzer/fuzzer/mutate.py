@@ -0,0 +1,158 @@
+""" Byte-level mutations for mutational fuzzing
+
+A small version of AFL's havoc stage: each call applies a random stack of
+simple mutations (bit flips, interesting values, arithmetic, block deletion,
+insertion and duplication, and splicing with another input). Given a token
+dictionary (see dictionary.py), tokens are also inserted and overwritten
+into the input.
+"""
+
+import struct
+
+INTERESTING_8 = (0x80, 0xff, 0x00, 0x01, 0x10, 0x20, 0x40, 0x64, 0x7f, 0xc8)
+INTERESTING_16 = (0x8000, 0xff7f, 0x0080, 0x00ff, 0x0100, 0x0200, 0x03e8,
+        0x0400, 0x1000, 0x7fff)
+INTERESTING_32 = (0x80000000, 0xfa0000fa, 0xffff7fff, 0x00008000, 0x0000ffff,
+        0x00010000, 0x05ffff05, 0x7fffffff)
+
+MAX_INPUT_SIZE = 4096
+
+def flip_bit(rng, buf):
+    bit = rng.randrange(8*len(buf))
+    buf[bit >> 3] ^= 0x80 >> (bit & 7)
+
+def set_interesting(rng, buf):
+    width = rng.choice((1, 2, 4))
+    if len(buf) < width:
+        return
+    pos = rng.randrange(len(buf) - width + 1)
+    endian = rng.choice("<>")
+    if width == 1:
+        buf[pos] = rng.choice(INTERESTING_8)
+    elif width == 2:
+        buf[pos:pos + 2] = struct.pack(endian + "H",
+                rng.choice(INTERESTING_16))
+    else:
+        buf[pos:pos + 4] = struct.pack(endian + "I",
+                rng.choice(INTERESTING_32))
+
+def arith(rng, buf):
+    pos = rng.randrange(len(buf))
+    buf[pos] = (buf[pos] + rng.choice((-1, 1))*rng.randint(1, 35)) & 0xff
+
+def random_byte(rng, buf):
+    buf[rng.randrange(len(buf))] = rng.getrandbits(8)
+
+def delete_block(rng, buf):
+    if len(buf) < 2:
+        return
+    length = rng.randint(1, len(buf) - 1)
+    pos = rng.randrange(len(buf) - length + 1)
+    del buf[pos:pos + length]
+
+def insert_block(rng, buf):
+    pos = rng.randint(0, len(buf))
+    length = rng.randint(1, 64)
+    if rng.random() < 0.5 and len(buf) > 0:
+        # Duplicate existing bytes
+        src = rng.randrange(len(buf))
+        block = buf[src:src + length]
+    else:
+        block = bytes([rng.getrandbits(8)])*length
+    buf[pos:pos] = block
+
+def overwrite_block(rng, buf):
+    if len(buf) < 2:
+        return
+    length = rng.randint(1, len(buf) - 1)
+    src = rng.randrange(len(buf) - length + 1)
+    dst = rng.randrange(len(buf) - length + 1)
+    buf[dst:dst + length] = buf[src:src + length]
+
+MUTATORS = (flip_bit, set_interesting, arith, random_byte, delete_block,
+        insert_block, overwrite_block)
+
+# Share of stacked mutations that use a token when a dictionary is given
+TOKEN_PROBABILITY = 0.2
+
+def choose_token(rng, tokens):
+    """ Pick a token, favouring the start of the list
+
+    dictionary.extract lists the most specific tokens, such as memcmp
+    arguments, first.
+    """
+
+    return rng.choice(tokens[:rng.randint(1, len(tokens))])
+
+def _token_position(rng, buf):
+    # Formats usually start with their magic number, so favour the start
+    if rng.random() < 0.25:
+        return 0
+    return rng.randint(0, len(buf))
+
+def overwrite_token(rng, buf, tokens):
+    token = choose_token(rng, tokens)
+    pos = min(_token_position(rng, buf), max(len(buf) - len(token), 0))
+    buf[pos:pos + len(token)] = token
+
+def insert_token(rng, buf, tokens):
+    token = choose_token(rng, tokens)
+    pos = _token_position(rng, buf)
+    buf[pos:pos] = token
+
+TOKEN_MUTATORS = (overwrite_token, insert_token)
+
+def add_token(rng, data, tokens):
+    """ Insert or overwrite one dictionary token in data
+
+    Returns
+    -------
+    bytes
+    """
+
+    buf = bytearray(data)
+    rng.choice(TOKEN_MUTATORS)(rng, buf, tokens)
+    return bytes(buf[:MAX_INPUT_SIZE])
+
+def splice(rng, a, b):
+    """ Join a head of a with a tail of b """
+
+    if len(a) < 2 or len(b) < 2:
+        return bytearray(a)
+    return bytearray(a[:rng.randint(1, len(a) - 1)]
+            + b[rng.randint(1, len(b) - 1):])
+
+def havoc(rng, data, corpus=None, max_stack=16, tokens=None):
+    """ Apply a random stack of mutations to data
+
+    Parameters
+    ----------
+    rng : random.Random
+    data : bytes
+        Input to mutate
+    corpus : sequence of bytes, optional
+        Other inputs that may be spliced in
+    max_stack : int, optional
+        Largest number of mutations applied at once
+    tokens : list of bytes, optional
+        Dictionary of tokens to insert and overwrite
+
+    Returns
+    -------
+    bytes
+    """
+
+    if corpus and rng.random() < 0.1:
+        buf = splice(rng, data, rng.choice(corpus))
+    else:
+        buf = bytearray(data)
+    if not buf:
+        buf = bytearray(b"\x00")
+    for _ in range(1 << rng.randint(0, max_stack.bit_length() - 1)):
+        if tokens and rng.random() < TOKEN_PROBABILITY:
+            rng.choice(TOKEN_MUTATORS)(rng, buf, tokens)
+        else:
+            rng.choice(MUTATORS)(rng, buf)
+        if not buf:
+            buf = bytearray(b"\x00")
+    return bytes(buf[:MAX_INPUT_SIZE])
@@ -0,0 +1,327 @@
+""" Run fuzzing workers in parallel across all cores
+
+Each worker is a separate process with its own random seed, strategy, and
+executor. Workers count their executions in shared memory (see stats.py) and
+send only crashes to the parent over a queue, and all of them watch a shared
+stop event so that the campaign ends together. Workers also re-run each
+crashing input under ptrace to find its crash bucket (see triage.py), so that
+the parent only has to keep the smallest input per bucket.
+
+Every run has a timeout, calibrated from recent run times (see
+execute.AdaptiveTimeout). A run that exceeds it counts as a timeout and is
+repeated with the full hang threshold (options.timeout); only if that times
+out too is the input a hang, which is saved to hangs/ rather than crashes/.
+
+With options.sanitized, inputs that ran cleanly but did something new are
+run again in a sanitizer build of the target (see sanitizer.py), and
+sanitizer reports are treated as crashes. New means new coverage for the
+coverage strategy, and otherwise a new behaviour (see behaviour), which is
+the most a plain build shows from outside; with options.sanitize_all every
+input is checked.
+
+Worker i seeds its strategy with options.seed + i. Every crash and hang is
+logged with that seed and its iteration number in cases.log, and the options
+in campaign.json (see cases.py), so that replay.py can regenerate it.
+"""
+
+import collections
+import hashlib
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import time
+
+from cases import CaseLog, save_options
+from coverage import CoverageMap
+from execute import AdaptiveTimeout, Limits, crashed, make_executor
+from sanitizer import SanitizedTarget, to_crash_info
+from stats import Stats, StatusLine
+from strategies import STRATEGIES
+from triage import CrashBuckets, locate
+
+CrashReport = collections.namedtuple("CrashReport",
+        ["worker", "iteration", "signal", "data", "info"])
+
+# How often the parent checks on workers, and rewrites fuzzer_stats, in
+# seconds
+POLL_INTERVAL = 0.25
+STATS_FILE_INTERVAL = 5.0
+
+def behaviour(result):
+    """ Coarse outcome of a run, for deciding whether it did something new
+
+    The exit status and the bit length of the output's length, like AFL's
+    hit-count buckets: most programs echo some of their input, so the exact
+    output length is nearly unique per input and would send almost every run
+    through the sanitizer build.
+    """
+
+    return (result.returncode,
+            None if result.output is None else len(result.output).bit_length())
+
+def worker_main(worker_id, seed, options, stop, results, stats):
+    """ Fuzzing loop for a single worker process
+
+    Parameters
+    ----------
+    worker_id : int
+    seed : int
+        Seed for this worker's random number generator
+    options : argparse.Namespace
+        Campaign options
+    stop : multiprocessing.Event
+        Set by any process to end the campaign
+    results : multiprocessing.Queue
+        Receives ("crash", CrashReport), ("hang", worker_id, iteration, data),
+        and a final ("done", worker_id) message
+    stats : stats.Stats
+        Shared counters; this worker updates only its own row
+    """
+
+    rng = random.Random(seed)
+    mine = stats.worker(worker_id)
+    strategy_class = STRATEGIES[options.strategy]
+    coverage = None
+    env = None
+    if strategy_class.uses_coverage:
+        coverage = CoverageMap()
+        env = coverage.env()
+    strategy = strategy_class(rng, options, coverage)
+    sanitized = None
+    behaviours = set()
+    if getattr(options, "sanitized", None):
+        sanitized = SanitizedTarget([options.sanitized] + options.target[1:],
+                limits=Limits(cpu=options.cpu))
+    executor = make_executor(options, env,
+            capture=sanitized is not None and coverage is None)
+    timeout = AdaptiveTimeout(options.timeout)
+    iters = 0
+    try:
+        while not stop.is_set():
+            iters += 1
+            if strategy_class.replayable:
+                data = strategy.input_at(seed, iters)
+            else:
+                data = strategy.next_input()
+            mine.record(data)
+            if coverage is not None:
+                coverage.clear()
+            t_run = time.perf_counter()
+            result = executor.run(data, timeout.value)
+            if result.hang and timeout.value < timeout.maximum:
+                # Slow, but not necessarily hung
+                mine.add("timeouts")
+                if coverage is not None:
+                    coverage.clear()
+                t_run = time.perf_counter()
+                result = executor.run(data, timeout.maximum)
+            if result.hang:
+                mine.add("hangs")
+                results.put(("hang", worker_id, iters, data))
+            else:
+                timeout.observe(time.perf_counter() - t_run)
+            new = strategy.report(data, result)
+            mine.set("execs", iters)
+
+            if sanitized is not None and not result.hang and \
+                    not crashed(result):
+                if coverage is None:
+                    key = behaviour(result)
+                    new = key not in behaviours
+                    behaviours.add(key)
+                if new or options.sanitize_all:
+                    mine.add("sanitized")
+                    san_result, report = sanitized.check(data, options.timeout)
+                    if report is not None and crashed(san_result):
+                        mine.add("crashes")
+                        sig = -san_result.returncode
+                        results.put(("crash", CrashReport(worker_id, iters,
+                            sig, data, to_crash_info(report, sig))))
+
+            if crashed(result):
+                mine.add("crashes")
+                info = locate(options.target, data, -result.returncode, env,
+                        options.timeout)
+                results.put(("crash", CrashReport(worker_id, iters,
+                    -result.returncode, data, info)))
+            if coverage is not None:
+                mine.set("corpus", len(strategy.corpus))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        executor.close()
+        if sanitized is not None:
+            sanitized.close()
+        if coverage is not None:
+            coverage.close()
+        results.put(("done", worker_id))
+
+class Campaign:
+    """ Parent-side view of a parallel fuzzing campaign
+
+    Parameters
+    ----------
+    options : argparse.Namespace
+        Must provide target, strategy, executor, jobs, seed, duration,
+        max_crashes, and output
+    quiet : bool, optional
+        Don't print the status line or crash messages
+    """
+
+    def __init__(self, options, quiet=False):
+        self.options = options
+        self.crashes = []
+        self.t_start = None
+        # Seconds from the start of the campaign to the first crash
+        self.first_crash = None
+        self.buckets = CrashBuckets(os.path.join(options.output, "crashes"))
+        self.stats = Stats(options.jobs, options.output, {
+            "command_line": " ".join(sys.argv),
+            "target": " ".join(options.target),
+            "strategy": options.strategy,
+            "seed": options.seed,
+        })
+        self.display = StatusLine(quiet=quiet)
+        self.cases = CaseLog(options.output)
+        save_options(options, options.output)
+
+    def save_crash(self, report):
+        """ Add a crash to its bucket
+
+        Returns
+        -------
+        True if it was the first or smallest crash in its bucket
+        """
+
+        added = self.buckets.add(report.info, report.data,
+                f"worker {report.worker} iteration {report.iteration}")
+        self.stats.buckets = len(self.buckets.counts)
+        return added
+
+    def status(self):
+        return self.stats.status()
+
+    def save_hang(self, worker, iteration, data):
+        """ Save a hanging input to hangs/, named by its SHA-1 """
+
+        self.cases.add("hang", worker, self.options.seed + worker, iteration,
+                data)
+        directory = os.path.join(self.options.output, "hangs")
+        os.makedirs(directory, exist_ok=True)
+        name = os.path.join(directory, hashlib.sha1(data).hexdigest())
+        if not os.path.exists(name):
+            with open(name, "wb") as f:
+                f.write(data)
+            self.display.message(f"Hang from worker {worker} at iteration "
+                    f"{iteration}, {len(data)} bytes saved to {name}")
+
+    def handle_crash(self, report):
+        """ Save a crash and report it if it is new
+
+        Returns
+        -------
+        True if the crash limit has been reached
+        """
+
+        options = self.options
+        if self.first_crash is None:
+            self.first_crash = time.monotonic() - self.t_start
+        self.crashes.append(report)
+        # Sanitizer findings are logged by sanitizer, so that replay.py
+        # knows to run them through the sanitizer build
+        kind = "crash" if report.info.report is None \
+                else report.info.report.tool
+        self.cases.add(kind, report.worker, options.seed + report.worker,
+                report.iteration, report.data)
+        new_bucket = report.info.bucket not in self.buckets.counts
+        if self.save_crash(report):
+            kind = "New crash" if new_bucket else "Smaller reproducer"
+            name = os.path.join(self.buckets.directory, report.info.bucket)
+            self.display.message(f"{kind} from worker {report.worker} at "
+                    f"iteration {report.iteration}: signal {report.signal} "
+                    f"at {report.info.pc}, {len(report.data)} bytes saved "
+                    f"to {name}")
+        return bool(options.max_crashes) and \
+                len(self.crashes) >= options.max_crashes
+
+    def run(self):
+        """ Run workers until the duration, crash limit, or Ctrl-C
+
+        Returns
+        -------
+        list of CrashReport, in the order they were received
+        """
+
+        options = self.options
+        ctx = multiprocessing.get_context("fork")
+        stop = ctx.Event()
+        results = ctx.Queue()
+        workers = [ctx.Process(target=worker_main,
+            args=(i, options.seed + i, options, stop, results, self.stats))
+            for i in range(options.jobs)]
+
+        self.t_start = t_start = time.monotonic()
+        for w in workers:
+            w.start()
+
+        done = set()
+        last_stats_file = 0.0
+        try:
+            while len(done) < len(workers):
+                if options.duration and \
+                        time.monotonic() - t_start >= options.duration:
+                    stop.set()
+                try:
+                    msg = results.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    msg = None
+                    # A worker that died without saying so, for example from
+                    # an exception in its executor
+                    for i, w in enumerate(workers):
+                        if i not in done and w.exitcode not in (None, 0):
+                            self.display.message(f"Worker {i} died with exit "
+                                    f"code {w.exitcode}; its recent inputs "
+                                    f"will be in {options.output}/recent")
+                            done.add(i)
+
+                if msg is None:
+                    pass
+                elif msg[0] == "crash":
+                    if self.handle_crash(msg[1]):
+                        stop.set()
+                elif msg[0] == "hang":
+                    self.save_hang(*msg[1:])
+                elif msg[0] == "done":
+                    done.add(msg[1])
+
+                self.display.update(self.status())
+                if time.monotonic() - last_stats_file >= STATS_FILE_INTERVAL:
+                    self.stats.write_stats_file()
+                    last_stats_file = time.monotonic()
+        except KeyboardInterrupt:
+            # Workers see the SIGINT as well and wind down on their own
+            stop.set()
+            while len(done) < len(workers):
+                try:
+                    msg = results.get(timeout=POLL_INTERVAL)
+                except queue.Empty:
+                    # A worker that has exited will never send "done",
+                    # whether it finished or died
+                    done.update(i for i, w in enumerate(workers)
+                            if w.exitcode is not None)
+                    continue
+                if msg[0] == "crash":
+                    self.handle_crash(msg[1])
+                elif msg[0] == "hang":
+                    self.save_hang(*msg[1:])
+                elif msg[0] == "done":
+                    done.add(msg[1])
+        for w in workers:
+            w.join()
+        self.display.finish()
+        self.stats.write_stats_file()
+        for i in range(len(workers)):
+            self.stats.dump_recent(i)
+        return self.crashes
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+""" Regenerate and re-run test cases from their seed and iteration number
+
+Cases can be picked from a campaign's cases.log by their number in the log,
+or given directly as a worker seed and a range of iterations. Each case costs
+one call to the strategy to regenerate the input and one execution of the
+target, however long the campaign ran before finding it. Only strategies
+that don't depend on coverage feedback can be replayed (see
+strategies.Replayable); crashes from the coverage strategy are in crashes/.
+Cases that a sanitizer build found are run through the campaign's sanitizer
+build (its --sanitized option), since the plain build runs them cleanly.
+
+Example usages of this script are:
+
+List the cases logged by a campaign:
+    ./replay.py -c findings
+
+Re-run cases 0 and 3 to 5, checking that they still crash, and save the
+inputs:
+    ./replay.py -c findings -n 0,3-5 -o replayed
+
+Re-run iterations 48000 to 48213 of worker 2 of a campaign with base seed 7:
+    ./replay.py -c findings --seed 9 --iteration 48000-48213
+
+Reproduce a crash reported by random-fuzzer/fuzzer.py, without a campaign:
+    ./replay.py -s random --seed 1234 --iteration 5678 \
+        ../../random-fuzzer/program/program
+"""
+
+import argparse
+import hashlib
+import os
+import random
+
+from cases import CaseLog, load_options
+from execute import EXECUTORS, crashed, make_executor
+from grammar import SPECS
+from sanitizer import TOOLS, SanitizedTarget
+from strategies import STRATEGIES
+from triage import locate
+
+def parse_ranges(text):
+    """ Expand "1,4-6" to [1, 4, 5, 6] """
+
+    values = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        values += range(int(first), int(last or first) + 1)
+    return values
+
+def describe(result):
+    if result.hang:
+        return "hang"
+    if crashed(result):
+        return f"signal {-result.returncode}"
+    return f"exit code {result.returncode}"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Replay fuzzing test cases')
+    parser.add_argument('target', nargs='*',
+            help='Target program and its arguments (defaults to the '
+            'campaign\'s)')
+    parser.add_argument('-c', '--campaign', default=None, type=str,
+            help='Output directory of a fuzzer.py campaign')
+    parser.add_argument('-n', '--cases', default=None, type=str,
+            help='Cases to replay by number in cases.log, e.g. 0,3-5')
+    parser.add_argument('--seed', default=None, type=int,
+            help='Worker seed to regenerate inputs from')
+    parser.add_argument('--iteration', default=None, type=str,
+            help='Iteration or range of iterations to regenerate, e.g. '
+            '100-200')
+    parser.add_argument('-s', '--strategy', default=None,
+            choices=sorted(STRATEGIES),
+            help='Strategy, if there is no campaign')
+    parser.add_argument('-g', '--grammar', default='generational',
+            choices=sorted(SPECS), help='Input grammar, if there is no '
+            'campaign')
+    parser.add_argument('-x', '--dictionary', action='append', default=[],
+            help='Token dictionary, if there is no campaign (repeatable)')
+    parser.add_argument('--auto-dict', action='store_true',
+            help='Extract a token dictionary, if there is no campaign')
+    parser.add_argument('-e', '--executor', default='memfd',
+            choices=EXECUTORS, help='How to run the target')
+    parser.add_argument('--harness', default=None, type=str,
+            help='Target built as a harness library by ../harness/Makefile, '
+            'for the inprocess executors (defaults to the campaign\'s)')
+    parser.add_argument('-t', '--timeout', default=None, type=float,
+            help='Seconds to allow each run (defaults to the campaign\'s '
+            'hang threshold, or 1)')
+    parser.add_argument('-b', '--bucket', action='store_true',
+            help='Find the crash bucket of each crash (one more run)')
+    parser.add_argument('-o', '--output', default=None, type=str,
+            help='Save the regenerated inputs in this directory')
+    options = parser.parse_args()
+
+    if options.campaign:
+        campaign = load_options(options.campaign)
+        campaign.executor = options.executor
+        if options.harness:
+            campaign.harness = options.harness
+        if options.target:
+            campaign.target = options.target
+        if options.timeout is not None:
+            campaign.timeout = options.timeout
+    else:
+        if not options.strategy or not options.target:
+            parser.error("without --campaign, a strategy and a target are "
+                    "needed")
+        campaign = argparse.Namespace(**vars(options))
+        campaign.timeout = options.timeout or 1.0
+    if campaign.executor.startswith("inprocess") and \
+            not getattr(campaign, "harness", None):
+        parser.error(f"the {campaign.executor} executor needs --harness")
+    if not STRATEGIES[campaign.strategy].replayable:
+        parser.error(f"inputs from the {campaign.strategy} strategy depend on "
+                f"coverage feedback and can't be regenerated")
+    if options.iteration is not None and options.seed is None:
+        parser.error("--iteration needs --seed")
+    return options, campaign
+
+if __name__ == "__main__":
+    options, campaign = parse_args()
+
+    logged = CaseLog(options.campaign).read() if options.campaign else []
+    # (label, seed, iteration, expected SHA-1, sanitizer build or not)
+    selected = []
+    if options.cases is not None:
+        for n in parse_ranges(options.cases):
+            if not 0 <= n < len(logged):
+                raise SystemExit(f"There is no case {n}; {len(logged)} are "
+                        f"logged")
+            case = logged[n]
+            sanitizer = case.kind in TOOLS.values()
+            if sanitizer and not getattr(campaign, "sanitized", None):
+                raise SystemExit(f"Case {n} was found by {case.kind}, but "
+                        f"the campaign has no sanitizer build")
+            selected.append((f"case {n} ({case.kind}, worker {case.worker})",
+                case.seed, case.iteration, case.sha1, sanitizer))
+    if options.iteration is not None:
+        for i in parse_ranges(options.iteration):
+            selected.append((f"seed {options.seed}", options.seed, i, None,
+                False))
+    if not selected:
+        for n, case in enumerate(logged):
+            print(f"{n}: {case.kind} from worker {case.worker}, seed "
+                    f"{case.seed} iteration {case.iteration}, sha1 {case.sha1}")
+        if not logged:
+            print("No cases to replay")
+        raise SystemExit
+
+    strategy = STRATEGIES[campaign.strategy](random.Random(), campaign)
+    executor = make_executor(campaign)
+    sanitized = None
+    if any(s[4] for s in selected):
+        sanitized = SanitizedTarget([campaign.sanitized] +
+                campaign.target[1:])
+    if options.output:
+        os.makedirs(options.output, exist_ok=True)
+    mismatches = 0
+    try:
+        for label, seed, iteration, sha1, sanitizer in selected:
+            data = strategy.input_at(seed, iteration)
+            digest = hashlib.sha1(data).hexdigest()
+            report = None
+            if sanitizer:
+                result, report = sanitized.check(data, campaign.timeout)
+            else:
+                result = executor.run(data, campaign.timeout)
+            line = (f"{label} iteration {iteration}: {len(data)} bytes, "
+                    f"{describe(result)}")
+            if report is not None:
+                line += f", {report.tool} {report.bug_type}"
+                if report.frames:
+                    line += f" in {report.frames[0]}"
+            elif options.bucket and crashed(result):
+                info = locate(campaign.target, data, -result.returncode,
+                        timeout=campaign.timeout)
+                line += f", bucket {info.bucket}"
+            if sha1 is not None and sha1 != digest:
+                mismatches += 1
+                line += ", INPUT DIFFERS FROM THE LOGGED ONE"
+            if options.output:
+                name = os.path.join(options.output, f"{seed}-{iteration}")
+                with open(name, "wb") as f:
+                    f.write(data)
+                line += f", saved to {name}"
+            print(line)
+    finally:
+        executor.close()
+        if sanitized is not None:
+            sanitized.close()
+    if mismatches:
+        print(f"{mismatches} inputs differ from the log; the strategy or its "
+                f"options have changed since the campaign")
@@ -0,0 +1,193 @@
+""" Sanitizer builds of the target and their error reports
+
+A memory error only shows up as a crash if it happens to corrupt something
+the program uses afterwards. The generational-fuzzer program, for example,
+reads up to 255 bytes into a 224-byte buffer, and most of those overflows
+exit cleanly. A build with AddressSanitizer (make program_asan) or
+UndefinedBehaviorSanitizer (make program_ubsan) aborts at the first bad
+access instead and describes it on stderr:
+
+    ==1234==ERROR: AddressSanitizer: stack-buffer-overflow on address ...
+    WRITE of size 240 at 0x7ffd... thread T0
+        #0 0x7f... in __interceptor_fread ...
+        #1 0x55... in main program.c:24
+    SUMMARY: AddressSanitizer: stack-buffer-overflow ...
+
+parse_report turns that into a SanitizerReport, and to_crash_info into a
+triage.CrashInfo bucketed by sanitizer, bug type, and the source locations
+of the innermost frames outside the sanitizer runtime, which are stable in a
+way that return addresses after an overflow are not.
+
+Sanitized builds run several times slower than plain ones, so the fuzzers
+run them only on inputs that did something new in the plain build (see
+parallel.py). They also reserve terabytes of address space for shadow
+memory, so they run without the memory limit.
+"""
+
+import collections
+import hashlib
+import re
+
+from execute import Limits, MemfdExecutor, crashed
+from triage import BUCKET_FRAMES, CrashInfo
+
+# Abort on the first error so that the exit status shows it, and report
+# leaks never, since they are found at exit by a slow scan
+SANITIZER_ENV = {
+    "ASAN_OPTIONS": "abort_on_error=1:detect_leaks=0:symbolize=1:"
+            "allocator_may_return_null=1",
+    "UBSAN_OPTIONS": "abort_on_error=1:halt_on_error=1:print_stacktrace=1:"
+            "report_error_type=1:print_summary=1",
+}
+
+TOOLS = {
+    "AddressSanitizer": "asan",
+    "UndefinedBehaviorSanitizer": "ubsan",
+    "LeakSanitizer": "lsan",
+    "MemorySanitizer": "msan",
+}
+
+SanitizerReport = collections.namedtuple("SanitizerReport",
+        ["tool", "bug_type", "access", "size", "pc", "frames"])
+SanitizerReport.__doc__ = """ The essentials of a sanitizer error report
+
+tool : string
+    asan, ubsan, lsan, or msan
+bug_type : string
+    Such as stack-buffer-overflow or signed-integer-overflow
+access : string or None
+    READ or WRITE, for memory errors
+size : int or None
+    Size of the access in bytes
+pc : int or None
+    Address of the faulting instruction
+frames : tuple of strings
+    "function file:line" for each frame outside the sanitizer runtime, or
+    "function module+offset" where there is no line information
+"""
+
+_ERROR = re.compile(r"ERROR: (\w+Sanitizer): ([\w-]+)(?: on .*?)?"
+        r"(?: at pc 0x([0-9a-f]+)| \(pc 0x([0-9a-f]+))?")
+_UBSAN_ERROR = re.compile(r"^\S+:\d+:\d+: runtime error: (?:([a-z ]+):)?")
+_SUMMARY = re.compile(r"SUMMARY: (\w+Sanitizer): ([\w-]+)")
+_ACCESS = re.compile(r"^(READ|WRITE) of size (\d+)")
+_SEGV_ACCESS = re.compile(r"caused by a (READ|WRITE) memory access")
+_FRAME = re.compile(r"^\s*#(\d+) 0x([0-9a-f]+)(?: in (\S+))? *(.*)$")
+
+def _runtime_frame(function, location):
+    return (function or "").startswith(("__interceptor_", "__asan",
+        "__ubsan", "__sanitizer")) or \
+            "libsanitizer" in location or "compiler-rt" in location
+
+def parse_report(output):
+    """ Parse the first sanitizer report in a run's output
+
+    Parameters
+    ----------
+    output : bytes
+        The target's stderr; stdout may echo the input, which could then
+        contain anything, including text that looks like a report
+
+    Returns
+    -------
+    SanitizerReport, or None if there isn't one
+    """
+
+    tool = bug_type = access = size = pc = None
+    frames = []
+    # Only the first stack trace is the error's; later ones are where memory
+    # was allocated or freed
+    stack = "before"
+    for line in output.decode(errors="replace").splitlines():
+        m = _ERROR.search(line)
+        if m and tool is None:
+            tool, bug_type = m.group(1), m.group(2)
+            address = m.group(3) or m.group(4)
+            pc = int(address, 16) if address else None
+            continue
+        m = _UBSAN_ERROR.match(line)
+        if m and tool is None:
+            tool = "UndefinedBehaviorSanitizer"
+            # Such as "signed integer overflow: 1 + 2147483647 cannot..."
+            if m.group(1):
+                bug_type = m.group(1).strip().replace(" ", "-")
+            continue
+        m = _SUMMARY.search(line)
+        if m:
+            tool = tool or m.group(1)
+            # UBSan's summary names the check, where the error line may not
+            if m.group(2) != "undefined-behavior":
+                bug_type = m.group(2)
+            break
+        if tool is None:
+            continue
+        m = _ACCESS.match(line) or _SEGV_ACCESS.search(line)
+        if m:
+            access = m.group(1)
+            size = int(m.group(2)) if m.re is _ACCESS else None
+            continue
+        m = _FRAME.match(line)
+        if m and stack != "after":
+            stack = "in"
+            function, location = m.group(3), m.group(4).strip("() ")
+            if pc is None:
+                pc = int(m.group(2), 16)
+            if not _runtime_frame(function, location):
+                location = re.sub(r"^.*/", "", location)
+                frames.append(f"{function or '??'} {location}")
+        elif stack == "in" and not line.strip():
+            stack = "after"
+    if tool is None:
+        return None
+    return SanitizerReport(TOOLS.get(tool, tool), bug_type or "unknown",
+            access, size, pc, tuple(frames))
+
+def to_crash_info(report, sig):
+    """ Make a triage.CrashInfo, with its bucket, from a SanitizerReport
+
+    Frames with source lines are used for the bucket when there are any,
+    since the others are in the C library or the startup code, and which of
+    those appear depends on how the program was linked.
+    """
+
+    source = [f for f in report.frames if re.search(r":\d+$", f)]
+    frames = tuple(source or report.frames)[:BUCKET_FRAMES]
+    h = hashlib.sha1(repr(frames).encode()).hexdigest()
+    pc = frames[0] if frames else \
+            ("unknown" if report.pc is None else hex(report.pc))
+    return CrashInfo(sig, pc, frames,
+            f"{report.tool}-{report.bug_type}-{h[:12]}", report)
+
+class SanitizedTarget:
+    """ Runs a sanitizer build of the target and parses its reports
+
+    Parameters
+    ----------
+    argv : list of strings
+        Sanitized program and its arguments
+    env : dict, optional
+        Extra environment variables for the target
+    limits : execute.Limits, optional
+        Only the CPU limit is applied
+    """
+
+    def __init__(self, argv, env=None, limits=Limits()):
+        self.executor = MemfdExecutor(argv, dict(SANITIZER_ENV, **(env or {})),
+                Limits(cpu=limits.cpu), capture="stderr")
+
+    def check(self, data, timeout=None):
+        """ Run data through the sanitized build
+
+        Returns
+        -------
+        (ExecResult, SanitizerReport or None); there is a report only if
+        the run was ended by a signal, which abort_on_error makes SIGABRT
+        """
+
+        result = self.executor.run(data, timeout)
+        if not crashed(result):
+            return result, None
+        return result, parse_report(result.output)
+
+    def close(self):
+        self.executor.close()
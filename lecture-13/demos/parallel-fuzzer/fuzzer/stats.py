@@ -0,0 +1,235 @@
+""" Shared-memory statistics for a parallel fuzzing campaign
+
+Every worker owns one row of counters in a shared array and updates it with
+plain stores, so counting costs no locks, system calls, or messages. The
+parent sums the rows whenever it refreshes the status display or writes the
+fuzzer_stats file, which uses the same "key : value" layout as afl-fuzz's so
+that the same scripts can read both.
+
+Each worker also keeps its most recent inputs in a small shared ring buffer.
+Nothing is printed per input; the ring is dumped to disk at the end of the
+campaign, or if a worker dies, for post-mortem inspection.
+"""
+
+import ctypes
+import multiprocessing
+import os
+import sys
+import time
+
+FIELDS = ("execs", "crashes", "hangs", "timeouts", "corpus", "sanitized")
+_INDEX = {name: i for i, name in enumerate(FIELDS)}
+
+RING_SLOTS = 16
+RING_SLOT_SIZE = 4096
+
+class WorkerStats:
+    """ A worker's view of its own row of counters and its ring buffer """
+
+    def __init__(self, counters, ring, lengths, next_slots, worker_id):
+        self.counters = counters
+        self.row = worker_id*len(FIELDS)
+        self.ring = ring
+        self.lengths = lengths
+        self.next_slots = next_slots
+        self.worker_id = worker_id
+        self.base = worker_id*RING_SLOTS
+        self.next_slot = 0
+
+    def set(self, name, value):
+        self.counters[self.row + _INDEX[name]] = value
+
+    def add(self, name, value=1):
+        self.counters[self.row + _INDEX[name]] += value
+
+    def record(self, data):
+        """ Keep data in the ring of recent inputs """
+
+        slot = self.base + self.next_slot
+        n = min(len(data), RING_SLOT_SIZE)
+        ctypes.memmove(ctypes.addressof(self.ring) + slot*RING_SLOT_SIZE,
+                data, n)
+        self.lengths[slot] = n
+        self.next_slot = (self.next_slot + 1) % RING_SLOTS
+        # Lets the parent find the oldest slot
+        self.next_slots[self.worker_id] = self.next_slot
+
+class Stats:
+    """ Campaign-wide counters and the fuzzer_stats file
+
+    Create this in the parent before starting workers (with the fork start
+    method) and give each worker worker(i).
+
+    Parameters
+    ----------
+    jobs : int
+        Number of workers
+    output : string
+        Directory for fuzzer_stats and the dumped rings
+    info : dict, optional
+        Extra fixed entries for fuzzer_stats, such as the command line
+    """
+
+    def __init__(self, jobs, output, info=None):
+        self.jobs = jobs
+        self.output = output
+        self.info = info or {}
+        self.counters = multiprocessing.RawArray(ctypes.c_uint64,
+                jobs*len(FIELDS))
+        self.ring = multiprocessing.RawArray(ctypes.c_char,
+                jobs*RING_SLOTS*RING_SLOT_SIZE)
+        self.lengths = multiprocessing.RawArray(ctypes.c_int32,
+                jobs*RING_SLOTS)
+        for i in range(jobs*RING_SLOTS):
+            self.lengths[i] = -1
+        self.next_slots = multiprocessing.RawArray(ctypes.c_int32, jobs)
+        self.t_start = time.time()
+        self.buckets = 0
+
+    def worker(self, worker_id):
+        return WorkerStats(self.counters, self.ring, self.lengths,
+                self.next_slots, worker_id)
+
+    def get(self, name, worker_id=None):
+        """ Counter value for one worker, or summed over all of them """
+
+        i = _INDEX[name]
+        if worker_id is not None:
+            return self.counters[worker_id*len(FIELDS) + i]
+        return sum(self.counters[w*len(FIELDS) + i]
+                for w in range(self.jobs))
+
+    def totals(self):
+        return {name: self.get(name) for name in FIELDS}
+
+    def status(self):
+        t = self.totals()
+        delta_t = time.time() - self.t_start
+        return (f"{t['execs']} execs, {t['execs']/max(delta_t, 1e-9):.0f} "
+                f"exec/s, {t['crashes']} crashes in {self.buckets} buckets, "
+                f"{t['hangs']} hangs, {t['timeouts']} timeouts, "
+                f"corpus {t['corpus']}, {delta_t:.0f} s")
+
+    def write_stats_file(self):
+        """ Atomically rewrite <output>/fuzzer_stats """
+
+        t = self.totals()
+        now = time.time()
+        entries = {
+            "start_time": int(self.t_start),
+            "last_update": int(now),
+            "fuzzer_pid": os.getpid(),
+            "run_time": int(now - self.t_start),
+            "execs_done": t["execs"],
+            "execs_per_sec": f"{t['execs']/max(now - self.t_start, 1e-9):.2f}",
+            "corpus_count": t["corpus"],
+            "total_crashes": t["crashes"],
+            "unique_crashes": self.buckets,
+            "saved_hangs": t["hangs"],
+            "total_tmout": t["timeouts"],
+            "sanitized_execs": t["sanitized"],
+            "jobs": self.jobs,
+        }
+        entries.update(self.info)
+        os.makedirs(self.output, exist_ok=True)
+        name = os.path.join(self.output, "fuzzer_stats")
+        with open(name + ".tmp", "w") as f:
+            for key, value in entries.items():
+                f.write(f"{key:<18}: {value}\n")
+        os.replace(name + ".tmp", name)
+
+    def recent_inputs(self, worker_id):
+        """ Return a worker's recent inputs, oldest first
+
+        Only meaningful once the worker has stopped.
+        """
+
+        inputs = []
+        base = worker_id*RING_SLOTS
+        oldest = self.next_slots[worker_id]
+        for k in range(RING_SLOTS):
+            slot = base + (oldest + k) % RING_SLOTS
+            n = self.lengths[slot]
+            if n >= 0:
+                start = slot*RING_SLOT_SIZE
+                inputs.append(bytes(self.ring[start:start + n]))
+        return inputs
+
+    def dump_recent(self, worker_id):
+        """ Write a worker's ring to <output>/recent/wNN-K
+
+        Returns
+        -------
+        Number of inputs written
+        """
+
+        directory = os.path.join(self.output, "recent")
+        os.makedirs(directory, exist_ok=True)
+        inputs = self.recent_inputs(worker_id)
+        for k, data in enumerate(inputs):
+            with open(os.path.join(directory, f"w{worker_id:02d}-{k:02d}"),
+                    "wb") as f:
+                f.write(data)
+        return len(inputs)
+
+def read_stats_file(path):
+    """ Read a fuzzer_stats file written by Stats or by afl-fuzz
+
+    Returns
+    -------
+    dict of strings, empty if the file doesn't exist yet
+    """
+
+    entries = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, sep, value = line.partition(":")
+                if sep:
+                    entries[key.strip()] = value.strip()
+    except FileNotFoundError:
+        pass
+    return entries
+
+class StatusLine:
+    """ Single status line, redrawn in place on a terminal
+
+    When stdout isn't a terminal, one line is printed per interval instead,
+    so that logs stay readable. With quiet set nothing is printed.
+    """
+
+    def __init__(self, interval=0.25, log_interval=5.0, quiet=False):
+        self.quiet = quiet
+        self.tty = sys.stdout.isatty()
+        self.interval = interval if self.tty else log_interval
+        self.last = 0.0
+        self.width = 0
+
+    def update(self, text, force=False):
+        now = time.monotonic()
+        if self.quiet or (not force and now - self.last < self.interval):
+            return
+        self.last = now
+        if self.tty:
+            sys.stdout.write("\r" + text.ljust(self.width))
+            self.width = len(text)
+            sys.stdout.flush()
+        else:
+            print(text)
+
+    def message(self, text):
+        """ Print a line without it being overwritten by the status """
+
+        if self.quiet:
+            return
+        if self.tty and self.width:
+            sys.stdout.write("\r" + " "*self.width + "\r")
+            self.width = 0
+        print(text)
+
+    def finish(self):
+        """ Leave the last status on screen and move to a new line """
+
+        if self.tty and self.width:
+            print()
+            self.width = 0
@@ -0,0 +1,236 @@
+""" Input generation strategies for the parallel fuzzer
+
+Each strategy is a class constructed with a random.Random instance, the
+campaign options, and a coverage.CoverageMap (None unless the class sets
+uses_coverage). The fuzzing loop calls next_input() for every test case, and
+report() with the outcome of running it, which feedback-driven strategies can
+use; they return True from it when the input did something new.
+
+Strategies that don't depend on feedback derive from Replayable, and the
+fuzzing loop calls input_at(seed, iteration) instead of next_input(). Their
+random number generator is reseeded from the seed and iteration number, so
+any test case can be regenerated from those two numbers alone (see
+replay.py).
+"""
+
+import os
+import shutil
+import struct
+
+import dictionary
+from corpus import Corpus
+from grammar import SPECS
+from mutate import INTERESTING_8, add_token, choose_token, havoc
+
+def load_tokens(options):
+    """ Token dictionary from options.dictionary files and options.auto_dict
+
+    options.dictionary is a list of afl-fuzz -x files, and options.auto_dict
+    asks for tokens to be extracted from the target binary.
+    """
+
+    tokens = []
+    for path in getattr(options, "dictionary", None) or []:
+        tokens += dictionary.load(path)
+    if getattr(options, "auto_dict", False):
+        target = shutil.which(options.target[0]) or options.target[0]
+        tokens += dictionary.extract(target)
+    return list(dict.fromkeys(tokens))
+
+def case_seed(seed, iteration):
+    """ Seed for the random number generator at an iteration
+
+    random-fuzzer/fuzzer.py and generational-fuzzer/fuzzer.py seed with the
+    same value, so their crashes can be replayed with the same strategy.
+    """
+
+    return (seed << 32) + iteration
+
+class Replayable:
+    """ Mixin for strategies whose inputs depend only on the random numbers
+
+    The generator is reseeded with case_seed at the first iteration of every
+    block of BLOCK_SIZE, and a test case is regenerated by reseeding at the
+    start of its block and generating up to it. Reseeding costs a few
+    microseconds, which strategies that produce inputs in batches avoid by
+    using blocks of their batch size.
+    """
+
+    replayable = True
+    BLOCK_SIZE = 1
+    _position = None
+
+    def input_at(self, seed, iteration):
+        offset = iteration % self.BLOCK_SIZE
+        if offset == 0 or self._position != (seed, iteration):
+            self.rng.seed(case_seed(seed, iteration - offset))
+            self.reset()
+            for _ in range(offset):
+                self.next_input()
+        self._position = (seed, iteration + 1)
+        return self.next_input()
+
+    def reset(self):
+        """ Discard state carried over from previous inputs """
+
+class RandomStrategy(Replayable):
+    """ Random bytestring of random length, as in random-fuzzer/fuzzer.py
+
+    With a token dictionary, half of the inputs start with a token, since
+    that is where formats put their magic numbers, and a quarter get one
+    somewhere else. A magic number is often followed by a length, so half of
+    the time the byte after a leading token is set to the length of the rest
+    of the input or to one of mutate.INTERESTING_8, rather than left random.
+    """
+
+    uses_coverage = False
+
+    def __init__(self, rng, options, coverage=None):
+        self.rng = rng
+        self.tokens = load_tokens(options)
+
+    def next_input(self):
+        numbytes = self.rng.randint(1, 256)
+        data = self.rng.randbytes(numbytes)
+        if self.tokens:
+            r = self.rng.random()
+            if r < 0.5:
+                token = choose_token(self.rng, self.tokens)
+                data = token + data[len(token):]
+                if len(data) > len(token) and self.rng.random() < 0.5:
+                    data = self.set_length(data, len(token))
+            elif r < 0.75:
+                data = add_token(self.rng, data, self.tokens)
+        return data
+
+    def set_length(self, data, pos):
+        """ Make the byte at pos a plausible length field """
+
+        if self.rng.random() < 0.5:
+            length = min(len(data) - pos - 1, 0xff)
+        else:
+            length = self.rng.choice(INTERESTING_8)
+        return data[:pos] + bytes([length]) + data[pos + 1:]
+
+    def report(self, data, result):
+        pass
+
+class GenerationalStrategy(Replayable):
+    """ Magic number, length byte, and payload, as in
+    generational-fuzzer/fuzzer.py """
+
+    uses_coverage = False
+
+    def __init__(self, rng, options, coverage=None):
+        self.rng = rng
+
+    def next_input(self):
+        # First field is magic number
+        randominput = b"MAGC"
+
+        # Second field is length
+        numbytes = self.rng.randint(1, 255)
+        randominput += struct.pack("B", numbytes)
+
+        # Now add the random bytes
+        randominput += self.rng.randbytes(numbytes)
+        return randominput
+
+    def report(self, data, result):
+        pass
+
+def load_seeds(directory):
+    """ Read every file in directory as a seed input """
+
+    seeds = []
+    for name in sorted(os.listdir(directory)):
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            with open(path, "rb") as f:
+                seeds.append(f.read())
+    return seeds
+
+class CoverageStrategy:
+    """ Coverage-guided mutation of a corpus, for AFL-instrumented targets
+
+    Inputs that reach edges or hit counts not seen before are added to the
+    corpus, and new inputs are havoc mutations of corpus entries, using the
+    token dictionary if there is one. Seeds are taken from options.input if
+    it is set. If options.corpus is set, the
+    corpus is stored in that directory, and inputs already there are run as
+    seeds too.
+    """
+
+    uses_coverage = True
+    replayable = False
+
+    def __init__(self, rng, options, coverage=None):
+        if coverage is None:
+            raise ValueError("The coverage strategy needs a coverage map")
+        self.rng = rng
+        self.coverage = coverage
+        self.tokens = load_tokens(options)
+        self.corpus = Corpus(getattr(options, "corpus", None))
+        seeds = list(self.corpus)
+        if getattr(options, "input", None):
+            seeds += load_seeds(options.input)
+        # Same default seed as afl-demo/afl-fuzz/fuzz.sh
+        self.pending = seeds or [b"abcdefg\n"]
+        self.seeded = False
+
+    def next_input(self):
+        # Run the seeds unmodified first, so they establish the baseline
+        if self.pending:
+            return self.pending.pop(0)
+        if not self.seeded:
+            self.seeded = True
+            if not self.corpus:
+                raise RuntimeError("No seed input reached any instrumented "
+                        "code; is the target built with afl-gcc?")
+        parent = self.rng.choice(self.corpus)
+        return havoc(self.rng, parent, self.corpus, tokens=self.tokens)
+
+    def report(self, data, result):
+        if result.hang:
+            # The trace of a killed run is incomplete, as in afl-fuzz
+            return
+        classified = self.coverage.classify()
+        if self.coverage.has_new_bits(classified):
+            self.corpus.add(data, self.coverage.signature(classified))
+            return True
+        return False
+
+class GrammarStrategy(Replayable):
+    """ Inputs generated from a grammar in grammar.SPECS
+
+    The grammar is chosen by options.grammar. Inputs are generated
+    BATCH_SIZE at a time, from a generator reseeded once per batch.
+    """
+
+    uses_coverage = False
+    BATCH_SIZE = 1024
+    BLOCK_SIZE = BATCH_SIZE
+
+    def __init__(self, rng, options, coverage=None):
+        self.rng = rng
+        self.grammar = SPECS[getattr(options, "grammar", "generational")]
+        self.batch = []
+
+    def next_input(self):
+        if not self.batch:
+            self.batch = self.grammar.generate_batch(self.rng, self.BATCH_SIZE)
+            self.batch.reverse()
+        return self.batch.pop()
+
+    def reset(self):
+        self.batch = []
+
+    def report(self, data, result):
+        pass
+
+STRATEGIES = {
+    "random": RandomStrategy,
+    "generational": GenerationalStrategy,
+    "coverage": CoverageStrategy,
+    "grammar": GrammarStrategy,
+}
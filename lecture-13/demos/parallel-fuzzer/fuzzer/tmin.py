@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+""" Minimise crashing inputs while keeping their crash bucket
+
+Each input is first run under ptrace to find its bucket (see triage.py), then
+shrunk by minimise.Minimiser with candidates run in parallel.
+
+Example usages of this script are:
+
+Minimise one crash from the generational-fuzzer program on 4 cores:
+    ./tmin.py -f generational -j 4 -i findings/crashes/stack-e01e895680b1 \
+        -o min ../../generational-fuzzer/program/program
+
+Minimise every bucket left by a fuzzing campaign:
+    ./tmin.py -f random -i findings/crashes -o min ../../random-fuzzer/program/program
+"""
+
+import argparse
+import os
+
+from minimise import FORMATS, Minimiser
+from triage import triage
+
+def input_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                # Skip the .txt descriptions that CrashBuckets writes
+                if not name.startswith(".") and not name.endswith(".txt") \
+                        and os.path.isfile(os.path.join(path, name)):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Crash test-case minimiser')
+    parser.add_argument('target', nargs='+',
+            help='Target program and its arguments')
+    parser.add_argument('-i', '--input', action='append', required=True,
+            help='Crashing input, or directory of them (repeatable)')
+    parser.add_argument('-o', '--output', default='minimised', type=str,
+            help='Directory for the minimised inputs')
+    parser.add_argument('-f', '--format', default='raw',
+            choices=sorted(FORMATS), help='Input format of the target')
+    parser.add_argument('-j', '--jobs', default=os.cpu_count(), type=int,
+            help='Number of worker processes')
+    parser.add_argument('-t', '--timeout', default=5.0, type=float,
+            help='Seconds to allow each run')
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    for path in input_files(args.input):
+        with open(path, "rb") as f:
+            data = f.read()
+        info = triage(args.target, data, timeout=args.timeout)
+        if info is None:
+            print(f"{path}: does not crash the target, skipping")
+            continue
+
+        minimiser = Minimiser(args.target, info.bucket, FORMATS[args.format],
+                args.jobs, timeout=args.timeout)
+        try:
+            result = minimiser.minimise(data)
+        finally:
+            minimiser.close()
+
+        name = os.path.join(args.output, os.path.basename(path))
+        with open(name, "wb") as f:
+            f.write(result)
+        print(f"{path}: {len(data)} -> {len(result)} bytes in "
+                f"{minimiser.execs} runs, bucket {info.bucket}, saved to {name}")
+        print(f"    {result.hex()}")
@@ -0,0 +1,285 @@
+""" Crash triage: group crashing inputs by where they crash
+
+Each crashing input is run again under ptrace. When the target stops with a
+fatal signal, the faulting PC and the return addresses found on the stack are
+read out of the stopped process and written as module+offset, which is
+stable across ASLR. The innermost few return addresses make up the crash's
+bucket, and only the smallest input in each bucket is kept.
+
+The PC and signal are recorded but not bucketed on, because a smashed return
+address sends the target to a PC, and often a signal, that depends on the
+input: the lecture programs' one overflow would otherwise fill dozens of
+buckets. For the same reason, only distinct return addresses into the target
+executable itself are used when there are any, since a partial overwrite of
+a return address into libc leaves an input-dependent libc address on the
+stack. Crashes with no readable stack are bucketed by signal and PC.
+
+Stack frames are found by scanning the top of the stack for words that point
+into executable mappings rather than by following frame pointers, since the
+targets are built without them and a stack overflow usually corrupts the
+saved frame pointer anyway. The scan can pick up stale return addresses, but
+it does so in the same way for every input that takes the same path.
+
+Only Linux on x86-64 is supported.
+"""
+
+import collections
+import ctypes
+import ctypes.util
+import hashlib
+import os
+import signal
+import time
+
+# Number of stack words searched for return addresses, and the number of
+# return addresses that go into the bucket
+STACK_WORDS = 512
+BUCKET_FRAMES = 5
+
+FATAL_SIGNALS = (signal.SIGSEGV, signal.SIGBUS, signal.SIGILL, signal.SIGFPE,
+        signal.SIGABRT, signal.SIGTRAP, signal.SIGSYS)
+
+PTRACE_TRACEME = 0
+PTRACE_CONT = 7
+PTRACE_GETREGS = 12
+
+ADDR_NO_RANDOMIZE = 0x0040000
+
+_libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+_libc.ptrace.restype = ctypes.c_long
+_libc.ptrace.argtypes = (ctypes.c_long, ctypes.c_int, ctypes.c_void_p,
+        ctypes.c_void_p)
+_libc.personality.restype = ctypes.c_int
+_libc.personality.argtypes = (ctypes.c_ulong,)
+
+class UserRegs(ctypes.Structure):
+    """ struct user_regs_struct from sys/user.h """
+
+    _fields_ = [(name, ctypes.c_ulonglong) for name in (
+        "r15", "r14", "r13", "r12", "rbp", "rbx", "r11", "r10", "r9", "r8",
+        "rax", "rcx", "rdx", "rsi", "rdi", "orig_rax", "rip", "cs", "eflags",
+        "rsp", "ss", "fs_base", "gs_base", "ds", "es", "fs", "gs")]
+
+# report is the sanitizer.SanitizerReport for crashes in a sanitizer build
+CrashInfo = collections.namedtuple("CrashInfo",
+        ["signal", "pc", "frames", "bucket", "report"], defaults=(None,))
+
+class TriageError(RuntimeError):
+    pass
+
+def read_maps(pid):
+    """ Return the executable mappings of a process
+
+    Returns
+    -------
+    list of (start, end, offset, name) tuples
+    """
+
+    maps = []
+    with open(f"/proc/{pid}/maps") as f:
+        for line in f:
+            fields = line.split(maxsplit=5)
+            if "x" not in fields[1]:
+                continue
+            start, end = (int(x, 16) for x in fields[0].split("-"))
+            name = os.path.basename(fields[5].strip()) if len(fields) > 5 \
+                    else "[anon]"
+            maps.append((start, end, int(fields[2], 16), name))
+    return maps
+
+def symbolise(address, maps):
+    """ Return address as module+offset, or None if it isn't executable """
+
+    for start, end, offset, name in maps:
+        if start <= address < end:
+            return f"{name}+{address - start + offset:#x}"
+    return None
+
+def bucket_id(sig, pc, frames):
+    if frames:
+        h = hashlib.sha1(repr(frames).encode()).hexdigest()
+        return f"stack-{h[:12]}"
+    h = hashlib.sha1(repr(pc).encode()).hexdigest()
+    return f"sig{sig}-{h[:12]}"
+
+def inspect(pid, sig):
+    """ Build a CrashInfo from a process stopped by ptrace """
+
+    regs = UserRegs()
+    if _libc.ptrace(PTRACE_GETREGS, pid, None, ctypes.byref(regs)) < 0:
+        raise TriageError(os.strerror(ctypes.get_errno()))
+    maps = read_maps(pid)
+
+    # A PC outside any executable mapping is a jump to an address that came
+    # from the input, so its exact value would split the bucket
+    pc = symbolise(regs.rip, maps) or "wild"
+
+    exe = os.path.basename(os.readlink(f"/proc/{pid}/exe"))
+    frames = []
+    with open(f"/proc/{pid}/mem", "rb", buffering=0) as mem:
+        try:
+            mem.seek(regs.rsp)
+            stack = mem.read(8*STACK_WORDS)
+        except OSError:
+            stack = b""
+    for i in range(0, len(stack) - 7, 8):
+        frame = symbolise(int.from_bytes(stack[i:i + 8], "little"), maps)
+        if frame is not None:
+            frames.append(frame)
+    own = [frame for frame in frames if frame.startswith(exe + "+")]
+    # How far down the stack a wild jump leaves the stack pointer varies, so
+    # the same stale address can appear a different number of times
+    frames = tuple(dict.fromkeys(own or frames))[:BUCKET_FRAMES]
+    return CrashInfo(sig, pc, frames, bucket_id(sig, pc, frames))
+
+def triage(argv, data, env=None, timeout=5.0):
+    """ Run argv on data under ptrace and locate the crash
+
+    Parameters
+    ----------
+    argv : list of strings
+    data : bytes
+        Test case, given to the target on stdin
+    env : dict, optional
+        Extra environment variables for the target
+    timeout : float, optional
+        Seconds to wait for the target before giving up
+
+    Returns
+    -------
+    CrashInfo, or None if the input didn't crash the target this time
+    """
+
+    env = dict(os.environ, **(env or {}))
+    # A memfd keeps large inputs from blocking on a pipe
+    stdin = os.memfd_create("triage")
+    os.write(stdin, data)
+    os.lseek(stdin, 0, os.SEEK_SET)
+    devnull = os.open(os.devnull, os.O_WRONLY)
+
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os.dup2(stdin, 0)
+            os.dup2(devnull, 1)
+            os.dup2(devnull, 2)
+            # Fixed addresses make a wild PC repeatable between runs
+            _libc.personality(ADDR_NO_RANDOMIZE)
+            _libc.ptrace(PTRACE_TRACEME, 0, None, None)
+            os.execvpe(argv[0], argv, env)
+        finally:
+            os._exit(127)
+    os.close(stdin)
+    os.close(devnull)
+
+    deadline = time.monotonic() + timeout
+    try:
+        # The first stop is the SIGTRAP from execve
+        first = True
+        while True:
+            wpid, status = os.waitpid(pid, os.WNOHANG)
+            if wpid == 0:
+                if time.monotonic() > deadline:
+                    return None
+                time.sleep(0.001)
+                continue
+            if not os.WIFSTOPPED(status):
+                # Exited, or killed by a signal that ptrace can't stop
+                if os.WIFSIGNALED(status):
+                    sig = os.WTERMSIG(status)
+                    return CrashInfo(sig, "unknown", (),
+                            bucket_id(sig, "unknown", ()))
+                return None
+            sig = os.WSTOPSIG(status)
+            if first and sig == signal.SIGTRAP:
+                first = False
+                sig = 0
+            elif sig in FATAL_SIGNALS:
+                return inspect(pid, sig)
+            # Pass any other signal on to the target
+            _libc.ptrace(PTRACE_CONT, pid, None, sig)
+    finally:
+        try:
+            os.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+        except (ProcessLookupError, ChildProcessError):
+            pass
+
+def locate(argv, data, sig, env=None, timeout=5.0):
+    """ Like triage(), but always returns a CrashInfo
+
+    If the crash doesn't reproduce under ptrace, or ptrace isn't permitted,
+    the crash is bucketed by its original signal alone.
+    """
+
+    try:
+        info = triage(argv, data, env, timeout)
+    except (OSError, TriageError):
+        info = None
+    if info is None:
+        info = CrashInfo(sig, "unknown", (), bucket_id(sig, "unknown", ()))
+    return info
+
+class CrashBuckets:
+    """ Smallest reproducer and crash count for every bucket
+
+    Each bucket's reproducer is written to <directory>/<bucket>, and a
+    description of the crash to <directory>/<bucket>.txt.
+
+    Parameters
+    ----------
+    directory : string
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.counts = collections.Counter()
+        self.info = {}
+        self.sizes = {}
+
+    def add(self, info, data, source=None):
+        """ Record a crash
+
+        Parameters
+        ----------
+        info : CrashInfo
+        data : bytes
+        source : string, optional
+            Where the input came from, for the description
+
+        Returns
+        -------
+        True if the crash is in a new bucket or is a smaller reproducer
+        """
+
+        self.counts[info.bucket] += 1
+        if info.bucket in self.sizes and len(data) >= self.sizes[info.bucket]:
+            return False
+        self.info[info.bucket] = info
+        self.sizes[info.bucket] = len(data)
+        os.makedirs(self.directory, exist_ok=True)
+        name = os.path.join(self.directory, info.bucket)
+        with open(name, "wb") as f:
+            f.write(data)
+        with open(name + ".txt", "w") as f:
+            f.write(f"signal {info.signal} "
+                    f"({signal.Signals(info.signal).name})\n")
+            f.write(f"pc {info.pc}\n")
+            for frame in info.frames:
+                f.write(f"frame {frame}\n")
+            if info.report is not None:
+                r = info.report
+                f.write(f"sanitizer {r.tool} {r.bug_type}\n")
+                if r.access is not None:
+                    f.write(f"access {r.access} of size {r.size}\n")
+            f.write(f"size {len(data)}\n")
+            if source is not None:
+                f.write(f"source {source}\n")
+        return True
+
+    def summary(self):
+        """ Return a line per bucket, most frequent first """
+
+        return [f"{bucket}: {count} crashes, smallest {self.sizes[bucket]} "
+                f"bytes, pc {self.info[bucket].pc}"
+                for bucket, count in self.counts.most_common()]
@@ -0,0 +1,76 @@
+/*
+ * In-process harness for the lecture-13 demo programs
+ *
+ * Each program.c is compiled into a shared object together with this file,
+ * with main renamed to target_main and exit to harness_exit (see the
+ * Makefile). harness_run then runs one test case as a function call: the
+ * input is put behind stdin with fmemopen, target_main is called, and a call
+ * to exit is turned into a return by longjmp. The fuzzer loads the library
+ * into a persistent server process with ctypes (see ../fuzzer/inprocess.py),
+ * so a test case costs neither exec nor, unless isolation is asked for,
+ * fork.
+ *
+ * The programs' output goes wherever the process's stdout and stderr point;
+ * the server sends them to /dev/null.
+ */
+
+#define _GNU_SOURCE
+
+#include <setjmp.h>
+#include <stddef.h>
+#include <stdio.h>
+#include <sys/types.h>
+#include <unistd.h>
+
+int target_main(int argc, char **argv);
+
+static jmp_buf exit_jump;
+static int exit_status;
+
+// Stands in for exit() in the target
+void harness_exit(int status)
+{
+	exit_status = status;
+	longjmp(exit_jump, 1);
+}
+
+// Run the target on one input and return its exit status
+int harness_run(const char *data, size_t size)
+{
+	static char *argv[] = {"program", NULL};
+	FILE *saved_stdin = stdin;
+	FILE *input;
+
+	// fmemopen rejects an empty buffer in older versions of glibc
+	if (size > 0) {
+		input = fmemopen((void *)data, size, "r");
+	} else {
+		input = fopen("/dev/null", "r");
+	}
+	if (!input) {
+		return -1;
+	}
+
+	stdin = input;
+	if (setjmp(exit_jump) == 0) {
+		exit_status = target_main(1, argv);
+	}
+	// The target may have buffered output that exit() would have flushed
+	fflush(stdout);
+	fflush(stderr);
+	stdin = saved_stdin;
+	fclose(input);
+	return exit_status & 0xff;
+}
+
+// Run the target on one input in a child process and return its pid. Used
+// for isolation, since forking here skips the work Python does around fork
+pid_t harness_fork_run(const char *data, size_t size)
+{
+	pid_t pid = fork();
+
+	if (pid == 0) {
+		_exit(harness_run(data, size));
+	}
+	return pid;
+}